@@ -20,6 +20,13 @@
 
     The program will also print the shape, dtype, min and max of the picture.
 
+    For many frames, give it a directory (or a recording of recorder.py) and it
+    runs headless: the bit-depth and saturation diagnostics of every frame
+    (.png, and .npy/.p12.npy/.idsz of frame_store, memory-mapped) are computed
+    by a pool of processes and written to a summary table, one row per frame.
+    The figures are only rendered with --plots.
+        $ python analyze_picture.py <directory> --summary summary.csv [--plots figures]
+
     Notice that the picture has 16 bits per channel and pixel (dtype=uint16).
     However, the camera only uses 12 bits per channel and pixel,
     the 4 least significant bits are always 0 and then the histogram is sparse.
@@ -28,18 +35,37 @@
 
 """
 
-import sys
+import argparse
+import csv
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
 import matplotlib.pyplot as plt
 import numpy as np
 import imageio.v2 as imageio
 
+from frame_stats import channel_histograms
+from frame_store import FORMATS, load_frame
+from metadata_log import read_log
+from recorder import INFO_FILE, load_recording
+
 # If you don't have the freeimage plugin (FORMAT ERROR), you can download it with:
 # imageio.plugins.freeimage.download()  # this should be done only once, then comment it again
 
+def load_picture(path):
+    """ Reads a PNG (keeping its 16 bits) or a frame saved by frame_store
+        (memory-mapped, if .npy).
+    """
+    if path.lower().endswith('.png'):
+        return imageio.imread(path, format='PNG-FI')  # if FORMAT ERROR -> check a couple of lines above
+    return load_frame(path)
+
+
 def analyze_picture(picture_path, squeeze=False, bit_depth=12):
 
     if isinstance(picture_path, str):
-        im = imageio.imread(picture_path, format='PNG-FI')  # if FORMAT ERROR -> check a couple of lines above
+        im = load_picture(picture_path)
     else:
         """ If the picture_path is not a string, 
             it is assumed that it is already a numpy array.
@@ -49,8 +75,7 @@ def analyze_picture(picture_path, squeeze=False, bit_depth=12):
     print(f"raw_im.shape = {im.shape} ; raw_im.dtype = {im.dtype} ; "
           f"raw_im.min() = {im.min()} ; raw_im.max() = {im.max()}")
     if im.ndim == 2:
-        im = np.repeat(im[:, :, np.newaxis], 3, axis=2)
-        print('The picture is grayscale, so it has been converted to RGB.')
+        print('The picture is grayscale, so it is shown in the three RGB channels.')
     elif im.shape[2] == 4:
         im = im[:, :, :3]
         print('The picture has an alpha channel, so it has been removed.')
@@ -64,26 +89,49 @@ def analyze_picture(picture_path, squeeze=False, bit_depth=12):
             just by dividing the image by 2**4=16.
         """
         squeeze_level = int(2**16 / 2**bit_depth)  # = 16  (bit_depth=12)
-        im = (im/squeeze_level).astype(np.uint16)
-        hist = lambda im: np.histogram(im, bins=np.arange(2**bit_depth))[0]
-    else:
-        hist = lambda im: np.histogram(im, bins=np.arange(2**raw_br))[0]
+        if np.issubdtype(im.dtype, np.integer):
+            im = (im // squeeze_level).astype(np.uint16)
+        else:
+            im = (im/squeeze_level).astype(np.uint16)
 
     print(f"im.shape = {im.shape} ; im.dtype = {im.dtype} ; "
           f"im.min() = {im.min()} ; im.max() = {im.max()}")
 
+    channels, hists = _channels(im, final_br)
+    plot_picture(channels, im, final_br, hists)
+    plt.show()
+
+def _channels(im, final_br):
+    """ Views of the R, G, B channels of im and their histograms. """
+    # Views of the R, G, B channels (the same one for grayscale pictures)
+    channels = [im] * 3 if im.ndim == 2 else [im[:, :, c] for c in range(3)]
+    # Histograms of the channels, in a single pass each (once for grayscale pictures)
+    if np.issubdtype(im.dtype, np.integer):
+        hists = list(channel_histograms(im, max(2**final_br, int(im.max()) + 1)))
+    else:
+        hists = [np.histogram(channel, bins=np.arange(2**final_br + 1))[0]
+                 for channel in channels[:1 if im.ndim == 2 else 3]]
+    if len(hists) == 1:
+        hists *= 3
+    return channels, hists
+
+
+def plot_picture(channels, im, final_br, hists):
+    """ Figure of analyze_picture(): the R, G, B channels, the picture and the
+        histograms of the channels. Returns it.
+    """
     fig, ax = plt.subplots(2, 3)
 
     ax[0, 0].set_title('Red channel')
-    r_plot = ax[0, 0].imshow(im[:, :, 0], vmin=0, vmax=2**final_br, cmap='Reds_r')
+    r_plot = ax[0, 0].imshow(channels[0], vmin=0, vmax=2**final_br, cmap='Reds_r')
     plt.colorbar(r_plot, ax=ax[0, 0])
 
     ax[0, 1].set_title('Green channel')
-    g_plot = ax[0, 1].imshow(im[:, :, 1], vmin=0, vmax=2**final_br, cmap='Greens_r')
+    g_plot = ax[0, 1].imshow(channels[1], vmin=0, vmax=2**final_br, cmap='Greens_r')
     plt.colorbar(g_plot, ax=ax[0, 1])
 
     ax[0, 2].set_title('Blue channel')
-    b_plot = ax[0, 2].imshow(im[:, :, 2], vmin=0, vmax=2**final_br, cmap='Blues_r')
+    b_plot = ax[0, 2].imshow(channels[2], vmin=0, vmax=2**final_br, cmap='Blues_r')
     plt.colorbar(b_plot, ax=ax[0, 2])
 
     ax[1, 0].set_title('Original picture')
@@ -95,18 +143,217 @@ def analyze_picture(picture_path, squeeze=False, bit_depth=12):
         axi.remove()
     axhist = fig.add_subplot(gs[1, 1:])
     axhist.set_title('Histograms (when not squeezed, check if it dense or sparse)')
-    axhist.plot(hist(im[:, :, 0]), 'x-r', label='Red channel')
-    axhist.plot(hist(im[:, :, 1]), '+-g', label='Green channel')
-    axhist.plot(hist(im[:, :, 2]), '.-b', label='Blue channel')
+    axhist.plot(hists[0], 'x-r', label='Red channel')
+    axhist.plot(hists[1], '+-g', label='Green channel')
+    axhist.plot(hists[2], '.-b', label='Blue channel')
     axhist.set_xlim([-1, 2**final_br+1])
     if final_br >= 10:
         axins = axhist.inset_axes([0.4, 0.6, 0.57, 0.37], xlim=(900, 990),
-                                  ylim=(0, (hist(im[:, :, 2])[900:990]).max()*1.1))
-        axins.plot(hist(im[:, :, 2]), '.b')
+                                  ylim=(0, hists[2][900:990].max()*1.1))
+        axins.plot(hists[2], '.b')
         axhist.indicate_inset_zoom(axins, edgecolor="black")
     axhist.legend()
+    return fig
 
-    plt.show()
+
+
+SUMMARY_COLUMNS = ("path", "frame", "dtype", "height", "width", "channels", "min", "max",
+                   "mean", "bits_used", "low_zero_bits", "effective_bits", "levels_used",
+                   "saturation", "saturated", "saturated_fraction", "ref_mean", "error")
+
+
+def picture_diagnostics(im, bit_depth=12):
+    """ Bit-depth usage and saturation of an integer picture, from a single
+        histogram (np.bincount) of all its channels:
+
+            bits_used: bits of the max value (16 for 12 bits shifted to the MSB).
+            low_zero_bits: least significant bits that are 0 in every pixel
+                           (4 for 12 bits shifted to the MSB: sparse histogram).
+            effective_bits: bits_used - low_zero_bits.
+            levels_used: distinct values.
+            saturated: pixels at the max value of bit_depth bits (aligned to the
+                       MSB if bits_used > bit_depth), or above.
+    """
+    if im.ndim == 3 and im.shape[2] == 4:
+        im = im[:, :, :3]
+    if not np.issubdtype(im.dtype, np.integer):
+        raise ValueError("Diagnostics of bit depth need integer pictures.")
+    levels = 2**(8 * im.dtype.itemsize) if im.dtype.itemsize <= 2 else int(im.max()) + 1
+    hist = channel_histograms(im, levels).sum(axis=0)
+    values = np.flatnonzero(hist)
+    count = int(hist.sum())
+    bits_used = int(values[-1]).bit_length()
+    combined = int(np.bitwise_or.reduce(values))
+    low_zero_bits = (combined & -combined).bit_length() - 1 if combined else 0
+    bit_depth = min(bit_depth, 8 * im.dtype.itemsize)
+    saturation = (2**bit_depth - 1) << max(bits_used - bit_depth, 0)
+    saturated = int(hist[saturation:].sum())
+    return {"dtype": im.dtype.name, "height": im.shape[0], "width": im.shape[1],
+            "channels": im.shape[2] if im.ndim == 3 else 1,
+            "min": int(values[0]), "max": int(values[-1]),
+            "mean": float(np.dot(hist[values].astype(np.float64), values) / count),
+            "bits_used": bits_used, "low_zero_bits": low_zero_bits,
+            "effective_bits": bits_used - low_zero_bits, "levels_used": len(values),
+            "saturation": saturation, "saturated": saturated,
+            "saturated_fraction": saturated / count}
+
+
+def _legacy_ref_means(json_path):
+    """ {file name: ref_mean} of the float32 frames in a .json of the old
+        labview.save(), which didn't store the ref_mean: it was 1, i.e. the
+        frames weren't normalized, only when the image had no ref_roi.
+    """
+    with open(json_path, encoding='utf-8') as json_file:
+        entries = json.load(json_file)
+    ref_means = {}
+    for name, metadata in entries.items():
+        if not isinstance(metadata, dict):
+            continue
+        if "path" in metadata:  # exported by metadata_log.compact()
+            if metadata.get("format", "float32") == "float32":
+                ref_means[metadata["path"]] = metadata.get("ref_mean", 1)
+        elif "ref_roi" not in metadata:
+            np_name = name.replace(".png", ".npy")  # as the old save() named it
+            ref_means[np_name if np_name.endswith(".npy") else np_name + ".npy"] = 1
+    return ref_means
+
+
+def _ref_means(directory):
+    """ {file name: ref_mean} of the float32 frames saved by labview.save() in
+        directory, from the .jsonl logs of their series or, for the frames
+        saved before them, from the .json of the old save().
+    """
+    ref_means = {}
+    names = os.listdir(directory)
+    for name in names:
+        if name.endswith(".json"):
+            try:
+                ref_means.update(_legacy_ref_means(os.path.join(directory, name)))
+            except (OSError, ValueError):
+                continue
+    for name in names:
+        if name.endswith(".jsonl"):
+            try:
+                entries = read_log(os.path.join(directory, name))
+            except (OSError, ValueError):
+                continue
+            for metadata in entries.values():
+                if metadata.get("format", "float32") == "float32" and "path" in metadata:
+                    ref_means[metadata["path"]] = metadata.get("ref_mean", 1)
+    return ref_means
+
+
+def find_frames(path, chunk_size=64):
+    """ Tasks to analyse every frame in path (a picture, a directory, searched
+        recursively, or a recording): (file, None, None, ref_mean) for pictures,
+        (recording, start, stop, None) for chunks of frames of recordings.
+    """
+    if os.path.isfile(path):
+        directory, name = os.path.split(path)
+        return [(path, None, None, _ref_means(directory or ".").get(name))]
+    tasks = []
+    for directory, subdirs, names in os.walk(path):
+        subdirs.sort()
+        if INFO_FILE in names:  # a recording: frames.npy and index.npy are not pictures
+            subdirs.clear()
+            count = len(load_recording(directory)[1])
+            tasks.extend((directory, start, min(start + chunk_size, count), None)
+                         for start in range(0, count, chunk_size))
+            continue
+        ref_means = None
+        for name in sorted(names):
+            if name.lower().endswith(('.png', '.npy', FORMATS["compressed"])):
+                if ref_means is None:
+                    ref_means = _ref_means(directory)
+                tasks.append((os.path.join(directory, name), None, None, ref_means.get(name)))
+    return tasks
+
+
+def _analyse_task(task, bit_depth=12, plot_dir=None):
+    """ Rows of the summary for a task of find_frames(). Run by the pool. """
+    path, start, stop, ref_mean = task
+    try:
+        if start is None:
+            pictures = [("", load_picture(path))]
+        else:
+            frames = load_recording(path)[0]
+            pictures = ((i, frames[i]) for i in range(start, stop))
+    except Exception as e:  # a broken file is a row, not the end of the batch
+        return [{"path": path, "frame": "" if start is None else start,
+                 "ref_mean": ref_mean, "error": f"{type(e).__name__}: {e}"}]
+    rows = []
+    for frame, im in pictures:
+        row = {"path": path, "frame": frame, "ref_mean": ref_mean}
+        try:
+            if not np.issubdtype(im.dtype, np.integer):
+                # normalized by labview.save(): back to the values captured
+                if ref_mean is None:
+                    raise ValueError("float picture without the ref_mean of its series")
+                im = np.rint(im * np.float32(ref_mean)).clip(0, 2**16 - 1).astype(np.uint16)
+            row.update(picture_diagnostics(im, bit_depth))
+        except Exception as e:
+            row["error"] = f"{type(e).__name__}: {e}"
+        rows.append(row)
+        if "error" in row:
+            continue
+        if plot_dir is not None:  # named after the picture, or the recording and frame
+            name = os.path.basename(os.path.normpath(path))
+            if frame != "":
+                name += f"_{frame:06d}"
+            if im.ndim == 3:
+                im = im[:, :, :3]
+            plt.switch_backend("Agg")
+            channels, hists = _channels(im, row["bits_used"])
+            fig = plot_picture(channels, im, row["bits_used"], hists)
+            fig.savefig(os.path.join(plot_dir, name + ".png"))
+            plt.close(fig)
+    return rows
+
+
+def write_summary(rows, path):
+    """ Writes the rows of analyze_frames() to path: a CSV table or, if path
+        ends in .parquet, a Parquet one (needs pandas and pyarrow).
+    """
+    if path.endswith(".parquet"):
+        try:
+            import pandas as pd
+        except ImportError:
+            raise ImportError("pandas is needed to write Parquet summaries. "
+                              "Use a .csv path instead.") from None
+        pd.DataFrame(rows, columns=SUMMARY_COLUMNS).to_parquet(path)
+        return
+    with open(path, 'w', newline='', encoding='utf-8') as summary_file:
+        writer = csv.DictWriter(summary_file, SUMMARY_COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def analyze_frames(path, summary_path=None, bit_depth=12, workers=None, plot_dir=None,
+                   chunk_size=64):
+    """ Headless diagnostics (see picture_diagnostics()) of every frame in path:
+        a picture, a directory of them (.png, .npy, .p12.npy, .idsz) or a
+        recording of recorder.py. The frames are analysed by workers processes
+        (os.cpu_count() by default, 1 to analyse them in this process).
+
+        summary_path: writes the table there too, see write_summary().
+        plot_dir: saves the figure of analyze_picture() of every frame there.
+
+        Returns the rows of the summary, one per frame, as dicts of SUMMARY_COLUMNS.
+        A frame that can't be read or analysed gets a row with just its error.
+    """
+    tasks = find_frames(path, chunk_size)
+    if plot_dir is not None:
+        os.makedirs(plot_dir, exist_ok=True)
+    if workers == 1 or len(tasks) < 2:
+        results = [_analyse_task(task, bit_depth, plot_dir) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_analyse_task, tasks, [bit_depth] * len(tasks),
+                                    [plot_dir] * len(tasks)))
+    rows = [row for task_rows in results for row in task_rows]
+    if summary_path is not None:
+        write_summary(rows, summary_path)
+    return rows
 
 if __name__ == '__main__':
     """ Usage: python analyze_picture.py <path_to_picture> [--squeeze]
@@ -114,14 +361,30 @@ if __name__ == '__main__':
         If --squeeze is specified, the picture is squeezed to 12 bit depth.
         
         Example: python analyze_picture.py my_picture.png --squeeze
+
+        With a directory (or a recording), or with --summary, it runs headless
+        over all the frames, see analyze_frames():
+
+        Example: python analyze_picture.py frames/ --summary summary.csv --workers 8
     """
+    parser = argparse.ArgumentParser(description="Bit depth and histograms of pictures.")
+    parser.add_argument("picture_path", nargs="?")
+    parser.add_argument("--squeeze", action="store_true",
+                        help="squeeze the picture to --bit-depth bits")
+    parser.add_argument("--bit-depth", type=int, default=12)
+    parser.add_argument("--summary", help="summary table of the frames (.csv or .parquet)")
+    parser.add_argument("--workers", type=int, help="processes (all the CPUs by default)")
+    parser.add_argument("--plots", help="directory to save the figure of every frame")
+    args = parser.parse_args()
 
-    squeeze = False
-    if len(sys.argv) > 1:
-        picture_path = sys.argv[1]
-        if '--squeeze' in sys.argv:
-            squeeze = True
-    else:
-        picture_path = input('Please enter the path of the picture: ')
+    picture_path = args.picture_path or input('Please enter the path of the picture: ')
 
-    analyze_picture(picture_path, squeeze=squeeze)
+    if os.path.isdir(picture_path) or args.summary or args.plots:
+        rows = analyze_frames(picture_path, args.summary or "summary.csv", args.bit_depth,
+                              args.workers, args.plots)
+        saturated = sum(1 for row in rows if row["saturated"])
+        sparse = sum(1 for row in rows if row["low_zero_bits"])
+        print(f"{len(rows)} frames: {saturated} with saturated pixels, {sparse} with "
+              f"sparse histograms. Summary in {args.summary or 'summary.csv'}")
+    else:
+        analyze_picture(picture_path, squeeze=args.squeeze, bit_depth=args.bit_depth)
@@ -0,0 +1,324 @@
+""" asyncio front-end of IDSinterface: nothing here blocks the event loop.
+
+    Every device streams on its own grabber thread (IDSinterface.start_streaming).
+    The grabber hands a copy of every frame to the loop, where it goes to the
+    bounded queue of each consumer. When a queue is full, a frame is dropped
+    according to its policy ('drop_oldest' or 'drop_newest'), so a slow
+    consumer loses frames but never stalls the acquisition. If the loop itself
+    stalls, the grabber stops handing frames over once it has as many in
+    flight as the largest queue. Control calls (setters, start, stop...) run
+    on a worker thread.
+
+    Usage:
+
+        from async_interface import AsyncIDSInterface
+
+        async def main():
+            cam = AsyncIDSInterface()
+            await cam.start(0, fps=100, exposure=5000)
+            async for frame in cam.frames(0, maxsize=4):
+                print(frame.frame_id, frame.image.mean())
+                await cam.set_gain(2, 0)
+            await cam.close()
+
+        asyncio.run(main())
+
+    Frames of several cameras are merged with cam.frames_from([0, 1]), which
+    yields (idx, frame) tuples in order of arrival.
+
+    Frames are copied and queued for a consumer until its FrameStream is
+    closed. Breaking out of the async for closes it, unless a reference to it
+    is kept: then use it in an async with block, or call its aclose().
+"""
+
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from interface import Frame, IDSinterface
+
+POLICIES = ("drop_oldest", "drop_newest")
+
+
+class AsyncIDSInterface(object):
+    """ Wraps an IDSinterface (a new one on the default backend if cameras is
+        None) for asyncio. Create it from a coroutine, or pass the loop.
+    """
+
+    def __init__(self, cameras=None, loop=None):
+        self.cameras = cameras or IDSinterface()
+        self._loop = loop or asyncio.get_running_loop()
+        # A single worker: IDSinterface is not meant to be driven from many threads
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="IDScontrol")
+        self._subscriptions = {}  # idx: list of _Subscription
+        self._sinks = {}  # idx: sink of the grabber thread
+        self._settings = {}  # idx: (exposure, gain) in effect, for the frames
+        # Frames handed to the loop and not delivered yet, and the ones dropped
+        # by the grabber because too many were, so a stalled loop can't pile them up
+        self._lock = threading.Lock()
+        self._pending = {}  # idx: frames
+        self._backlog_dropped = {}  # idx: frames
+
+    async def _run(self, func, *args, **kwargs):
+        """ Runs func(*args, **kwargs) on the control thread. """
+        return await self._loop.run_in_executor(self._executor,
+                                                functools.partial(func, *args, **kwargs))
+
+    async def select_device(self, idx=0, **kwargs):
+        return await self._run(self.cameras.select_device, idx, **kwargs)
+
+    async def set_pixel_format(self, bit_rate=8, colorness=None, idx=0):
+        return await self._run(self.cameras.set_pixel_format, bit_rate, colorness, idx)
+
+    async def start(self, idx=0, ring_size=16, select=True, **settings):
+        """ Selects device idx (unless select is False), applies the settings
+            (see IDSinterface.apply_settings()), and starts its acquisition and
+            its grabber thread. Returns the settings in effect.
+        """
+        def start():
+            if select:
+                self.cameras.select_device(idx)
+            applied = self.cameras.apply_settings(idx, **settings)
+            self.cameras.start_acquisition(idx)
+            self.cameras.start_streaming(idx, ring_size=ring_size)
+            return applied
+
+        applied = await self._run(start)
+        self.__update_settings(idx, applied)
+        sink = self._sinks[idx] = functools.partial(self.__on_frame, idx)
+        self._subscriptions.setdefault(idx, [])
+        self._pending[idx] = self._backlog_dropped[idx] = 0
+        await self._run(self.cameras.add_stream_sink, sink, idx,
+                        functools.partial(self.__on_stream_stopped, idx))
+        return applied
+
+    async def stop(self, idx=0):
+        """ Stops the grabber thread and the acquisition of device idx. The
+            consumers of its frames get StopAsyncIteration.
+        """
+        sink = self._sinks.pop(idx, None)
+        if sink is not None:
+            await self._run(self.cameras.remove_stream_sink, sink, idx)
+        await self._run(self.cameras.stop_acquisition, idx)
+        self.__close_consumers(idx)
+
+    def __close_consumers(self, idx):
+        """ Ends the frames of idx for its consumers. """
+        for subscription in self._subscriptions.pop(idx, []):
+            subscription.close()
+
+    def __on_stream_stopped(self, idx):
+        """ The streaming of idx stopped under us (e.g. stop_acquisition() on
+            self.cameras, or a failure of the grabber): no more frames will come.
+        """
+        def stopped():
+            self._sinks.pop(idx, None)
+            self.__close_consumers(idx)
+
+        try:
+            self._loop.call_soon_threadsafe(stopped)
+        except RuntimeError:  # the loop is closed
+            pass
+
+    async def close(self):
+        """ Stops all the devices and releases them. """
+        for idx in list(self._settings):  # every device started
+            if idx in self._sinks:
+                await self.stop(idx)
+            await self._run(self.cameras.release_device, idx)
+        self._settings.clear()
+        self._executor.shutdown()
+
+    async def apply_settings(self, idx=0, **settings):
+        """ IDSinterface.apply_settings(), without blocking the loop. """
+        applied = await self._run(self.cameras.apply_settings, idx, **settings)
+        self.__update_settings(idx, applied)
+        return applied
+
+    async def set_fps(self, fps, idx=0):
+        return (await self.apply_settings(idx, fps=fps))["fps"]
+
+    async def set_exposure_time(self, etime, idx=0):
+        return (await self.apply_settings(idx, exposure=etime))["exposure"]
+
+    async def set_gain(self, gain, idx=0):
+        return (await self.apply_settings(idx, gain=gain))["gain"]
+
+    async def get_settings(self, idx=0):
+        return await self._run(self.cameras.get_settings, idx)
+
+    def __update_settings(self, idx, settings):
+        self._settings[idx] = (settings["exposure"], settings["gain"])
+
+    def __on_frame(self, idx, frame, timestamp_ns, frame_id, host_time):
+        """ Sink run by the grabber thread of idx: copies the frame (the slot is
+            reused) and hands it to the loop, only if someone is listening.
+        """
+        subscriptions = self._subscriptions.get(idx)
+        if not subscriptions:
+            return
+        limit = max([subscription.queue.maxsize for subscription in subscriptions] + [1])
+        with self._lock:
+            if self._pending[idx] >= limit:  # the loop is not keeping up
+                self._backlog_dropped[idx] += 1
+                return
+            self._pending[idx] += 1
+        exposure, gain = self._settings.get(idx, (None, None))
+        item = (idx, Frame(frame.copy(), timestamp_ns, host_time, frame_id, exposure, gain))
+        try:
+            self._loop.call_soon_threadsafe(self.__deliver, item)
+        except RuntimeError:  # the loop is closed
+            pass
+
+    def __deliver(self, item):
+        with self._lock:
+            self._pending[item[0]] -= 1
+        for subscription in list(self._subscriptions.get(item[0], ())):
+            subscription.put(item)
+
+    def __subscribe(self, idxs, maxsize, policy):
+        subscription = _Subscription(maxsize, policy)
+        for idx in idxs:
+            if idx not in self._sinks:
+                raise RuntimeError(f"Device {idx} is not started. Call start({idx}) before.")
+        for idx in idxs:
+            self._subscriptions[idx].append(subscription)
+        return subscription
+
+    def __unsubscribe(self, idxs, subscription):
+        for idx in idxs:
+            if subscription in self._subscriptions.get(idx, ()):
+                self._subscriptions[idx].remove(subscription)
+
+    def frames(self, idx=0, maxsize=8, policy="drop_oldest"):
+        """ FrameStream over the frames of device idx (interface.Frame objects)
+            from now on, until stop(idx).
+
+            maxsize: frames kept waiting for this consumer.
+            policy: when the queue is full, 'drop_oldest' discards the oldest
+                    frame waiting (the consumer gets the most recent ones),
+                    'drop_newest' discards the new frame.
+        """
+        return self.frames_from((idx,), maxsize, policy, with_idx=False)
+
+    def frames_from(self, idxs=(0, 1), maxsize=16, policy="drop_oldest", with_idx=True):
+        """ Fan-in of the frames of several devices: FrameStream over (idx,
+            frame) in order of arrival, see frames(). It ends when all the
+            devices are stopped.
+        """
+        idxs = tuple(idxs)
+        subscription = self.__subscribe(idxs, maxsize, policy)
+        return FrameStream(subscription, len(idxs),
+                           functools.partial(self.__unsubscribe, idxs, subscription),
+                           with_idx)
+
+    async def next_frame(self, idx=0, timeout=None):
+        """ Waits for the next frame of device idx (or raises asyncio.TimeoutError). """
+        frames = self.frames(idx, maxsize=1)
+        try:
+            return await asyncio.wait_for(frames.__anext__(), timeout)
+        finally:
+            await frames.aclose()
+
+    def get_stats(self, idx=0):
+        """ IDSinterface.get_stats() plus, per consumer of idx, the frames
+            queued and dropped by its policy, and the frames the grabber dropped
+            because the loop had too many to hand out already (backlog_dropped).
+        """
+        stats = self.cameras.get_stats(idx)
+        stats["backlog_dropped"] = self._backlog_dropped.get(idx, 0)
+        stats["consumers"] = [subscription.stats()
+                              for subscription in self._subscriptions.get(idx, ())]
+        return stats
+
+
+class FrameStream(object):
+    """ Async iterator over the frames of a consumer. Its frames are queued
+        until it is closed: by the end of the frames, aclose(), the end of an
+        async with block, or as soon as it is dropped (e.g. by breaking out of
+        an async for over it).
+
+            async with cam.frames(0) as frames:  # closed on exit, even if kept
+                async for frame in frames:
+                    ...
+    """
+
+    def __init__(self, subscription, devices, unsubscribe, with_idx=True):
+        self.subscription = subscription
+        self._devices = devices
+        self._unsubscribe = unsubscribe
+        self._with_idx = with_idx
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while self._unsubscribe is not None:
+            item = await self.subscription.get()
+            if item is None:  # one of the devices stopped
+                if self.subscription.stopped >= self._devices:
+                    self.close()
+                continue
+            return item if self._with_idx else item[1]
+        raise StopAsyncIteration
+
+    def close(self):
+        """ Unsubscribes it: no more frames are queued for it. """
+        unsubscribe, self._unsubscribe = self._unsubscribe, None
+        if unsubscribe is not None:
+            unsubscribe()
+
+    async def aclose(self):
+        self.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+    def __del__(self):
+        self.close()
+
+
+class _Subscription(object):
+    """ Bounded queue of a consumer, filled on the loop thread. """
+
+    def __init__(self, maxsize=8, policy="drop_oldest"):
+        if policy not in POLICIES:
+            raise ValueError(f"{policy} : Policy not supported. Choose one valid: "
+                             f"{', '.join(POLICIES)}")
+        if maxsize < 1:
+            raise ValueError("The queue of frames needs at least 1 slot.")
+        self.policy = policy
+        self.queue = asyncio.Queue(maxsize)
+        self.delivered = 0
+        self.dropped = 0
+        self.stopped = 0  # devices stopped
+
+    def put(self, item):
+        if self.queue.full():
+            self.dropped += 1
+            if self.policy == "drop_newest":
+                return
+            self.queue.get_nowait()
+        self.queue.put_nowait(item)
+        self.delivered += 1
+
+    def close(self):
+        """ Tells the consumer that a device stopped (counted, so it is never
+            lost even if the None that wakes the consumer up is dropped).
+        """
+        self.stopped += 1
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(None)
+
+    async def get(self):
+        return await self.queue.get()
+
+    def stats(self):
+        return {"queued": self.queue.qsize(), "delivered": self.delivered,
+                "dropped": self.dropped, "policy": self.policy}
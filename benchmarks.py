@@ -0,0 +1,644 @@
+""" Throughput benchmarks of the acquisition and conversion pipeline.
+
+    They run headless and without any camera attached. The comparisons with
+    the IDS SDK are skipped when it is not installed.
+
+    Usage:
+
+        $ python benchmarks.py  # runs all the benchmarks
+        $ python benchmarks.py unpack  # runs just the named ones
+        $ python benchmarks.py --save-baseline  # benchmarks_baseline.json, on this machine
+        $ python benchmarks.py --check  # fails if slower than benchmarks_baseline.json
+        $ python benchmarks.py pipeline --save-baseline my_baseline.json
+        $ python benchmarks.py pipeline --check my_baseline.json
+
+    The times per operation (benchmarks returning {case: seconds}) can be stored
+    as a baseline. --check compares them against it, and exits with an error
+    when any case is slower than the baseline times the tolerance (1.5 by
+    default, --tolerance 1.2). Without names, --check runs the benchmarks in
+    the baseline.
+
+    benchmarks_baseline.json is the default baseline, kept out of git: timings
+    are only comparable on the same machine, so every machine takes its own.
+    Checked against a baseline of another machine (node, processor or CPUs),
+    the timings are only reported: there are no regressions.
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+import frame_store
+import packed_formats
+from interface import IDSinterface
+from preview import PreviewRenderer
+from calibration import Calibration
+from processing import CapturePipeline
+from recorder import Recorder
+from simulated_camera import SimulatedBackend
+
+try:
+    from ids_peak_ipl import ids_peak_ipl
+except ImportError:
+    ids_peak_ipl = None
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        "benchmarks_baseline.json")
+
+# Full resolution of an U3-368xXLE sensor
+WIDTH, HEIGHT = 2592, 1944
+
+
+def timeit(func, min_time=0.5, min_repeat=3):
+    """ Best time per call of func(), in seconds. """
+    best = float("inf")
+    total = 0
+    repeat = 0
+    while total < min_time or repeat < min_repeat:
+        t0 = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - t0
+        best = min(best, elapsed)
+        total += elapsed
+        repeat += 1
+    return best
+
+
+def report(name, seconds, pixels):
+    print(f"  {name:<40s} {seconds * 1e3:9.3f} ms  {pixels / seconds / 1e6:9.1f} Mpx/s")
+    return seconds
+
+
+def _ipl_converter(raw, pixel_format, outer_format, width, height):
+    """ Returns a function converting raw with IPL, or None if IPL is not available. """
+    if ids_peak_ipl is None:
+        return None
+    inner = getattr(ids_peak_ipl, "PixelFormatName_" + pixel_format)
+    outer = getattr(ids_peak_ipl, "PixelFormatName_" + outer_format)
+    image = ids_peak_ipl.Image.CreateFromSizeAndBuffer(inner, raw.ctypes.data,
+                                                       raw.nbytes, width, height)
+    return lambda: image.ConvertTo(outer)
+
+
+def bench_unpack(width=WIDTH, height=HEIGHT, threads=4):
+    """ NumPy unpackers vs IPL ConvertTo for every inner pixel format. """
+    print(f"Unpacking {width}x{height} frames:")
+    rng = np.random.default_rng(0)
+    fastest = {}
+    for pixel_format, outer_formats in [("Mono8", ["Mono8"]),
+                                        ("Mono10g40IDS", ["Mono10"]),
+                                        ("Mono12g24IDS", ["Mono12"]),
+                                        ("BayerGR8", ["RGB8"]),
+                                        ("BayerGR10g40IDS", ["RGB10"]),
+                                        ("BayerGR12g24IDS", ["RGB12"])]:
+        depth = packed_formats.bit_depth(pixel_format)
+        mosaic = rng.integers(0, 2 ** depth, (height, width), dtype=np.uint16)
+        raw = packed_formats.pack(mosaic, pixel_format)
+        out = np.empty((height, width), dtype=np.uint16)
+        colorness = "RGB" if packed_formats.is_bayer(pixel_format) else None
+
+        def run(name, func):
+            results[name] = report(name, timeit(func), width * height)
+
+        print(f" {pixel_format}")
+        results = {}
+        run("numpy unpack",
+            lambda: packed_formats.unpack(raw, pixel_format, width, height))
+        run("numpy unpack (in place)",
+            lambda: packed_formats.unpack(raw, pixel_format, width, height, out))
+        run("numpy decode",
+            lambda: packed_formats.decode(raw, pixel_format, width, height, colorness))
+        run(f"numpy decode ({threads} threads)",
+            lambda: packed_formats.decode(raw, pixel_format, width, height, colorness,
+                                          threads))
+        for outer_format in outer_formats:
+            convert = _ipl_converter(raw, pixel_format, outer_format, width, height)
+            if convert is None:
+                print(f"  {'IPL ConvertTo ' + outer_format:<40s} skipped (no IDS SDK)")
+                continue
+            run(f"IPL ConvertTo {outer_format}", convert)
+        # the unpack-only paths are not a full conversion for Bayer formats
+        candidates = {k: v for k, v in results.items()
+                      if colorness is None or "unpack" not in k}
+        fastest[pixel_format] = min(candidates, key=candidates.get)
+
+    print("Fastest full conversion per format:")
+    for pixel_format, name in fastest.items():
+        print(f"  {pixel_format:<20s} {name}")
+    return fastest
+
+
+def bench_allocations(frames=200, bit_rate=8):
+    """ Memory allocated per frame by capture() and capture_into() on a simulated
+        camera: the peak of transient allocations and the net growth. The bound
+        of capture_into() is asserted in tests/test_allocations.py.
+    """
+    print(f"Memory per frame over {frames} frames (Mono{bit_rate}, simulated camera):")
+    cameras = IDSinterface(backend=SimulatedBackend(max_fps=10000.))
+    cameras.set_pixel_format(bit_rate=bit_rate, idx=0)
+    cameras.select_device(0)
+    cameras.set_exposure_time(50, 0)
+    cameras.set_max_fps(0)
+    cameras.start_acquisition(0)
+    cameras.preallocate_conversion(0)
+    out = np.empty(*cameras.get_frame_layout(0))
+
+    results = {}
+    for name, capture in [("capture", lambda: cameras.capture(0)),
+                          ("capture_into", lambda: cameras.capture_into(out, 0))]:
+        tracemalloc.start()
+        capture()  # warming up
+        start, _ = tracemalloc.get_traced_memory()
+        peak = 0
+        for _ in range(frames):
+            tracemalloc.reset_peak()
+            current, _ = tracemalloc.get_traced_memory()
+            capture()
+            peak = max(peak, tracemalloc.get_traced_memory()[1] - current)
+        growth = (tracemalloc.get_traced_memory()[0] - start) / frames
+        tracemalloc.stop()
+        results[name] = (peak, growth)
+        print(f"  {name:<40s} {peak:10d} B/frame allocated, {growth:8.1f} B/frame growth")
+    cameras.stop_acquisition(0)
+    return results
+
+
+class _SlowNodeMap(object):
+    """ Mocked nodemap counting the FindNode() calls, each one taking
+        lookup_cost seconds as the GenICam lookup of a real camera would.
+    """
+
+    def __init__(self, nodemap, lookup_cost):
+        self.nodemap = nodemap
+        self.lookup_cost = lookup_cost
+        self.lookups = 0
+
+    def FindNode(self, name):
+        self.lookups += 1
+        deadline = time.perf_counter() + self.lookup_cost
+        while time.perf_counter() < deadline:
+            pass
+        return self.nodemap.FindNode(name)
+
+    def __getattr__(self, name):
+        return getattr(self.nodemap, name)
+
+
+def bench_nodes(lookup_cost=20e-6, calls=2000):
+    """ Per-call cost of the setters and getters, looking up every node on
+        every call (as before the node cache) and with the node cache.
+    """
+    print(f"Setters and getters with a FindNode() cost of {lookup_cost * 1e6:.0f} us:")
+    backend = SimulatedBackend()
+    camera = backend.cameras[0]
+    camera.nodemap = nodemap = _SlowNodeMap(camera.nodemap, lookup_cost)
+    cameras = IDSinterface(backend=backend)
+    cameras.select_device(0)
+    node_cache = cameras._get_nodemap(0)
+
+    operations = [("set_fps + get_fps", lambda: (cameras.set_fps(20, 0),
+                                                 cameras.get_fps(0))),
+                  ("set_exposure_time + get_exposure_time",
+                   lambda: (cameras.set_exposure_time(1000, 0),
+                            cameras.get_exposure_time(0))),
+                  ("set_gain + get_gain", lambda: (cameras.set_gain(2, 0),
+                                                   cameras.get_gain(0))),
+                  ("get_resolution", lambda: cameras.get_resolution(0))]
+    results = {}
+    for name, operation in operations:
+        for cached in (False, True):
+            def loop():
+                for _ in range(calls):
+                    if not cached:
+                        node_cache.invalidate()
+                    operation()
+
+            nodemap.lookups = 0
+            loop()
+            lookups = nodemap.lookups
+            elapsed = timeit(loop, min_time=0.1) / calls
+            label = f"{name} ({'cached' if cached else 'uncached'})"
+            results[label] = elapsed
+            print(f"  {label:<50s} {elapsed * 1e6:9.2f} us  "
+                  f"{lookups / calls:5.2f} FindNode/call")
+    return results
+
+
+def bench_recorder(width=WIDTH, height=HEIGHT, frames=300, fps=100, queue_size=16,
+                   directory=None):
+    """ Rate of a Recorder writing synthetic Mono8 frames: as fast as it can
+        (the producer waits for free slots) and fed at fps (dropping frames when
+        the queue is full), against one np.save() per frame. By default, it
+        writes to a tmpfs (/dev/shm), so it measures the pipeline, not the disk.
+    """
+    if directory is None:
+        directory = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    print(f"Recording {frames} frames of {width}x{height} to {directory}:")
+    rng = np.random.default_rng(0)
+    images = rng.integers(0, 256, (8, height, width), dtype=np.uint8)
+    megabytes = images[0].nbytes / 1e6
+    results = {}
+    work_dir = tempfile.mkdtemp(prefix="bench_recorder_", dir=directory)
+    try:
+        for name, block, period in [("Recorder (sustained)", True, 0),
+                                    (f"Recorder (fed at {fps} fps)", False, 1 / fps)]:
+            recorder = Recorder(os.path.join(work_dir, str(block)), (height, width),
+                                np.uint8, frames, queue_size=queue_size, block=block)
+            t0 = time.perf_counter()
+            for i in range(frames):
+                while time.perf_counter() < t0 + i * period:
+                    time.sleep(0.0005)
+                recorder.write(images[i % len(images)], frame_id=i)
+            stats = recorder.close()
+            rate = stats["written"] / (time.perf_counter() - t0)
+            results[name] = (rate, stats["dropped"])
+            print(f"  {name:<40s} {rate:9.1f} fps  {rate * megabytes:8.1f} MB/s  "
+                  f"{stats['dropped']:5d} dropped  max queued {stats['max_queued']}")
+
+        name = "np.save per frame"
+        count = min(frames, 50)
+        t0 = time.perf_counter()
+        for i in range(count):
+            np.save(os.path.join(work_dir, f"frame_{i}.npy"), images[i % len(images)])
+        rate = count / (time.perf_counter() - t0)
+        results[name] = (rate, 0)
+        print(f"  {name:<40s} {rate:9.1f} fps  {rate * megabytes:8.1f} MB/s")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+
+def bench_frame_formats(width=WIDTH, height=HEIGHT, threads=4, directory=None):
+    """ Size on disk and save/load times of a 12 bits frame in every format of
+        frame_store. The frame is smooth with some noise, like a real one.
+    """
+    if directory is None:
+        directory = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    print(f"Saving a 12 bits {width}x{height} frame to {directory}:")
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[0:height, 0:width]
+    image = 2000 + 1500 * np.sin(x / 200) * np.cos(y / 300) + rng.normal(0, 20, (height, width))
+    image = image.clip(0, 4095).astype(np.uint16)
+    results = {}
+    work_dir = tempfile.mkdtemp(prefix="bench_formats_", dir=directory)
+    try:
+        for frame_format in frame_store.FORMATS:
+            base = os.path.join(work_dir, "frame")
+            save = timeit(lambda: frame_store.save_frame(base, image, frame_format, threads))
+            path = frame_store.frame_path(base, frame_format)
+            load = timeit(lambda: np.asarray(frame_store.load_frame(path, mmap=False,
+                                                                    threads=threads)))
+            size = os.path.getsize(path)
+            results[frame_format] = (size, save, load)
+            print(f"  {frame_format:<12s} {size / image.size:6.2f} B/px  "
+                  f"save {save * 1e3:8.2f} ms  load {load * 1e3:8.2f} ms")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+
+class _ReplayCameras(object):
+    """ Wraps an IDSinterface replaying its last frame, so capture() and
+        capture_into() cost just the copy of the converted frame (capture()
+        allocating it, as the conversion does) and not the wait for the camera.
+    """
+
+    def __init__(self, cameras, idx=0):
+        self.cameras = cameras
+        self.frame = cameras.capture(idx)
+
+    def capture(self, idx=0):
+        return self.frame.copy()
+
+    def capture_into(self, out, idx=0):
+        np.copyto(out, self.frame)
+        return out
+
+    def __getattr__(self, name):
+        return getattr(self.cameras, name)
+
+
+def bench_capture(width=WIDTH, height=HEIGHT, bit_rate=12):
+    """ Per-frame latency of labview.capture(), excluding the wait for the
+        camera: the old capture() + decimation + crop + flip + astype(),
+        against a CapturePipeline declared beforehand (simulated camera).
+    """
+    print(f"labview.capture() of {width}x{height} Mono{bit_rate} frames (simulated camera):")
+    cameras = IDSinterface(backend=SimulatedBackend(width=width, height=height))
+    cameras.set_pixel_format(bit_rate=bit_rate, idx=0)
+    cameras.select_device(0)
+    crop = (width // 4, height // 4, width // 2, height // 2)
+    results = {}
+    for binning, use_crop in [(1, False), (1, True), (2, False), (2, True)]:
+        pipeline = CapturePipeline(cameras, 0, binning, crop if use_crop else None)
+        cameras.start_acquisition(0)
+        replay = pipeline.cameras = _ReplayCameras(cameras)
+
+        def old_capture():
+            image = replay.capture(0)[::binning, ::binning]
+            if use_crop:
+                roix, roiy, roiw, roih = crop
+                image = image[roiy:roiy+roih, roix:roix+roiw]
+            return image[::-1, :].astype(np.uint16)
+
+        label = f"binning {binning}{', crop' if use_crop else ''}"
+        for name, capture in [("old", old_capture), ("pipeline", pipeline.capture)]:
+            elapsed = timeit(capture)
+            results[f"{label} ({name})"] = elapsed
+            report(f"{label} ({name})", elapsed, pipeline.out.size)
+        cameras.stop_acquisition(0)
+    return results
+
+
+def _simulated_cameras(pixel_format, width, height, binning=1):
+    """ IDSinterface streaming a simulated camera as fast as it can in
+        pixel_format ('Mono8', 'RGB12'...), already acquiring.
+    """
+    colorness = "RGB" if pixel_format.startswith("RGB") else "Mono"
+    bit_rate = int(pixel_format[len(colorness):])
+    cameras = IDSinterface(backend=SimulatedBackend(max_fps=100000., width=width,
+                                                    height=height,
+                                                    color=colorness == "RGB"))
+    cameras.set_pixel_format(bit_rate=bit_rate, colorness=colorness, idx=0)
+    cameras.select_device(0)
+    cameras.set_binning(binning, idx=0)
+    cameras.set_exposure_time(0, 0)  # clipped to the minimum
+    cameras.set_max_fps(0)
+    cameras.start_acquisition(0)
+    return cameras
+
+
+def bench_pipeline(pixel_formats=("Mono8", "Mono10", "Mono12", "RGB8", "RGB10", "RGB12"),
+                   resolutions=((640, 480), (1296, 972), (WIDTH, HEIGHT)), binnings=(1, 2)):
+    """ Frames/s and latency per frame of IDSinterface.capture() and
+        capture_into() on a simulated camera, for every pixel format,
+        resolution and binning. It includes simulating the frame, so it
+        measures the whole pipeline on the host as the camera could feed it.
+    """
+    print("IDSinterface.capture() of simulated frames:")
+    results = {}
+    for pixel_format in pixel_formats:
+        for width, height in resolutions:
+            for binning in binnings:
+                cameras = _simulated_cameras(pixel_format, width, height, binning)
+                cameras.preallocate_conversion(0)
+                out = np.empty(*cameras.get_frame_layout(0))
+                for name, capture in [("capture", lambda: cameras.capture(0)),
+                                      ("capture_into", lambda: cameras.capture_into(out, 0))]:
+                    label = f"{name} {pixel_format} {width}x{height} binning {binning}"
+                    capture()  # warming up
+                    elapsed = results[label] = timeit(capture, min_time=0.2)
+                    print(f"  {label:<50s} {elapsed * 1e3:9.3f} ms  {1 / elapsed:9.1f} fps")
+                cameras.stop_acquisition(0)
+                del cameras
+    return results
+
+
+def bench_labview(frames=20, directory=None):
+    """ Latency per frame of labview.capture() and labview.save() (in every
+        frame format) with the cameras labview opens: the IDS ones or, if there
+        is none, simulated ones.
+    """
+    import labview  # opens the cameras
+
+    if directory is None:
+        directory = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    print(f"labview.capture() and labview.save() to {directory}:")
+    labview.init(is16bits=True)
+    width, height, _, _ = labview.start(0, exposure_ms=0.1, fps=1000)
+    labview.set_exposure(0.01)  # and the maximum fps
+    results = {}
+    work_dir = tempfile.mkdtemp(prefix="bench_labview_", dir=directory)
+    try:
+        for label, reuse in [("capture", False), ("capture (reuse)", True)]:
+            elapsed = results[label] = timeit(lambda: labview.capture(0, reuse=reuse),
+                                              min_repeat=frames)
+            report(label, elapsed, width * height)
+        image = labview.capture(0)
+        roi = (width // 4, height // 4, 3 * width // 4, 3 * height // 4)
+        for frame_format in frame_store.FORMATS:
+            count = iter(range(10 ** 9))
+            path = os.path.join(work_dir, f"{frame_format}_")
+
+            def save():
+                labview.save(image, f"{path}{next(count):06d}", main_roi=roi, ref_roi=roi,
+                             frame_format=frame_format)
+
+            label = f"save {frame_format}"
+            elapsed = results[label] = timeit(save, min_repeat=frames)
+            report(label, elapsed, image[roi[1]:roi[3], roi[0]:roi[2]].size)
+    finally:
+        labview.stop()  # closes the metadata logs too
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+
+def bench_preview(width=WIDTH, height=HEIGHT, bit_depth=12, binning=3):
+    """ Cost of rendering a frame for display, without any acquisition: the old
+        float64 conversion + decimation + per-channel transposed copies of
+        test_camera.py, against PreviewRenderer writing into the same surface.
+    """
+    print(f"Rendering {width}x{height} {bit_depth} bits frames for display "
+          f"(binning {binning}):")
+    rng = np.random.default_rng(0)
+    results = {}
+    for name, shape in [("Mono", (height, width)), ("RGB", (height, width, 3))]:
+        frame = rng.integers(0, 2 ** bit_depth, shape, dtype=np.uint16)
+        renderer = PreviewRenderer(shape, bit_depth, binning)
+        surface = np.empty(renderer.size + (3,), dtype=np.uint8)  # pygame layout
+
+        def old_render():
+            image8 = ((frame.astype(np.float64) / 2 ** bit_depth) * 2 ** 8).astype(np.uint8)
+            for channel in range(3):
+                if image8.ndim == 3:
+                    surface[:, :, channel] = image8[::binning, ::binning, channel].T
+                else:
+                    surface[:, :, channel] = image8[::binning, ::binning].T
+
+        for label, render in [(f"{name} (old)", old_render),
+                              (f"{name} (PreviewRenderer)",
+                               lambda: renderer.render(frame, surface.transpose(1, 0, 2)))]:
+            elapsed = results[label] = timeit(render)
+            report(label, elapsed, frame.size)
+    return results
+
+
+def bench_calibration(width=WIDTH, height=HEIGHT, bit_depth=12, ref_roi=(0, 0, 64, 64)):
+    """ Per-frame cost of the dark, flat and reference corrections of Calibration,
+        in uint16 and into a float32 output, against the float32 copy
+        normalized by the reference that labview.save() does. The uint16 ones
+        correct a copy of the frame (included), so it is the same every time.
+    """
+    print(f"Correcting {width}x{height} {bit_depth} bits frames:")
+    rng = np.random.default_rng(0)
+    dark = rng.normal(100, 5, (height, width)).astype(np.float32)
+    flat = dark + rng.uniform(1000, 3000, (height, width)).astype(np.float32)
+    frame = rng.integers(0, 2 ** bit_depth, (height, width), dtype=np.uint16)
+    work = np.empty_like(frame)
+    x, y, w, h = ref_roi
+
+    def old_normalize():
+        image = frame.astype(np.float32)
+        image /= frame[y:y + h, x:x + w].mean()
+
+    results = {}
+    cases = [("ref, float32 copy (old)", old_normalize)]
+    for dtype in (np.uint16, np.float32):
+        for label, kwargs in [("dark", {"dark": dark}),
+                              ("dark+flat", {"dark": dark, "flat": flat}),
+                              ("dark+flat+ref", {"dark": dark, "flat": flat,
+                                                 "ref_roi": ref_roi})]:
+            calibration = Calibration(dtype=dtype, **kwargs)
+            out = work if dtype == np.uint16 else None
+            cases.append((f"{label}, {np.dtype(dtype).name}",
+                          lambda calibration=calibration, out=out: calibration.apply(frame,
+                                                                                     out)))
+    for label, correct in cases:
+        elapsed = results[label] = timeit(correct)
+        report(label, elapsed, frame.size)
+    return results
+
+
+BENCHMARKS = {"unpack": bench_unpack,
+              "allocations": bench_allocations,
+              "nodes": bench_nodes,
+              "recorder": bench_recorder,
+              "formats": bench_frame_formats,
+              "capture": bench_capture,
+              "pipeline": bench_pipeline,
+              "labview": bench_labview,
+              "preview": bench_preview,
+              "calibration": bench_calibration}
+
+
+def timings(results):
+    """ The {case: seconds} part of the results of every benchmark, flattened
+        to {"benchmark/case": seconds}. Other results (rates, sizes...) are not
+        comparable with a baseline.
+    """
+    flat = {}
+    for name, result in results.items():
+        if not isinstance(result, dict):
+            continue
+        for case, value in result.items():
+            if isinstance(value, float):
+                flat[f"{name}/{case}"] = value
+    return flat
+
+
+def save_baseline(path, results):
+    """ Stores the timings of results in path (JSON), merged with the ones
+        already there, along with a description of this machine.
+    """
+    baseline = {"machine": {}, "timings": {}}
+    if os.path.isfile(path):
+        with open(path, encoding='utf-8') as baseline_file:
+            baseline = json.load(baseline_file)
+    baseline["machine"] = machine()
+    baseline["timings"].update(timings(results))
+    with open(path, 'w', encoding='utf-8') as baseline_file:
+        json.dump(baseline, baseline_file, indent=4, sort_keys=True)
+    return baseline
+
+
+def machine():
+    """ Description of this machine, stored with the baselines. """
+    return {"node": platform.node(), "processor": platform.processor(),
+            "python": platform.python_version(), "numpy": np.__version__,
+            "cpus": os.cpu_count()}
+
+
+def same_machine(other):
+    """ Whether timings taken on the machine other (see machine()) are comparable
+        with the ones of this one.
+    """
+    this = machine()
+    return all(other.get(key) == this[key] for key in ("node", "processor", "cpus"))
+
+
+def load_baseline(path=BASELINE):
+    """ The baseline in path: {"machine": {...}, "timings": {case: seconds}}. """
+    with open(path, encoding='utf-8') as baseline_file:
+        return json.load(baseline_file)
+
+
+def baseline_benchmarks(path=BASELINE):
+    """ Names of the benchmarks with timings in the baseline in path. """
+    cases = load_baseline(path)["timings"]
+    return [name for name in BENCHMARKS if any(case.startswith(name + "/") for case in cases)]
+
+
+def check_baseline(path, results, tolerance=1.5):
+    """ Compares the timings of results with the baseline in path. Returns the
+        list of (case, seconds, baseline seconds) slower than baseline * tolerance,
+        always empty if the baseline was taken on another machine.
+    """
+    loaded = load_baseline(path)
+    baseline = loaded["timings"]
+    other = loaded.get("machine", {})
+    comparable = same_machine(other)
+    regressions = []
+    print(f"Comparison with {path} (tolerance x{tolerance}):")
+    if not comparable:
+        print(f"  Warning: the baseline was taken on {other.get('node')} "
+              f"({other.get('processor')}, {other.get('cpus')} cpus), not comparable "
+              f"with {platform.node()}: the timings are only reported. Take a baseline "
+              f"here with --save-baseline.")
+    for case, seconds in timings(results).items():
+        if case not in baseline:
+            print(f"  {case:<70s} {seconds * 1e3:9.3f} ms  (no baseline)")
+            continue
+        ratio = seconds / baseline[case]
+        slower = comparable and ratio > tolerance
+        if slower:
+            regressions.append((case, seconds, baseline[case]))
+        print(f"  {case:<70s} {seconds * 1e3:9.3f} ms  x{ratio:5.2f}"
+              f"{'  REGRESSION' if slower else ''}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks of the acquisition and "
+                                                 "conversion pipeline.")
+    parser.add_argument("names", nargs="*",
+                        help=f"benchmarks to run: {', '.join(BENCHMARKS)} (all by default)")
+    parser.add_argument("--save-baseline", metavar="FILE", nargs="?", const=BASELINE,
+                        help="store the timings as the baseline "
+                             "(default: benchmarks_baseline.json)")
+    parser.add_argument("--check", metavar="FILE", nargs="?", const=BASELINE,
+                        help="fail if any timing is slower than the baseline "
+                             "(default: benchmarks_baseline.json)")
+    parser.add_argument("--tolerance", type=float, default=1.5,
+                        help="slowdown allowed by --check (default: 1.5)")
+    args = parser.parse_args()
+    unknown = set(args.names) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(sorted(unknown))}")
+
+    if args.check and not os.path.isfile(args.check):
+        parser.error(f"there is no baseline {args.check}: take one on this machine "
+                     f"with --save-baseline first")
+    names = args.names
+    if not names:
+        names = baseline_benchmarks(args.check) if args.check else list(BENCHMARKS)
+    results = {}
+    for name in names:
+        results[name] = BENCHMARKS[name]()
+    if args.save_baseline:
+        save_baseline(args.save_baseline, results)
+        print(f"Baseline saved to {args.save_baseline}")
+    if args.check:
+        regressions = check_baseline(args.check, results, args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} regressions:")
+            for case, seconds, reference in regressions:
+                print(f"  {case}: {seconds * 1e3:.4g} ms, baseline {reference * 1e3:.4g} ms")
+            sys.exit(1)
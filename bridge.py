@@ -0,0 +1,205 @@
+""" Long-lived grabber process handing the frames of a camera over to other
+    processes (e.g. LabVIEW) through a named shared-memory ring.
+
+    The grabber process owns the camera and keeps streaming into the ring at
+    the camera rate. The consumers get the latest frame as a view of its slot,
+    without any copy, whatever their own loop rate is.
+
+    Usage:
+
+        from bridge import FrameBridge
+
+        bridge = FrameBridge(cam_id=0, settings={"fps": 100, "exposure": 5000})
+        seq, image = bridge.latest()  # view of the slot, already flipped and cast
+        bridge.apply_settings(gain=2)
+        bridge.close()
+
+    It works with simulated cameras too (simulated=True), without any hardware.
+"""
+
+import multiprocessing
+import os
+import queue
+import time
+
+import numpy as np
+
+from ring_buffer import SharedFrameRingBuffer
+
+
+class FrameBridge(object):
+    """ Starts a grabber process for camera cam_id and attaches to its ring.
+
+        cam_id: index of the camera, as in IDSinterface.
+        ring_size: slots of the shared ring. A view returned by latest() is valid
+                   until ring_size - 1 frames more are grabbed.
+        flip: flips the frames upside down, as labview.capture() does.
+        dtype: of the frames in the ring (the cast is done by the grabber).
+        settings: for IDSinterface.apply_settings() before starting.
+        bit_rate: pixel format of the camera (8, 10 or 12), see set_pixel_format().
+        simulated: True for a simulated camera, False for an IDS one, or None
+                   to use a simulated one only if there is no IDS camera.
+        name: of the shared memory. By default, unique for this process and camera.
+        timeout: seconds to wait for the grabber process to be ready.
+    """
+
+    def __init__(self, cam_id=0, ring_size=8, flip=True, dtype=np.uint16, settings=None,
+                 bit_rate=8, simulated=None, name=None, timeout=30.):
+        self.cam_id = cam_id
+        self.name = name or f"ids_bridge_{os.getpid()}_{cam_id}"
+        context = multiprocessing.get_context("spawn")
+        self._commands = context.Queue()
+        self._replies = context.Queue()
+        self._process = context.Process(target=_grabber_main, name=f"IDSbridge-{cam_id}",
+                                        args=(self.name, cam_id, ring_size, flip,
+                                              np.dtype(dtype).str, dict(settings or {}),
+                                              bit_rate, simulated,
+                                              self._commands, self._replies),
+                                        daemon=True)
+        self._process.start()
+        self.settings = self.__reply(timeout)
+        self.ring = SharedFrameRingBuffer(self.name)
+
+    def __reply(self, timeout=10.):
+        try:
+            status, value = self._replies.get(timeout=timeout)
+        except queue.Empty:
+            raise RuntimeError(f"The grabber process of camera {self.cam_id} "
+                               f"is not responding.") from None
+        if status == "error":
+            raise RuntimeError(f"Grabber process of camera {self.cam_id}: {value}")
+        return value
+
+    def __command(self, name, value=None):
+        if not self._process.is_alive():
+            raise RuntimeError(f"The grabber process of camera {self.cam_id} is not running.")
+        self._commands.put((name, value))
+        return self.__reply()
+
+    def latest(self, timeout=1.):
+        """ Returns (seq, frame) of the most recent frame, frame being a view of
+            its slot in shared memory (no copy). Waits up to timeout seconds for
+            the first frame.
+        """
+        deadline = time.perf_counter() + timeout
+        seq, frame = self.ring.latest_view()
+        while seq is None:
+            if time.perf_counter() > deadline:
+                raise RuntimeError(f"No frame from camera {self.cam_id} after {timeout} s.")
+            time.sleep(0.001)
+            seq, frame = self.ring.latest_view()
+        return seq, frame
+
+    def latest_slot(self):
+        """ Returns (slot, seq) of the most recent frame, or (None, None). """
+        seq = self.ring.write_count - 1
+        if seq < 0:
+            return None, None
+        return seq % self.ring.size, seq
+
+    def next(self, timeout=0, out=None):
+        """ Returns (seq, copy of frame) of the next frame not read yet, see
+            FrameRingBuffer.next().
+        """
+        return self.ring.next(timeout, out)
+
+    def apply_settings(self, **settings):
+        """ IDSinterface.apply_settings() on the grabber process. Returns the
+            settings in effect. The ROI can't be changed, since the layout of the
+            ring depends on it: start a new bridge instead.
+        """
+        if settings.get("roi") is not None:
+            raise ValueError("The ROI of a bridged camera can't change. Start a new bridge.")
+        self.settings = self.__command("settings", settings)
+        return self.settings
+
+    def stats(self):
+        """ Streaming counters of the grabber, see IDSinterface.get_stream_stats(). """
+        return self.__command("stats")
+
+    def close(self):
+        """ Stops the grabber process and frees the shared ring. The views
+            returned by latest() keep their memory mapped while they are in use.
+        """
+        if self.ring is None:
+            return
+        self.ring.close()
+        self.ring = None
+        if self._process.is_alive():
+            self._commands.put(("stop", None))
+        self._process.join(10)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _grabber_main(name, cam_id, ring_size, flip, dtype, settings, bit_rate, simulated,
+                  commands, replies):
+    """ Body of the grabber process: streams camera cam_id into the shared ring
+        and serves the commands of FrameBridge until 'stop'.
+    """
+    import interface
+    from simulated_camera import SimulatedBackend
+
+    cameras = ring = None
+    try:
+        if not simulated:
+            try:
+                cameras = interface.IDSinterface()
+            except ImportError:  # IDS SDK not installed
+                if simulated is not None:
+                    raise
+            except interface.ids_peak.NotFoundException:
+                if simulated is not None:
+                    raise
+        if cameras is None:
+            cameras = interface.IDSinterface(backend=SimulatedBackend(num_devices=cam_id + 1))
+        cameras.set_pixel_format(bit_rate, colorness="Mono", idx=cam_id)
+        cameras.select_device(cam_id)
+        applied = cameras.apply_settings(cam_id, **settings)
+        # The sensor flips at no cost, if it can (not Bayer sensors)
+        sensor_flip = flip and cameras.set_reverse(reverse_y=True, idx=cam_id)[1]
+        shape, frame_dtype = cameras.get_frame_layout(cam_id)
+        ring = SharedFrameRingBuffer(name, ring_size, shape, dtype)
+
+        cameras.start_acquisition(cam_id)
+        if np.dtype(dtype) == frame_dtype and flip == sensor_flip:
+            # zero-copy: the grabber converts the frames straight into the slots
+            cameras.start_streaming(cam_id, ring=ring)
+        else:  # flipped and cast by a single copy from a private ring
+            def to_ring(frame, timestamp_ns, frame_id, host_time):
+                ring.push(frame[::-1] if flip and not sensor_flip else frame,
+                          timestamp_ns, frame_id, host_time)
+
+            cameras.start_streaming(cam_id, ring_size=2)
+            cameras.add_stream_sink(to_ring, cam_id)
+    except Exception as e:
+        replies.put(("error", repr(e)))
+        if ring is not None:
+            ring.close()
+            ring.unlink()
+        return
+    replies.put(("ok", applied))
+
+    try:
+        while True:
+            command, value = commands.get()
+            if command == "stop":
+                break
+            try:
+                if command == "settings":
+                    replies.put(("ok", cameras.apply_settings(cam_id, **value)))
+                elif command == "stats":
+                    replies.put(("ok", cameras.get_stream_stats(cam_id)))
+                else:
+                    replies.put(("error", f"Unknown command {command}"))
+            except Exception as e:
+                replies.put(("error", repr(e)))
+    finally:
+        cameras.stop_acquisition(cam_id)
+        cameras.release_device(cam_id)
+        ring.close()
+        ring.unlink()
@@ -0,0 +1,245 @@
+""" Dark-frame subtraction, flat-field correction and normalization by a
+    reference ROI, applied to every frame as it is captured.
+
+    The master dark and flat frames are the mean of n captures, accumulated one
+    frame at a time, and are cached on disk by camera serial, pixel format,
+    exposure and gain (CalibrationStore), so they are only taken again when
+    one of them changes.
+
+    Usage:
+
+        from calibration import (Calibration, CalibrationStore, average_frames,
+                                 calibration_key)
+
+        capture = lambda: my_interface.capture(0)
+        store = CalibrationStore("calibration")
+        key = calibration_key(my_interface, idx=0)
+        dark = store.get_or_build("dark", key, lambda: average_frames(capture, 32))
+        ...  # uniform illumination
+        flat = store.get_or_build("flat", key, lambda: average_frames(capture, 32))
+        calibration = Calibration(dark, flat)
+        corrected = calibration.apply(frame)  # in place for uint16 frames
+"""
+
+import json
+import os
+import time
+
+import numpy as np
+
+KINDS = ("dark", "flat")
+MAX_GAIN = 16  # of the flat-field correction, so dead pixels are not amplified further
+
+
+def average_frames(capture, n=32):
+    """ Mean of n frames returned by capture() (called n times), as float32.
+        Integer frames are added up exactly in uint32, floats in float64.
+    """
+    if n < 1:
+        raise ValueError("At least 1 frame is needed to average.")
+    total = None
+    for _ in range(n):
+        frame = capture()
+        if total is None:
+            exact = np.issubdtype(frame.dtype, np.integer) and frame.dtype.itemsize <= 2
+            total = np.zeros(frame.shape, np.uint32 if exact and n < 2 ** 16 else np.float64)
+        np.add(total, frame, out=total, casting='unsafe')
+    return (total / n).astype(np.float32)
+
+
+def calibration_key(cameras, idx=0, extra=None):
+    """ Key of the master frames of device idx of cameras (an IDSinterface)
+        with its current settings: serial, final pixel format, exposure [us] and
+        gain, plus extra (e.g. the geometry of a CapturePipeline), if any.
+    """
+    settings = cameras.get_settings(idx)
+    key = (f"{cameras.get_serial_number(idx)}_{cameras.get_pixel_format(idx)[1]}"
+           f"_{settings['exposure']:.0f}us_gain{settings['gain']:g}")
+    return key if extra is None else f"{key}_{extra}"
+
+
+class CalibrationStore(object):
+    """ Master frames on disk, in directory: <kind>_<key>.npy with a .json next
+        to it with how it was taken.
+    """
+
+    def __init__(self, directory="calibration"):
+        self.directory = directory
+
+    def path(self, kind, key):
+        if kind not in KINDS:
+            raise ValueError(f"{kind} : Kind of master frame not supported. Choose one "
+                             f"valid: {', '.join(KINDS)}")
+        return os.path.join(self.directory, f"{kind}_{key}.npy")
+
+    def load(self, kind, key, shape=None):
+        """ The master frame kind of key, or None if there is none (or it has
+            not the given shape).
+        """
+        path = self.path(kind, key)
+        if not os.path.isfile(path):
+            return None
+        master = np.load(path)
+        if shape is not None and master.shape != tuple(shape):
+            return None
+        return master
+
+    def save(self, kind, key, master, **info):
+        """ Stores master (and info, in the .json). Returns its path. """
+        path = self.path(kind, key)
+        os.makedirs(self.directory, exist_ok=True)
+        np.save(path, np.asarray(master, dtype=np.float32))
+        info.update(kind=kind, key=key, shape=master.shape, time=time.time())
+        with open(path[:-len(".npy")] + ".json", 'w', encoding='utf-8') as info_file:
+            json.dump(info, info_file, indent=4)
+        return path
+
+    def get_or_build(self, kind, key, build, shape=None, rebuild=False):
+        """ The master frame kind of key from disk or, if there is none (or
+            rebuild), from build() and then stored.
+        """
+        master = None if rebuild else self.load(kind, key, shape)
+        if master is None:
+            master = build()
+            self.save(kind, key, master)
+        return master
+
+
+class Calibration(object):
+    """ Correction of the frames of a camera with master dark and flat frames
+        (float32, see average_frames()), any of them optional:
+
+            corrected = (frame - dark) * mean(flat - dark) / (flat - dark)
+
+        and then, if ref_roi = (x, y, width, height) is given, divided by the
+        mean of the corrected frame in ref_roi.
+
+        dtype: uint16 corrects the frames in place: the dark is subtracted in
+               integers (clipped at 0), the gains are applied in float32 and
+               the result is rounded and clipped back to uint16. Normalized
+               frames are scaled by ref_scale, so the reference is ref_scale
+               (2**14).
+               float32 writes the corrected frames into self.out; normalized
+               ones have the reference at 1, as labview.save() does.
+
+        All the operations are done on blocks of rows of about block_size
+        bytes, while each block is in cache, so the frame is read from memory
+        just once. The gains are limited to MAX_GAIN.
+    """
+
+    def __init__(self, dark=None, flat=None, ref_roi=None, ref_scale=2 ** 14,
+                 dtype=np.uint16, block_size=1 << 18):
+        masters = [master for master in (dark, flat) if master is not None]
+        if len(masters) == 2 and dark.shape != flat.shape:
+            raise ValueError("The dark and flat frames must have the same shape.")
+        self.dtype = np.dtype(dtype)
+        if self.dtype not in (np.dtype(np.uint16), np.dtype(np.float32)):
+            raise ValueError(f"{self.dtype} : Calibration only in uint16 or float32.")
+        self.ref_roi = ref_roi
+        self.ref_scale = ref_scale
+        self.ref_mean = None  # of the last frame corrected
+        self.block_size = block_size
+
+        gain = None
+        if flat is not None:
+            signal = np.asarray(flat, dtype=np.float32)
+            if dark is not None:
+                signal = signal - dark
+            mean = signal.mean()
+            if mean <= 0:
+                raise ValueError("The flat frame is not brighter than the dark one.")
+            gain = (mean / np.maximum(signal, mean / MAX_GAIN)).astype(np.float32)
+
+        self._integer = self.dtype == np.uint16
+        if self._integer:
+            self._dark = None if dark is None else \
+                np.rint(np.clip(dark, 0, 2 ** 16 - 1)).astype(np.uint16)
+        else:
+            self._dark = None if dark is None else np.asarray(dark, dtype=np.float32)
+        self._gain = gain
+        self.shape = None
+        self.out = None
+        if masters:
+            self.__allocate(masters[0].shape)
+
+    def __allocate(self, shape):
+        """ Output (float32) or float32 scratch rows (uint16) for frames of shape. """
+        self.shape = tuple(shape)
+        self._rows = max(self.block_size // (int(np.prod(self.shape[1:])) * 4), 1)
+        if self._integer:
+            self._scratch = np.empty((self._rows,) + self.shape[1:], np.float32)
+        else:
+            self.out = np.empty(self.shape, np.float32)
+
+    def __ref_mean(self, frame):
+        """ Mean of the corrected frame in ref_roi, correcting only the ROI. """
+        x, y, width, height = self.ref_roi
+        roi = np.s_[y:y + height, x:x + width]
+        ref = frame[roi].astype(np.float64)
+        if self._dark is not None:
+            ref -= self._dark[roi]
+            if self._integer:
+                np.maximum(ref, 0, out=ref)
+        if self._gain is not None:
+            ref *= self._gain[roi]
+        self.ref_mean = float(ref.mean()) if ref.size else 0.
+        if self.ref_mean <= 0:
+            raise ValueError("Normalization by a black reference ROI.")
+        return self.ref_mean
+
+    def apply(self, frame, out=None):
+        """ Returns the corrected frame: frame itself (uint16, in place) or
+            self.out (float32), unless out is given.
+        """
+        if self.shape is None:  # only the normalization
+            self.__allocate(frame.shape)
+        elif frame.shape != self.shape:
+            raise ValueError(f"Frames of {frame.shape} with master frames of {self.shape}.")
+        dark, gain = self._dark, self._gain
+        scale = None
+        if self.ref_roi is not None:
+            scale = 1 / self.__ref_mean(frame)
+
+        if not self._integer:
+            if out is None:
+                out = self.out
+            if scale is not None:
+                scale = np.float32(scale)
+            for start in range(0, len(frame), self._rows):
+                rows = np.s_[start:start + self._rows]
+                block = out[rows]
+                if dark is not None:
+                    np.subtract(frame[rows], dark[rows], out=block)
+                else:
+                    np.copyto(block, frame[rows])
+                if gain is not None:
+                    np.multiply(block, gain[rows], out=block)
+                if scale is not None:
+                    np.multiply(block, scale, out=block)
+            return out
+
+        if out is None:
+            out = frame
+        elif out is not frame:
+            np.copyto(out, frame, casting='unsafe')
+        if scale is not None:
+            scale = np.float32(self.ref_scale * scale)
+        for start in range(0, len(out), self._rows):
+            rows = np.s_[start:start + self._rows]
+            block = out[rows]
+            if dark is not None:  # saturating subtraction
+                np.maximum(block, dark[rows], out=block)
+                np.subtract(block, dark[rows], out=block)
+            if gain is None and scale is None:
+                continue
+            scratch = self._scratch[:len(block)]
+            if gain is not None:
+                np.multiply(block, gain[rows], out=scratch)
+            else:
+                np.copyto(scratch, block)
+            if scale is not None:
+                np.multiply(scratch, scale, out=scratch)
+            np.add(scratch, np.float32(0.5), out=scratch)  # rounded by the cast
+            np.minimum(scratch, np.float32(2 ** 16 - 1), out=scratch)
+            np.copyto(block, scratch, casting='unsafe')
+        return out
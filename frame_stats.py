@@ -0,0 +1,221 @@
+""" Incremental statistics of the frames of a live stream: per-channel
+    histograms, saturated pixels, min/max/mean of the frame and of some ROIs,
+    per frame and accumulated over time.
+
+    Usage:
+
+        from frame_stats import FrameStatistics
+
+        stats = FrameStatistics(bit_depth=12, rois={"ref": (0, 0, 64, 64)}, every=5,
+                                background=True)
+        stats.attach(my_interface, idx=0)  # to a streaming device
+        ...
+        print(stats.last["rois"]["ref"], stats.summary()["saturated"])
+        stats.detach()
+
+    Or call stats.update(image) with any frame.
+"""
+
+import threading
+
+import numpy as np
+
+from processing import image_stats
+
+
+def channel_histograms(image, levels, out=None):
+    """ Histograms of the integer image, one per channel: (channels, levels)
+        array with the count of every value (np.bincount, no binning). Values
+        above levels - 1 are counted in the last bin. out: optional array to
+        add the counts to.
+    """
+    if not np.issubdtype(image.dtype, np.integer):
+        raise ValueError("Histograms by np.bincount need integer images.")
+    channels = image.shape[2] if image.ndim == 3 else 1
+    if out is None:
+        out = np.zeros((channels, levels), dtype=np.int64)
+    for channel in range(channels):
+        values = image[..., channel] if image.ndim == 3 else image
+        counts = np.bincount(values.ravel(), minlength=levels)
+        if len(counts) > levels:
+            counts[levels - 1] += counts[levels:].sum()
+        out[channel] += counts[:levels]
+    return out
+
+
+def histogram_stats(histogram):
+    """ (mean, max, min) of the values counted in a histogram of channel_histograms(). """
+    values = np.nonzero(histogram)[0]
+    if not values.size:
+        return None, None, None
+    total = histogram.sum()
+    mean = float(np.dot(histogram.astype(np.float64), np.arange(len(histogram))) / total)
+    return mean, int(values[-1]), int(values[0])
+
+
+class FrameStatistics(object):
+    """ Statistics of every every-th frame passed to update():
+
+            histograms: per-channel counts of every value (bit_depth bits).
+            saturated: pixels per channel at saturation (2**bit_depth - 1 by
+                       default) or above.
+            channels: (mean, max, min) per channel of the whole frame.
+            rois: (mean, max, min) of every ROI {name: (x, y, width, height)}.
+
+        self.last keeps them for the last frame analysed. Over time, the
+        histograms and saturated counts are added up, and the ROI means are
+        averaged, along with their min and max.
+
+        background: analyse the frames on a worker thread. update() then only
+                    copies the frame, and frames arriving while the worker is
+                    busy are skipped (counted in summary()["busy"]).
+    """
+
+    def __init__(self, bit_depth=12, rois=None, every=1, saturation=None, background=False):
+        self.levels = 2 ** bit_depth
+        self.rois = dict(rois or {})
+        self.every = max(int(every), 1)
+        self.saturation = self.levels - 1 if saturation is None else saturation
+        self.last = None
+        self._lock = threading.Lock()
+        self._seen = 0
+        self._busy = 0
+        self.reset()
+
+        self._thread = None
+        if background:
+            self._frame = None  # copy of the frame for the worker
+            self._pending = threading.Event()
+            self._idle = threading.Event()
+            self._idle.set()
+            self._stop = False
+            self._thread = threading.Thread(target=self.__work_loop, name="IDSstats",
+                                            daemon=True)
+            self._thread.start()
+        self._cameras = None
+
+    def reset(self):
+        """ Clears the accumulators. """
+        with self._lock:
+            self.frames = 0
+            self.histograms = None
+            self.saturated = None
+            # sum of means, max, min and frames of every ROI, since it was set
+            self._roi_totals = {name: [0., None, None, 0] for name in self.rois}
+
+    def set_roi(self, name, roi):
+        """ Adds or replaces (None removes) the ROI name = (x, y, width, height). """
+        with self._lock:
+            if roi is None:
+                self.rois.pop(name, None)
+                self._roi_totals.pop(name, None)
+            else:
+                self.rois[name] = tuple(roi)
+                self._roi_totals[name] = [0., None, None, 0]
+
+    def update(self, frame, *metadata):
+        """ Takes a frame (every every-th one). The extra arguments are ignored,
+            so it can be used as a stream sink.
+        """
+        self._seen += 1
+        if (self._seen - 1) % self.every:
+            return
+        if self._thread is None:
+            self.__analyse(frame)
+            return
+        if not self._idle.is_set():
+            self._busy += 1
+            return
+        if self._frame is None or self._frame.shape != frame.shape \
+                or self._frame.dtype != frame.dtype:
+            self._frame = np.empty_like(frame)
+        np.copyto(self._frame, frame)
+        self._idle.clear()
+        self._pending.set()
+
+    def __work_loop(self):
+        while True:
+            self._pending.wait()
+            self._pending.clear()
+            if self._stop:
+                break
+            try:
+                self.__analyse(self._frame)
+            finally:
+                self._idle.set()
+
+    def __analyse(self, frame):
+        histograms = channel_histograms(frame, self.levels)
+        saturated = histograms[:, min(self.saturation, self.levels - 1):].sum(axis=1)
+        rois = {}
+        for name, (x, y, width, height) in list(self.rois.items()):
+            crop = frame[y:y + height, x:x + width]
+            rois[name] = (tuple(np.asarray(value).item() for value in image_stats(crop))
+                          if crop.size else (None, None, None))
+        last = {"frame": self._seen - 1, "histograms": histograms, "saturated": saturated,
+                "channels": [histogram_stats(h) for h in histograms], "rois": rois}
+
+        with self._lock:
+            self.frames += 1
+            if self.histograms is None or self.histograms.shape != histograms.shape:
+                self.histograms = np.zeros_like(histograms)
+                self.saturated = np.zeros_like(saturated)
+            self.histograms += histograms
+            self.saturated += saturated
+            for name, (mean, maximum, minimum) in rois.items():
+                totals = self._roi_totals.get(name)
+                if totals is None or mean is None:
+                    continue
+                totals[0] += mean
+                totals[1] = maximum if totals[1] is None else max(totals[1], maximum)
+                totals[2] = minimum if totals[2] is None else min(totals[2], minimum)
+                totals[3] += 1
+            self.last = last
+
+    def flush(self):
+        """ Waits until the worker thread is done with the last frame. """
+        if self._thread is not None:
+            self._idle.wait()
+
+    def summary(self):
+        """ Accumulated statistics: frames seen and analysed, the added-up
+            histograms and saturated counts, (mean, max, min) per channel of
+            all of them, and the mean of the ROI means with the ROI max and min
+            (of the frames analysed since the ROI was set).
+        """
+        self.flush()
+        with self._lock:
+            histograms = None if self.histograms is None else self.histograms.copy()
+            return {"seen": self._seen, "frames": self.frames, "busy": self._busy,
+                    "histograms": histograms,
+                    "saturated": None if self.saturated is None else self.saturated.copy(),
+                    "channels": ([] if histograms is None else
+                                 [histogram_stats(h) for h in histograms]),
+                    "rois": {name: (total / count if count else None, maximum, minimum)
+                             for name, (total, maximum, minimum, count)
+                             in self._roi_totals.items()}}
+
+    def attach(self, cameras, idx=0):
+        """ Analyses the frames of a streaming device of cameras (an IDSinterface)
+            as they are grabbed. With background=False, keep every high enough,
+            or the grabber thread will fall behind.
+        """
+        self.detach()
+        cameras.add_stream_sink(self.update, idx)
+        self._cameras = (cameras, idx)
+
+    def detach(self):
+        if self._cameras is not None:
+            cameras, idx = self._cameras
+            self._cameras = None
+            cameras.remove_stream_sink(self.update, idx)
+
+    def close(self):
+        """ Detaches it and stops the worker thread. """
+        self.detach()
+        if self._thread is not None:
+            self.flush()
+            self._stop = True
+            self._pending.set()
+            self._thread.join()
+            self._thread = None
@@ -0,0 +1,148 @@
+""" Compact on-disk formats for single frames.
+
+    float32     .npy      4 bytes per pixel, what labview.save() always wrote
+    uint16      .npy      2 bytes per pixel, memory-mapped when loaded
+    packed12    .p12.npy  1.5 bytes per pixel (12 bits images), the layout of
+                          Mono12g24IDS, so raw camera buffers can be stored as is
+    compressed  .idsz     lossless: zlib over byte-shuffled chunks of rows,
+                          (de)compressed by several threads
+
+    Usage:
+
+        path = save_frame("frame_0001", image, "packed12")  # frame_0001.p12.npy
+        image = load_frame(path)
+"""
+
+import json
+import struct
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from packed_formats import pack_mono12g24, unpack_mono12g24
+
+FORMATS = {"float32": ".npy", "uint16": ".npy", "packed12": ".p12.npy",
+           "compressed": ".idsz"}
+
+_MAGIC = b"IDSZ"
+_HEADER = struct.Struct("<4sI")  # magic, length of the JSON header
+
+
+def pack12(image, out=None):
+    """ Packs a (height, width) image of up to 12 bits into a (height, width * 3 // 2)
+        uint8 array (Mono12g24IDS layout). The width must be even, and the
+        values within 0 and 4095: ValueError otherwise, instead of losing the
+        high bits (e.g. of 12 bits images aligned to the MSB of uint16).
+    """
+    height, width = image.shape
+    if width % 2:
+        raise ValueError("Only images with an even width can be packed to 12 bits.")
+    if not np.issubdtype(image.dtype, np.integer):
+        raise ValueError("Only integer images can be packed to 12 bits.")
+    if image.size and (image.max() > 0xFFF or image.min() < 0):
+        raise ValueError(f"Values from {image.min()} to {image.max()} don't fit in 12 bits. "
+                         f"Save the image as uint16 or compressed instead.")
+    if out is None:
+        out = np.empty((height, width * 3 // 2), dtype=np.uint8)
+    pack_mono12g24(image, out.reshape(-1))
+    return out
+
+
+def unpack12(packed, out=None):
+    """ Unpacks the output of pack12() to a (height, width) uint16 array. """
+    height, row_bytes = packed.shape
+    return unpack_mono12g24(packed, row_bytes * 2 // 3, height, out)
+
+
+def _compress_chunk(chunk, level):
+    # byte shuffle: all the low bytes, then all the high bytes... compress better
+    shuffled = np.ascontiguousarray(chunk).view(np.uint8).reshape(-1, chunk.itemsize).T
+    return zlib.compress(np.ascontiguousarray(shuffled), level)
+
+
+def _decompress_chunk(data, out):
+    shuffled = np.frombuffer(zlib.decompress(data), dtype=np.uint8)
+    view = out.view(np.uint8).reshape(-1, out.itemsize)
+    view[:] = shuffled.reshape(out.itemsize, -1).T
+
+
+def compress(image, threads=4, level=1, chunk_rows=64):
+    """ Lossless compression of image to bytes: zlib (level) over chunks of
+        chunk_rows rows, compressed in parallel by threads threads.
+    """
+    image = np.ascontiguousarray(image)
+    chunks = [image[start:start + chunk_rows] for start in range(0, len(image), chunk_rows)]
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        data = list(pool.map(lambda chunk: _compress_chunk(chunk, level), chunks))
+    header = json.dumps({"shape": image.shape, "dtype": image.dtype.str,
+                         "chunk_rows": chunk_rows, "sizes": [len(d) for d in data]}).encode()
+    return b"".join([_HEADER.pack(_MAGIC, len(header)), header] + data)
+
+
+def decompress(data, threads=4, out=None):
+    """ Inverse of compress(). out: optional preallocated array to write into. """
+    data = memoryview(data)
+    magic, header_size = _HEADER.unpack_from(data)
+    if magic != _MAGIC:
+        raise ValueError("Not compressed by frame_store.compress().")
+    start = _HEADER.size + header_size
+    header = json.loads(bytes(data[_HEADER.size:start]))
+    shape, dtype = tuple(header["shape"]), np.dtype(header["dtype"])
+    if out is None:
+        out = np.empty(shape, dtype=dtype)
+    elif out.shape != shape or out.dtype != dtype:
+        raise ValueError(f"The output array must be {shape} {dtype}.")
+    rows = header["chunk_rows"]
+    jobs = []
+    for i, size in enumerate(header["sizes"]):
+        jobs.append((data[start:start + size], out[i * rows:(i + 1) * rows]))
+        start += size
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(lambda job: _decompress_chunk(*job), jobs))
+    return out
+
+
+def frame_path(path, frame_format):
+    """ path with the extension of frame_format (replacing .npy or .png). """
+    if frame_format not in FORMATS:
+        raise ValueError(f"{frame_format} : Frame format not supported. Choose one "
+                         f"valid: {', '.join(FORMATS)}")
+    for extension in (".p12.npy", ".idsz", ".npy", ".png"):
+        if path.endswith(extension):
+            path = path[:-len(extension)]
+            break
+    return path + FORMATS[frame_format]
+
+
+def save_frame(path, image, frame_format="uint16", threads=4):
+    """ Saves image in frame_format and returns the path, with the extension of
+        the format. Integer images are stored as they are (packed12 only takes
+        values of up to 12 bits, see pack12()); float32 converts any image to
+        float32.
+    """
+    path = frame_path(path, frame_format)
+    if frame_format == "float32":
+        np.save(path, np.asarray(image, dtype=np.float32))
+    elif frame_format == "uint16":
+        np.save(path, np.asarray(image, dtype=np.uint16))
+    elif frame_format == "packed12":
+        np.save(path, pack12(image))
+    else:
+        with open(path, 'wb') as frame_file:
+            frame_file.write(compress(image, threads))
+    return path
+
+
+def load_frame(path, mmap=True, threads=4):
+    """ Loads a frame saved by save_frame() (or any .npy). The .npy formats are
+        memory-mapped (read-only) if mmap is True, so only the pixels used are
+        read; packed12 frames are unpacked to uint16.
+    """
+    if path.endswith(FORMATS["compressed"]):
+        with open(path, 'rb') as frame_file:
+            return decompress(frame_file.read(), threads)
+    data = np.load(path, mmap_mode='r' if mmap else None)
+    if path.endswith(FORMATS["packed12"]):
+        return unpack12(data)
+    return data
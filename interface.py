@@ -1,7 +1,74 @@
-from ids_peak import ids_peak
-from ids_peak_ipl import ids_peak_ipl
-from ids_peak import ids_peak_ipl_extension
+try:
+    from ids_peak import ids_peak
+    from ids_peak_ipl import ids_peak_ipl
+    from ids_peak import ids_peak_ipl_extension
+except ImportError:  # Without the IDS SDK, only simulated backends can be used
+    ids_peak = ids_peak_ipl = ids_peak_ipl_extension = None
+import contextlib
+import math
+import threading
+import time
 import warnings
+import weakref
+
+import numpy as np
+
+from packed_formats import RawFrame, bit_depth, is_bayer, packed_size
+from processing import bin_pixels, binned_shape
+from recorder import Recorder, TriggeredRecorder
+from ring_buffer import FrameRingBuffer
+from telemetry import LatencyHistogram, Telemetry, TelemetryExporter
+
+_STOP_POLL_MS = 50  # longest wait of the grabber threads, before checking for a stop
+
+
+class PeakBackend(object):
+    """ Default backend of IDSinterface: the modules of the IDS peak SDK.
+
+        Any object with these three attributes can be used as a backend, as
+        long as they provide the subset of the SDK used by IDSinterface
+        (device manager, devices, datastreams, nodemaps, buffers and the IPL
+        images and conversions). Check simulated_camera.SimulatedBackend.
+    """
+
+    def __init__(self):
+        if ids_peak is None:
+            raise ImportError("IDS peak SDK not found. Install it (check the README) "
+                              "or use a simulated backend.")
+        self.peak = ids_peak
+        self.ipl = ids_peak_ipl
+        self.ipl_extension = ids_peak_ipl_extension
+
+
+class Frame(object):
+    """ A captured frame with the metadata of its buffer, see capture_frame().
+
+        image: the pixels, as returned by capture().
+        timestamp_ns: device timestamp of the frame, in ns.
+        host_time: time.perf_counter() when the buffer was received.
+        frame_id: FrameID of the buffer. Gaps are frames lost on the way.
+        exposure: exposure time in effect [us].
+        gain: gain in effect.
+        incomplete: the buffer was not fully transferred (missing pixels).
+    """
+
+    __slots__ = ("image", "timestamp_ns", "host_time", "frame_id", "exposure", "gain",
+                 "incomplete")
+
+    def __init__(self, image, timestamp_ns, host_time, frame_id, exposure, gain,
+                 incomplete=False):
+        self.image = image
+        self.timestamp_ns = timestamp_ns
+        self.host_time = host_time
+        self.frame_id = frame_id
+        self.exposure = exposure
+        self.gain = gain
+        self.incomplete = incomplete
+
+    def __repr__(self):
+        return (f"Frame(frame_id={self.frame_id}, timestamp_ns={self.timestamp_ns}, "
+                f"shape={getattr(self.image, 'shape', None)}, exposure={self.exposure}, "
+                f"gain={self.gain}, incomplete={self.incomplete})")
 
 
 class IDSinterface(object):
@@ -22,14 +89,20 @@ class IDSinterface(object):
             my_interface.stop()  # Stop the acquisition
             del my_interface  # Close the interface
 
-
+        backend: where devices come from. By default, the IDS peak SDK
+                 (PeakBackend). Use simulated_camera.SimulatedBackend() to work
+                 without cameras.
 
     """
 
-    def __init__(self):
-        ids_peak.Library.Initialize()
+    __peak = None  # until the library is initialized, there is nothing to release
 
-        self.__create_device_manager()
+    def __init__(self, backend=None):
+        backend = backend or PeakBackend()
+        backend.peak.Library.Initialize()
+        self.__peak = backend.peak
+        self.__ipl = backend.ipl
+        self.__ipl_extension = backend.ipl_extension
 
         # We initialize variables as dictionaries to allow multiple devices, key=idx
         self.__devices = {}  # This is just for SELECTED devices, not all wired devices!
@@ -38,17 +111,35 @@ class IDSinterface(object):
         self.__acquisition_ready = {}
         self.__inner_pixel_format = {}
         self.__outer_pixel_format = {}
+        self.__pixel_modes = {}  # idx: (inner mode name, colorness), for raw frames
         self.__resolution = {}
+        self.__buffering = {}  # idx: (buffer_count, buffer_duration), see set_buffering()
+        self.__payload_sizes = {}  # idx: PayloadSize of the announced buffers
+        self.__streams = {}  # idx: _StreamState, only for devices in streaming mode
+        self.__groups = {}  # tuple of idx: _GroupState, see capture_group()
+        self.__recorders = {}  # idx: recorder.Recorder fed by the grabber thread
+        self.__converters = {}  # idx: preallocated ImageConverter
+        self.__output_pools = {}  # idx: [arrays, next_index], see preallocate_conversion()
+        self.__soft_binning = {}  # idx: (factor, mode), when the sensor can't bin
+        self.__binning_scratch = {}  # idx: converted frame before software binning
+        self.__frame_counters = {}  # idx: _FrameCounters, see get_frame_stats()
+        self.__frame_settings = {}  # idx: (exposure, gain) in effect, for capture_frame()
+        self.__telemetry = {}  # idx: telemetry.Telemetry, see enable_telemetry()
+        self.__exporters = {}  # idx: telemetry.TelemetryExporter
+        self.__trigger_modes = {}  # idx: 'off', 'software' or 'line', see set_trigger()
+        self.__trigger_stats = {}  # idx: _TriggerStats, see get_trigger_stats()
+
+        self.__create_device_manager()
 
     def __create_device_manager(self):
 
-        self.__device_manager = ids_peak.DeviceManager.Instance()
+        self.__device_manager = self.__peak.DeviceManager.Instance()
         self.__device_manager.Update()
 
         # Si no hem trobat cap càmera, tallem pel dret!
         if self.__device_manager.Devices().empty():
             self.__destroy()
-            raise ids_peak.NotFoundException("No devices found!")
+            raise self.__peak.NotFoundException("No devices found!")
 
     def __setup_data_stream(self, idx=0):
         """ Setup the data stream for the selected device.
@@ -59,19 +150,20 @@ class IDSinterface(object):
         # Let's set the datastream
         datastreams = device.DataStreams()
         if datastreams.empty():
-            raise ids_peak.NotAvailableException("Device has no DataStream!")
+            raise self.__peak.NotAvailableException("Device has no DataStream!")
         datastream = datastreams[0].OpenDataStream()
         self.__datastreams[idx] = datastream
 
         # let's set the some properties via nodemap and store the nodemap
-        nodemap = device.RemoteDevice().NodeMaps()[0]
+        nodemap = _NodeCache(device.RemoteDevice().NodeMaps()[0], self.__peak.Exception)
+        nodemap.prefetch(_FREQUENT_NODES)
         self.__nodemaps[idx] = nodemap
         # Preparem captures d'imatge contínues
         try:
             nodemap.FindNode("UserSetSelector").SetCurrentEntry("Default")
             nodemap.FindNode("UserSetLoad").Execute()
             nodemap.FindNode("UserSetLoad").WaitUntilDone()
-        except ids_peak.Exception:
+        except self.__peak.Exception:
             # Userset is not available
             pass
 
@@ -87,20 +179,100 @@ class IDSinterface(object):
                                f"Choose one valid: "
                                f"{', '.join(self.print_available_formats(do_print=False))}.")
 
-
         # Allocate and announce image buffers and queue them
-        payload_size = nodemap.FindNode("PayloadSize").Value()
-        buffer_count_max = datastream.NumBuffersAnnouncedMinRequired()
-        for i in range(buffer_count_max):
+        self.__resize_buffer_pool(idx)
+
+    def __resize_buffer_pool(self, idx=0):
+        """ Announces and queues the buffers needed by the buffering settings.
+
+            All the buffers are revoked and allocated again if the PayloadSize
+            changed (pixel format, ROI...), which needs the acquisition stopped.
+            Otherwise, missing buffers are added, even while acquiring.
+        """
+        datastream = self.__datastreams[idx]
+        payload_size = self._get_nodemap(idx).FindNode("PayloadSize").Value()
+        required = self.__required_buffers(idx)
+        acquiring = self.__acquisition_ready.get(idx)
+
+        announced = datastream.NumBuffersAnnounced()
+        if announced and (payload_size != self.__payload_sizes.get(idx) or
+                          (announced > required and not acquiring)):
+            if acquiring:
+                raise RuntimeError("Buffers can't be reallocated while acquiring. "
+                                   "Stop the acquisition before.")
+            datastream.Flush(self.__peak.DataStreamFlushMode_DiscardAll)
+            for buffer in datastream.AnnouncedBuffers():
+                datastream.RevokeBuffer(buffer)
+            announced = 0
+
+        for i in range(required - announced):
             buffer = datastream.AllocAndAnnounceBuffer(payload_size)
             datastream.QueueBuffer(buffer)
+        self.__payload_sizes[idx] = payload_size
 
-    def select_device(self, device_idx):
+    def __required_buffers(self, idx=0):
+        datastream = self.__datastreams[idx]
+        required = datastream.NumBuffersAnnouncedMinRequired()
+        buffer_count, buffer_duration = self.__buffering.get(idx, (None, None))
+        if buffer_count:
+            required = max(required, buffer_count)
+        if buffer_duration:
+            required = max(required, math.ceil(buffer_duration * self.get_fps(idx)))
+        return required
+
+    def set_buffering(self, buffer_count=None, buffer_duration=None, idx=0):
+        """ Sets how many buffers are announced to the driver. By default, just
+            NumBuffersAnnouncedMinRequired, which loses frames at high fps as soon
+            as the processing of a frame takes longer than usual.
+
+            buffer_count: number of buffers.
+            buffer_duration: seconds of frames at the current fps (e.g. 0.5 for
+                             500 ms worth of frames). The pool grows when the
+                             fps is raised.
+
+            The largest of both (and of the minimum required) is used. It can be
+            called before select_device() or at any time after it.
+        """
+        self.__buffering[idx] = (buffer_count, buffer_duration)
+        if idx in self.__payload_sizes:
+            self.__resize_buffer_pool(idx)
+
+    def get_buffer_stats(self, idx=0):
+        """ Live counters of the buffer pool of device idx:
+                announced: buffers allocated and announced to the driver.
+                queued: free buffers waiting for a frame.
+                await_delivery: filled buffers waiting for capture().
+                delivered: frames delivered since the datastream was opened.
+                underruns: frames lost because there was no free buffer.
+                lost: frames lost by the driver, if the device reports them.
+                payload_size: bytes per buffer.
+        """
+        datastream = self.__datastreams.get(idx)
+        if datastream is None:
+            raise RuntimeError(f"Device not selected. Please, select device {idx} before.")
+        try:
+            lost = datastream.NodeMaps()[0].FindNode("StreamLostFrameCount").Value()
+        except self.__peak.Exception:
+            lost = None
+        return {"announced": datastream.NumBuffersAnnounced(),
+                "queued": datastream.NumBuffersQueued(),
+                "await_delivery": datastream.NumBuffersAwaitDelivery(),
+                "delivered": datastream.NumBuffersDelivered(),
+                "underruns": datastream.NumUnderruns(),
+                "lost": lost,
+                "payload_size": self.__payload_sizes.get(idx)}
+
+    def select_device(self, device_idx, buffer_count=None, buffer_duration=None):
         """ Public method to select a device.
             This means, to open the communications to it.
 
             This is the first mandatory method to start working with the camera.
+
+            buffer_count, buffer_duration: size of the buffer pool (check
+                                           set_buffering()).
         """
+        if buffer_count or buffer_duration:
+            self.__buffering[device_idx] = (buffer_count, buffer_duration)
         try:
             device = self.__device_manager.Devices()[device_idx]
         except:
@@ -110,24 +282,35 @@ class IDSinterface(object):
         # Trying to open the camera
         if not device.IsOpenable():
             # self.__destroy()  # we can work with other cams
-            raise ids_peak.NotInitializedException(
+            raise self.__peak.NotInitializedException(
                 f"\n\nDevice {device_idx} could not be opened.\n"
                 f"Could it be in use by another application?\n")
 
-        self.__devices[device_idx] = device.OpenDevice(ids_peak.DeviceAccessType_Control)
+        self.__devices[device_idx] = device.OpenDevice(self.__peak.DeviceAccessType_Control)
 
         # Configure this device
         self.__setup_data_stream(idx=device_idx)
 
-    def set_pixel_format(self, bit_rate=8, colorness=None, idx=0):
+    def set_pixel_format(self, bit_rate=8, colorness=None, idx=0, buffer_count=None,
+                         buffer_duration=None):
         """ bit_rate: 8, 10, 12, 14, 16 bits (IDS cameras only support 8, 10, 12 -I guess-)
             colorness: 'Mono' or 'RGB'
+            buffer_count, buffer_duration: size of the buffer pool (check set_buffering()).
 
             bit_rate and colorness are for the user preferences.
 
             This method will set the optimum inner pixel format to get that preferences,
             and the outer pixel format to get the bit rate and color mode chosen by user.
+
+            If the device is already selected, the new format is applied straight
+            away (restarting the acquisition if needed) and the buffers are
+            reallocated if the payload size changes.
         """
+        if idx in self.__payload_sizes:
+            self.__check_not_recording(idx)
+        if buffer_count or buffer_duration:
+            self.__buffering[idx] = (buffer_count, buffer_duration)
+
         available_inner_modes = {"Mono": ["Mono8", "Mono10g40IDS", "Mono12g24IDS"],
                                  "RGB": ["BayerGR8", "BayerGR10g40IDS", "BayerGR12g24IDS"]}
 
@@ -161,14 +344,376 @@ class IDSinterface(object):
         inner_mode = available_inner_modes[cam_colorness][bit_rate_idx]
         outer_mode = available_outer_modes[colorness][bit_rate_idx]
 
-        self.__inner_pixel_format[idx] = getattr(ids_peak_ipl,
+        self.__inner_pixel_format[idx] = getattr(self.__ipl,
                                                  "PixelFormatName_" + inner_mode)
-        self.__outer_pixel_format[idx] = getattr(ids_peak_ipl,
+        self.__outer_pixel_format[idx] = getattr(self.__ipl,
                                                  "PixelFormatName_" + outer_mode)
+        self.__pixel_modes[idx] = (inner_mode, colorness)
 
         print(f"Pixel formats set to {inner_mode} (internal) and "
               f"{outer_mode} (final image)")
 
+        # Preallocated conversions were built for the previous formats
+        self.__layout_changed(idx)
+
+        if idx in self.__payload_sizes:  # buffers already announced
+            with self.__acquisition_paused(idx):
+                self._get_nodemap(idx).FindNode("PixelFormat").SetCurrentEntry(
+                    self.__inner_pixel_format[idx])
+
+    def get_pixel_format(self, idx=0):
+        """ Returns the names of the (internal, final image) pixel formats of device idx. """
+        if idx not in self.__outer_pixel_format:
+            raise RuntimeError(f"No pixel format set for device {idx}. "
+                               f"Call set_pixel_format() before.")
+        outer_format = self.__ipl.PixelFormat(self.__outer_pixel_format[idx])
+        return self.__pixel_modes[idx][0], outer_format.Name()
+
+    def get_bit_depth(self, idx=0):
+        """ Bits per channel of the frames of device idx (in the low bits of
+            uint16 frames, for 10 and 12 bits).
+        """
+        return bit_depth(self.get_pixel_format(idx)[0])
+
+    def __layout_changed(self, idx=0):
+        """ Drops everything that depends on the size or format of the frames. """
+        if idx in self.__nodemaps:
+            self.__nodemaps[idx].invalidate()
+        self.__converters.pop(idx, None)
+        self.__output_pools.pop(idx, None)
+        self.__binning_scratch.pop(idx, None)
+
+    @contextlib.contextmanager
+    def __acquisition_paused(self, idx=0, layout=True):
+        """ Stops the acquisition (if running) to change critical parameters, then
+            reallocates the buffers if the payload changed and restarts it.
+
+            Streaming and recording are suspended meanwhile and resumed after,
+            with the same sinks. If the frame layout changed, the grabber writes
+            to a new ring of the same size (see get_stream_ring()). A recording
+            can't change its layout, so layout=True raises while recording.
+        """
+        if layout:
+            self.__check_not_recording(idx)
+        stream = self.__suspend_streaming(idx)
+        recorder = self.__recorders.pop(idx, None)  # its sink stays in the stream
+        was_acquiring = self.__acquisition_ready.get(idx)
+        try:
+            if was_acquiring:
+                self.stop_acquisition(idx)
+            try:
+                yield
+            finally:
+                self.__layout_changed(idx)
+                self.__resize_buffer_pool(idx)
+                if was_acquiring:
+                    self.start_acquisition(idx)
+        finally:
+            if recorder is not None:
+                self.__recorders[idx] = recorder
+            if stream is not None:
+                self.__resume_streaming(idx, stream)
+
+    def __check_not_recording(self, idx):
+        if idx in self.__recorders:
+            raise RuntimeError(f"Device {idx} is recording. Stop the recording before "
+                               f"changing the layout of its frames.")
+
+    def __suspend_streaming(self, idx):
+        """ Stops the grabber thread of idx, keeping its recording. Returns its
+            stream, to resume it, or None if it was not streaming.
+        """
+        stream = self.__streams.get(idx)
+        if stream is None:
+            return None
+        stream.stop_event.set()  # seen within _STOP_POLL_MS
+        stream.thread.join()
+        del self.__streams[idx]
+        if stream.error is not None:
+            raise RuntimeError(f"Grabber of device {idx} failed.") from stream.error
+        return stream
+
+    def __resume_streaming(self, idx, stream):
+        """ Starts again a stream of __suspend_streaming(), into a new ring if
+            the frame layout changed, and restarts the pairing of its groups.
+        """
+        if not self.__acquisition_ready.get(idx):  # the acquisition failed to restart
+            self.__notify_stopped(stream)
+            return
+        if stream.raw:
+            shape, dtype = (self.get_raw_size(idx),), np.dtype(np.uint8)
+        else:
+            shape, dtype = self.get_frame_layout(idx)
+        if stream.ring.shape != tuple(shape) or stream.ring.dtype != np.dtype(dtype):
+            stream.ring = FrameRingBuffer(stream.ring.size, shape, dtype)
+        stream.last_frame_id = None
+        self.__start_grabber(idx, stream)
+        for idxs, group in self.__groups.items():
+            if idx in idxs:
+                group.cursors = {i: self.__streams[i].ring.write_count
+                                 for i in idxs if i in self.__streams}
+
+    def set_roi(self, x=0, y=0, width=None, height=None, idx=0):
+        """ Sets the region of interest read out by the sensor, so only those
+            pixels are transferred and the maximum fps rises. Values are rounded
+            down to the increments allowed by the camera. By default (or with
+            width=None and height=None), the full sensor.
+
+            The acquisition is stopped and restarted if needed, and the buffers
+            are reallocated. Streaming goes on into a ring of the new size;
+            recording must be stopped before. Coordinates are in (binned)
+            pixels of the sensor. Returns the (x, y, width, height) actually set.
+        """
+        nodemap = self._get_nodemap(idx)
+        with self.__acquisition_paused(idx):
+            # Offsets to the minimum first, so any size is valid
+            self.__set_aligned(nodemap.FindNode("OffsetX"), 0)
+            self.__set_aligned(nodemap.FindNode("OffsetY"), 0)
+            width_node = nodemap.FindNode("Width")
+            height_node = nodemap.FindNode("Height")
+            width = self.__set_aligned(width_node, width or width_node.Maximum())
+            height = self.__set_aligned(height_node, height or height_node.Maximum())
+            x = self.__set_aligned(nodemap.FindNode("OffsetX"), x)
+            y = self.__set_aligned(nodemap.FindNode("OffsetY"), y)
+        return x, y, width, height
+
+    def get_roi(self, idx=0):
+        """ Returns the (x, y, width, height) region of interest of the sensor. """
+        nodemap = self._get_nodemap(idx)
+        return (nodemap.FindNode("OffsetX").Value(), nodemap.FindNode("OffsetY").Value(),
+                nodemap.FindNode("Width").Value(), nodemap.FindNode("Height").Value())
+
+    @staticmethod
+    def __set_aligned(node, value):
+        """ Sets value rounded down to the increment and clipped to the limits. """
+        minimum, maximum, increment = node.Minimum(), node.Maximum(), node.Increment()
+        value = max(minimum, min(maximum, int(value)))
+        value = minimum + (value - minimum) // increment * increment
+        node.SetValue(value)
+        return value
+
+    def set_binning(self, factor=1, mode="average", idx=0):
+        """ Bins factor x factor pixels into one, averaging ('average') or adding
+            ('sum') them.
+
+            It is done by the camera if it supports that factor, cutting the USB
+            bandwidth and raising the maximum fps. Otherwise, capture() bins the
+            converted frames in software (true averaging, not decimation).
+            Streaming goes on into a ring of the new size; recording must be
+            stopped before. Returns True if the binning is done by the camera.
+        """
+        if mode not in ("average", "sum"):
+            raise ValueError(f"{mode} : Binning mode not supported. Choose one valid: "
+                             f"average, sum")
+        nodemap = self._get_nodemap(idx)
+        hardware = True
+        with self.__acquisition_paused(idx):
+            try:
+                try:
+                    nodemap.FindNode("BinningSelector").SetCurrentEntry("Region0")
+                except self.__peak.Exception:
+                    pass  # single binning engine
+                for direction in ("Horizontal", "Vertical"):
+                    try:
+                        nodemap.FindNode(f"Binning{direction}Mode").SetCurrentEntry(
+                            mode.capitalize())
+                    except self.__peak.Exception:
+                        if mode != "sum":
+                            raise
+                    nodemap.FindNode(f"Binning{direction}").SetValue(factor)
+            except self.__peak.Exception:
+                hardware = False
+                for direction in ("Horizontal", "Vertical"):
+                    try:
+                        nodemap.FindNode(f"Binning{direction}").SetValue(1)
+                    except self.__peak.Exception:
+                        pass
+            if hardware or factor == 1:
+                self.__soft_binning.pop(idx, None)
+            else:
+                self.__soft_binning[idx] = (factor, mode)
+        return hardware
+
+    def set_reverse(self, reverse_x=False, reverse_y=False, idx=0):
+        """ Mirrors the readout of the sensor horizontally (reverse_x) and/or
+            vertically (reverse_y), so the frames come already flipped, at no
+            cost. The acquisition is stopped and restarted if needed, and so
+            are streaming and recording.
+
+            Returns (reverse_x, reverse_y) as done by the camera. Flips it can't
+            do are False (no ReverseX/ReverseY node, or a Bayer sensor, whose
+            pattern would change), and must be done in software.
+        """
+        nodemap = self._get_nodemap(idx)
+        inner_mode = self.__pixel_modes.get(idx, ("Mono8", None))[0]
+        done = [False, False]
+        with self.__acquisition_paused(idx, layout=False):
+            for i, (name, value) in enumerate([("ReverseX", reverse_x),
+                                               ("ReverseY", reverse_y)]):
+                value = bool(value) and not is_bayer(inner_mode)
+                try:
+                    nodemap.FindNode(name).SetValue(value)
+                except self.__peak.Exception:
+                    continue
+                done[i] = value
+        return tuple(done)
+
+    def get_reverse(self, idx=0):
+        """ Returns (reverse_x, reverse_y) of the sensor, see set_reverse(). """
+        nodemap = self._get_nodemap(idx)
+        reverse = []
+        for name in ("ReverseX", "ReverseY"):
+            try:
+                reverse.append(bool(nodemap.FindNode(name).Value()))
+            except self.__peak.Exception:
+                reverse.append(False)
+        return tuple(reverse)
+
+    def set_trigger(self, mode="off", line=0, activation="RisingEdge", idx=0):
+        """ Sets how the exposures of device idx start:
+                'off': free running at the frame rate (the default).
+                'software': one frame per send_trigger() call.
+                'line': one frame per edge on the input line (e.g. 0 for Line0),
+                        of the given activation ('RisingEdge' or 'FallingEdge').
+            The acquisition is stopped and restarted if needed, and so are
+            streaming and recording.
+        """
+        if mode not in ("off", "software", "line"):
+            raise ValueError(f"{mode} : Trigger mode not supported. Choose one valid: "
+                             f"off, software, line")
+        nodemap = self._get_nodemap(idx)
+        with self.__acquisition_paused(idx, layout=False):
+            nodemap.FindNode("TriggerSelector").SetCurrentEntry("ExposureStart")
+            if mode != "off":
+                source = "Software" if mode == "software" else f"Line{line}"
+                nodemap.FindNode("TriggerSource").SetCurrentEntry(source)
+                if mode == "line":
+                    nodemap.FindNode("TriggerActivation").SetCurrentEntry(activation)
+            nodemap.FindNode("TriggerMode").SetCurrentEntry("Off" if mode == "off" else "On")
+        self.__trigger_modes[idx] = mode
+
+    def get_trigger(self, idx=0):
+        """ Returns the trigger mode set by set_trigger(): 'off', 'software' or 'line'. """
+        return self.__trigger_modes.get(idx, "off")
+
+    def send_trigger(self, idx=0):
+        """ Triggers an exposure of device idx (in 'software' trigger mode).
+            Returns the time.perf_counter() when it was sent.
+        """
+        if self.__trigger_modes.get(idx) != "software":
+            raise RuntimeError(f"Device {idx} is not in software trigger mode. "
+                               f"Call set_trigger('software', idx={idx}) before.")
+        sent = time.perf_counter()
+        self._get_nodemap(idx).FindNode("TriggerSoftware").Execute()
+        self.__get_trigger_stats(idx).triggers += 1
+        return sent
+
+    def capture_burst(self, n, idx=0, out=None, timeout=1., flush=True):
+        """ Captures n consecutive frames of device idx into out, a preallocated
+            (n,) + frame shape array (see get_frame_layout()), or a new one.
+            Returns out.
+
+            In 'software' trigger mode, it sends the triggers itself: the next
+            one as soon as a frame arrives, so the sensor exposes it while the
+            previous one is converted. In 'line' mode, it waits for n external
+            triggers, and in 'off' mode, it takes the next n frames.
+
+            timeout: seconds to wait for every frame.
+            flush: discard the frames already waiting (taken before the call).
+        """
+        if not self.__acquisition_ready[idx]:
+            raise RuntimeError("Acquisition not ready. Start acquisition before capture.")
+        if idx in self.__streams:
+            raise RuntimeError(f"Device {idx} is streaming. Use get_latest_frame() "
+                               f"or get_next_frame() instead.")
+        shape, dtype = self.get_frame_layout(idx)
+        if out is None:
+            out = np.empty((n,) + tuple(shape), dtype)
+        elif out.shape != (n,) + tuple(shape) or out.dtype != dtype:
+            raise ValueError(f"The output array must be {(n,) + tuple(shape)} {dtype}, "
+                             f"not {out.shape} {out.dtype}.")
+
+        datastream = self.__datastreams[idx]
+        if flush:
+            self.__discard_finished(idx)
+        stats = self.__get_trigger_stats(idx)
+        software = self.__trigger_modes.get(idx) == "software"
+        sent = self.send_trigger(idx) if software and n else None
+        previous_timestamp = None
+        for i in range(n):
+            try:
+                buff = self.__wait_buffer(idx, int(timeout * 1000))
+            except self.__peak.TimeoutException:
+                stats.timeouts += 1
+                raise RuntimeError(f"Frame {i} of the burst of device {idx} did not "
+                                   f"arrive within {timeout} s.") from None
+            host_time = time.perf_counter()
+            next_sent = None
+            try:
+                if software and i + 1 < n:
+                    next_sent = self.send_trigger(idx)
+                self.__count_frame(buff, idx, host_time)
+                timestamp = buff.Timestamp_ns()
+                self.__convert_buffer_to_output(buff, out[i], idx)
+            finally:
+                datastream.QueueBuffer(buff)
+
+            stats.frames += 1
+            if sent is not None:
+                stats.latency.record(host_time - sent)
+            if previous_timestamp is not None:
+                stats.add_interval((timestamp - previous_timestamp) * 1e-9)
+            previous_timestamp = timestamp
+            sent = next_sent
+        stats.bursts += 1
+        return out
+
+    def get_trigger_stats(self, idx=0):
+        """ Statistics of the triggered captures of device idx:
+                triggers: software triggers sent.
+                bursts, frames: bursts and frames captured by capture_burst().
+                timeouts: frames of a burst that never arrived.
+                latency: from send_trigger() to the frame received (exposure,
+                         readout and transfer), summary in seconds.
+                interval: between consecutive frames of a burst, by the device
+                          timestamps, summary in seconds.
+                jitter: standard deviation of the interval, in seconds.
+        """
+        stats = self.__get_trigger_stats(idx)
+        return {"triggers": stats.triggers, "bursts": stats.bursts, "frames": stats.frames,
+                "timeouts": stats.timeouts, "latency": stats.latency.summary(),
+                "interval": stats.interval.summary(), "jitter": stats.jitter()}
+
+    def reset_trigger_stats(self, idx=0):
+        self.__trigger_stats[idx] = _TriggerStats()
+
+    def __get_trigger_stats(self, idx):
+        stats = self.__trigger_stats.get(idx)
+        if stats is None:
+            stats = self.__trigger_stats[idx] = _TriggerStats()
+        return stats
+
+    def __wait_buffer(self, idx, timeout_ms):
+        """ WaitForFinishedBuffer() of device idx. A KillWait() that found no
+            wait to abort stays pending and aborts the next one: that stale
+            abort is absorbed once.
+        """
+        datastream = self.__datastreams[idx]
+        try:
+            return datastream.WaitForFinishedBuffer(timeout_ms)
+        except self.__peak.AbortedException:
+            return datastream.WaitForFinishedBuffer(timeout_ms)
+
+    def __discard_finished(self, idx=0):
+        """ Queues again the buffers already filled, without reading them. """
+        datastream = self.__datastreams[idx]
+        while True:
+            try:
+                buff = self.__wait_buffer(idx, 0)
+            except self.__peak.TimeoutException:
+                return
+            datastream.QueueBuffer(buff)
+
     def start_acquisition(self, idx=0):
         """ Starting the acquisition of images with the selected parameters.
         """
@@ -183,10 +728,12 @@ class IDSinterface(object):
         except Exception as e:
             raise e
 
+        self.__get_frame_counters(idx).last_frame_id = None
         self.__acquisition_ready[idx] = True
 
     def stop_acquisition(self, idx=0):
         """Comença la captura contínua d'imatges amb els paràmetres seleccionats."""
+        self.stop_streaming(idx)
         nodemap_remote_device = self._get_nodemap(idx=idx)
         datastream = self.__datastreams[idx]
         try:
@@ -200,6 +747,9 @@ class IDSinterface(object):
 
         self.__acquisition_ready[idx] = False
 
+    def is_acquiring(self, idx=0):
+        return bool(self.__acquisition_ready.get(idx))
+
     def __stop_all_acquisitiona(self):
         if not self.__devices:
             return
@@ -212,18 +762,21 @@ class IDSinterface(object):
             raise e
 
     def release_device(self, idx=0):
+        self.stop_streaming(idx)
+        self.disable_telemetry(idx)
         remote_nodemap = self._get_nodemap(idx=idx)
         remote_nodemap.FindNode("AcquisitionStop").Execute()
-        # Stop and flush datastream
-        self.__datastreams[idx].KillWait()
-        self.__datastreams[idx].StopAcquisition(ids_peak.AcquisitionStopMode_Default)
-        self.__datastreams[idx].Flush(ids_peak.DataStreamFlushMode_DiscardAll)
+        # Stop and flush datastream (nobody waits on it: no KillWait(), it would
+        # stay pending and abort the next wait)
+        self.__datastreams[idx].StopAcquisition(self.__peak.AcquisitionStopMode_Default)
+        self.__datastreams[idx].Flush(self.__peak.DataStreamFlushMode_DiscardAll)
         # Unlock parameters after acquisition stop
         if self.__nodemaps[idx] is not None:
             try:
                 self.__nodemaps[idx].FindNode("TLParamsLocked").SetValue(0)
             except Exception as e:
                 raise e
+            self.__nodemaps[idx].invalidate()
 
     def select_and_start_device(self, device_idx=0):
         """ Shortcut to select a device and start its acquisition.
@@ -244,6 +797,9 @@ class IDSinterface(object):
     def get_devices_names(self):
         return [x.ModelName() for x in self.get_devices()]
 
+    def get_serial_number(self, idx=0):
+        return self._get_device(idx).SerialNumber()
+
     def _get_device(self, idx=0):
         device = self.__devices.get(idx)
         if device is None:
@@ -284,18 +840,16 @@ class IDSinterface(object):
     def set_gain(self, gain: float, idx=0):
         """ Intenta configurar el gain de la càmera. """
         nodemap_remote_device = self._get_nodemap(idx)
-        try:
-            target_gain = max(gain, 1)  # must be greater than or equal 1
-            nodemap_remote_device.FindNode("Gain").SetValue(target_gain)
-        except ids_peak.Exception as e:
-            raise e
+        target_gain = max(gain, 1)  # must be greater than or equal 1
+        nodemap_remote_device.FindNode("Gain").SetValue(target_gain)
+        self.__settings_changed(idx)
 
     def get_gain(self, idx=0):
         """Retorna el gain actual amb què treballa la càmera. """
         nodemap_remote_device = self._get_nodemap(idx)
         try:
             current_gain = nodemap_remote_device.FindNode("Gain").Value()
-        except ids_peak.Exception as e:
+        except self.__peak.Exception as e:
             raise e
         return current_gain
 
@@ -303,53 +857,121 @@ class IDSinterface(object):
         """Intenta configurar les imatges per segon que la càmera capturarà, fins el màxim establert
         per la pròpia càmera."""
         nodemap_remote_device = self._get_nodemap(idx=idx)
-        curr_exp = self.get_exposure_time(idx=idx)
+        curr_exp = nodemap_remote_device.value("ExposureTime")
         if curr_exp > 1e6/fps:
-            self.set_exposure_time(1e6/fps, idx=idx)
-        try:
-            max_fps = nodemap_remote_device.FindNode("AcquisitionFrameRate").Maximum()
-            target_fps = min(max_fps, fps)
-            nodemap_remote_device.FindNode("AcquisitionFrameRate").SetValue(target_fps)
-        except ids_peak.Exception as e:
-            raise e
+            self.__set_clipped(nodemap_remote_device, "ExposureTime", 1e6/fps)
+        self.__set_clipped(nodemap_remote_device, "AcquisitionFrameRate", fps)
+        if self.__buffering.get(idx, (None, None))[1]:  # buffering by duration
+            self.__resize_buffer_pool(idx)
+        self.__settings_changed(idx)
 
     def get_fps(self, idx=0):
         """Retorna els fps actuals amb els què treballa la càmera."""
         nodemap_remote_device = self._get_nodemap(idx=idx)
         try:
             current_fps = nodemap_remote_device.FindNode("AcquisitionFrameRate").Value()
-        except ids_peak.Exception as e:
+        except self.__peak.Exception as e:
             raise e
         return current_fps
 
     def set_max_fps(self, idx=0):
         """ Intenta configurar el fps màxim de la càmera. """
         nodemap_remote_device = self._get_nodemap(idx=idx)
-        exp_time = self.get_exposure_time(idx=idx)
-        try:
-            max_fps = nodemap_remote_device.FindNode("AcquisitionFrameRate").Maximum()
-            target_fps = min(1e6/exp_time, max_fps)
-            nodemap_remote_device.FindNode("AcquisitionFrameRate").SetValue(target_fps)
-        except ids_peak.Exception as e:
-            raise e
+        exp_time = nodemap_remote_device.value("ExposureTime")
+        self.__set_clipped(nodemap_remote_device, "AcquisitionFrameRate", 1e6/exp_time)
+        if self.__buffering.get(idx, (None, None))[1]:  # buffering by duration
+            self.__resize_buffer_pool(idx)
+        self.__settings_changed(idx)
 
     def set_exposure_time(self, etime: float, idx=0):
         nodemap_remote_device = self._get_nodemap(idx=idx)
+        # Hem d'assegurar que el temps es trobi entre el mínim i màxim d'exposició actuals de la càmera
+        self.__set_clipped(nodemap_remote_device, "ExposureTime", etime)
+        self.__settings_changed(idx)
+
+    @staticmethod
+    def __set_clipped(nodemap, name, value):
+        """ Sets the node clipped to its (cached) limits, and forgets the limits
+            of the nodes depending on it. Returns the value requested.
+        """
+        minimum, maximum = nodemap.limits(name)
+        value = max(minimum, min(maximum, value))
+        nodemap.FindNode(name).SetValue(value)
+        nodemap.forget_limits(_DEPENDENT_LIMITS.get(name, ()))
+        return value
+
+    def apply_settings(self, idx=0, fps=None, exposure=None, gain=None, roi=None,
+                       max_fps=False):
+        """ Applies several settings at once and returns the ones in effect, as a
+            dict with fps, exposure [us], gain and roi (x, y, width, height).
+
+            The writes are ordered so no setting is clipped by the old value of
+            another one: the ROI first (it limits the fps), then the exposure and
+            the fps in the order that keeps exposure <= 1e6/fps all the way.
+            When both are given and don't fit, the fps wins and the exposure is
+            shortened, as set_fps does. With max_fps=True (and no fps), the fps
+            is raised to the maximum allowed by the exposure afterwards.
+            Any setting left to None is not changed.
+
+            If a write fails, the ones done before stay: RuntimeError, with the
+            settings in effect, from the error of the camera.
+        """
+        nodemap = self._get_nodemap(idx)
         try:
-            # Hem d'assegurar que el temps es trobi entre el mínim i màxim d'exposició actuals de la càmera
-            minexp = nodemap_remote_device.FindNode("ExposureTime").Minimum()
-            maxexp = nodemap_remote_device.FindNode("ExposureTime").Maximum()
-            target_exposure = max(minexp, min(maxexp, etime))
-            nodemap_remote_device.FindNode("ExposureTime").SetValue(target_exposure)
-        except ids_peak.Exception as e:
-            raise e
+            if roi is not None:
+                self.set_roi(*roi, idx=idx)
+            if fps is not None or exposure is not None:
+                current_exposure = nodemap.value("ExposureTime")
+                if fps is None:
+                    self.__set_clipped(nodemap, "ExposureTime", exposure)
+                else:
+                    if exposure is None:
+                        exposure = current_exposure
+                    exposure = min(exposure, 1e6/fps)
+                    if exposure <= current_exposure:
+                        self.__set_clipped(nodemap, "ExposureTime", exposure)
+                        self.__set_clipped(nodemap, "AcquisitionFrameRate", fps)
+                    else:
+                        self.__set_clipped(nodemap, "AcquisitionFrameRate", fps)
+                        self.__set_clipped(nodemap, "ExposureTime", exposure)
+            if max_fps and fps is None:
+                self.__set_clipped(nodemap, "AcquisitionFrameRate",
+                                   1e6/nodemap.value("ExposureTime"))
+            if gain is not None:
+                self.__set_clipped(nodemap, "Gain", max(gain, 1))
+        except Exception as e:
+            self.__settings_changed(idx)  # some of them may have changed
+            raise RuntimeError(f"Settings of device {idx} not fully applied, now they "
+                               f"are {self.get_settings(idx)}: {e}") from e
+        if (fps is not None or exposure is not None or max_fps or roi is not None) \
+                and self.__buffering.get(idx, (None, None))[1]:  # buffering by duration
+            self.__resize_buffer_pool(idx)
+        self.__settings_changed(idx)
+
+        return self.get_settings(idx)
+
+    def get_settings(self, idx=0):
+        """ Returns the fps, exposure [us], gain and roi (x, y, width, height)
+            of device idx, as a dict.
+        """
+        nodemap = self._get_nodemap(idx)
+        return {"fps": nodemap.value("AcquisitionFrameRate"),
+                "exposure": nodemap.value("ExposureTime"),
+                "gain": nodemap.value("Gain"),
+                "roi": self.get_roi(idx)}
+
+    def __settings_changed(self, idx=0):
+        self.__frame_settings.pop(idx, None)
+        recorder = self.__recorders.get(idx)
+        if recorder is not None:
+            recorder.update_settings(**self.get_settings(idx))
 
     def get_exposure_time(self, idx=0):
         """Retorna el temps d'exposició actual de la càmera, en microsegons."""
         nodemap_remote_device = self._get_nodemap(idx=idx)
         try:
             current_etime = nodemap_remote_device.FindNode("ExposureTime").Value()
-        except ids_peak.Exception as e:
+        except self.__peak.Exception as e:
             raise e
         return current_etime
 
@@ -360,26 +982,341 @@ class IDSinterface(object):
         try:
             width = nodemap_remote_device.FindNode("Width").Value()
             height = nodemap_remote_device.FindNode("Height").Value()
-        except ids_peak.Exception as e:
+        except self.__peak.Exception as e:
             raise e
         return width, height
 
+    def get_frame_layout(self, idx=0):
+        """ Returns the (shape, dtype) of the arrays returned by capture(). """
+        shape, dtype = self.__converted_layout(idx)
+        if idx in self.__soft_binning:
+            shape = binned_shape(shape, self.__soft_binning[idx][0])
+        return shape, dtype
+
+    def __converted_layout(self, idx=0):
+        """ (shape, dtype) of the frames converted to the outer pixel format. """
+        width, height = self.get_resolution(idx=idx)
+        pixel_format = self.__ipl.PixelFormat(self.__outer_pixel_format[idx])
+        channels = pixel_format.NumChannels()
+        shape = (height, width) if channels == 1 else (height, width, channels)
+        if pixel_format.NumSignificantBitsPerChannel() <= 8:
+            dtype = np.uint8
+        else:
+            dtype = np.uint16
+        return shape, np.dtype(dtype)
+
     def capture(self, idx=0, binning=1, force8bit=False):
+        """ Captures an image as a numpy array.
+
+            binning: averages binning x binning blocks of pixels in software, on
+                     top of the binning set with set_binning().
+        """
         if not self.__acquisition_ready[idx]:
             raise RuntimeError("Acquisition not ready. Start acquisition before capture.")
+        if idx in self.__streams:
+            raise RuntimeError(f"Device {idx} is streaming. Use get_latest_frame() "
+                               f"or get_next_frame() instead.")
 
+        pool = self.__output_pools.get(idx)
+        if pool is not None and not force8bit and binning == 1:
+            arrays, next_index = pool
+            pool[1] = (next_index + 1) % len(arrays)
+            return self.capture_into(arrays[next_index], idx)
+
+        factor, mode = self.__soft_binning.get(idx, (1, "average"))
+        factor *= binning
+
+        telemetry = self.__telemetry.get(idx)
         datastream = self.__datastreams[idx]
+        start = time.perf_counter() if telemetry else 0
         # Recuperem el buffer directament de la càmera
-        buff = datastream.WaitForFinishedBuffer(500)
+        buff = self.__wait_buffer(idx, 500)
+        lap = telemetry.lap("wait", start) if telemetry else 0
 
+        try:
+            self.__count_frame(buff, idx, lap)
+            image_array = self.__convert_buffer(buff, idx, force8bit, telemetry)
+            lap = time.perf_counter() if telemetry else 0
+            if factor > 1:
+                image_array = bin_pixels(image_array, factor, mode)
+                if telemetry:
+                    telemetry.lap("binning", lap)
+            else:
+                image_array = image_array.copy()
+                if telemetry:
+                    telemetry.lap("copy", lap)
+        finally:
+            # Indiquem que el búffer es pot tornar a utilitzar
+            datastream.QueueBuffer(buff)
+
+        if telemetry:
+            telemetry.lap("total", start)
+        return image_array
+
+    def capture_into(self, out, idx=0):
+        """ Captures an image and writes it straight into out, a C-contiguous
+            array with the shape and dtype given by get_frame_layout(idx).
+
+            No memory is allocated per frame when the conversion is preallocated
+            (see preallocate_conversion()). Returns out.
+        """
+        if not self.__acquisition_ready[idx]:
+            raise RuntimeError("Acquisition not ready. Start acquisition before capture.")
+        if idx in self.__streams:
+            raise RuntimeError(f"Device {idx} is streaming. Use get_latest_frame() "
+                               f"or get_next_frame() instead.")
+
+        telemetry = self.__telemetry.get(idx)
+        datastream = self.__datastreams[idx]
+        start = time.perf_counter() if telemetry else 0
+        buff = self.__wait_buffer(idx, 500)
+        lap = telemetry.lap("wait", start) if telemetry else 0
+        try:
+            self.__count_frame(buff, idx, lap)
+            self.__convert_buffer_to_output(buff, out, idx, telemetry)
+        finally:
+            datastream.QueueBuffer(buff)
+
+        if telemetry:
+            telemetry.lap("total", start)
+        return out
+
+    def capture_frame(self, idx=0, out=None):
+        """ Captures a Frame: the image (as capture_into() would write it into
+            out, or into a new array) along with its device timestamp, host
+            receive time, frame ID, exposure and gain in effect, and whether the
+            buffer is incomplete.
+
+            Every capture updates the counters of get_frame_stats().
+        """
+        if not self.__acquisition_ready[idx]:
+            raise RuntimeError("Acquisition not ready. Start acquisition before capture.")
+        if idx in self.__streams:
+            raise RuntimeError(f"Device {idx} is streaming. Use get_latest_frame() "
+                               f"or get_next_frame() instead.")
+        if out is None:
+            out = np.empty(*self.get_frame_layout(idx))
+
+        telemetry = self.__telemetry.get(idx)
+        datastream = self.__datastreams[idx]
+        start = time.perf_counter() if telemetry else 0
+        buff = self.__wait_buffer(idx, 500)
+        host_time = time.perf_counter()
+        if telemetry:
+            telemetry.lap("wait", start)
+        try:
+            frame_id, incomplete = self.__count_frame(buff, idx, host_time)
+            timestamp = buff.Timestamp_ns()
+            self.__convert_buffer_to_output(buff, out, idx, telemetry)
+        finally:
+            datastream.QueueBuffer(buff)
+
+        if telemetry:
+            telemetry.lap("total", start)
+        exposure, gain = self.__get_frame_settings(idx)
+        return Frame(out, timestamp, host_time, frame_id, exposure, gain, incomplete)
+
+    def get_frame_stats(self, idx=0):
+        """ Running counters of the frames received from device idx, by any of
+            the capture methods or the grabber thread:
+                received: frames received.
+                lost: frames missing between them (FrameID gaps), lost by the
+                      camera, the driver or for lack of free buffers.
+                incomplete: frames received with missing pixels.
+                last_frame_id: FrameID of the last frame received.
+        """
+        counters = self.__get_frame_counters(idx)
+        return {"received": counters.received,
+                "lost": counters.lost,
+                "incomplete": counters.incomplete,
+                "last_frame_id": counters.last_frame_id}
+
+    def reset_frame_stats(self, idx=0):
+        """ Sets the counters of get_frame_stats() to zero. """
+        self.__frame_counters[idx] = _FrameCounters()
+
+    def enable_telemetry(self, idx=0, export_path=None, interval=1., export_format="jsonl",
+                         fps_window=100):
+        """ Starts timing every stage of the captures of device idx (wait for the
+            buffer, buffer_to_image, convert, get_numpy, copy, binning, sinks
+            and total) in fixed-memory histograms, read with get_stats().
+
+            export_path: if given, a thread writes get_stats() there every
+                         interval seconds, as JSON lines or, with
+                         export_format='prometheus', as Prometheus text.
+            fps_window: frames over which the effective fps is measured.
+
+            Calling it again starts from scratch.
+        """
+        self.disable_telemetry(idx)
+        self.__telemetry[idx] = Telemetry(fps_window)
+        if export_path is not None:
+            # a weak reference, so the exporter thread doesn't keep the interface
+            # (and the cameras) alive: __del__ stops it
+            cameras = weakref.ref(self)
+
+            def get_stats():
+                alive = cameras()
+                return {} if alive is None else {idx: alive.get_stats(idx)}
+
+            self.__exporters[idx] = TelemetryExporter(export_path, get_stats, interval,
+                                                      export_format)
+
+    def disable_telemetry(self, idx=0):
+        """ Stops the telemetry of device idx (and its export, after a last one). """
+        exporter = self.__exporters.pop(idx, None)
+        if exporter is not None:
+            exporter.close()
+        self.__telemetry.pop(idx, None)
+
+    def get_stats(self, idx=0):
+        """ Performance counters of device idx, as a dict:
+                fps: effective frame rate over the last frames (with telemetry).
+                stages: {stage: latency summary in seconds (count, mean, min,
+                        max, p50, p90, p99, p999)}, with telemetry enabled.
+                frames: counters of get_frame_stats().
+                buffers: driver-side queue depth and drops, see get_buffer_stats().
+                stream: counters of get_stream_stats(), while streaming.
+        """
+        telemetry = self.__telemetry.get(idx)
+        stats = telemetry.summary() if telemetry else {"fps": None, "stages": {}}
+        stats["frames"] = self.get_frame_stats(idx)
+        stats["buffers"] = self.get_buffer_stats(idx)
+        if idx in self.__streams:
+            stats["stream"] = self.get_stream_stats(idx)
+        return stats
+
+    def __get_frame_counters(self, idx):
+        counters = self.__frame_counters.get(idx)
+        if counters is None:
+            counters = self.__frame_counters[idx] = _FrameCounters()
+        return counters
+
+    def __count_frame(self, buff, idx=0, host_time=None):
+        """ Counts a received buffer. Returns its (frame_id, incomplete). """
+        frame_id = buff.FrameID()
+        incomplete = bool(buff.IsIncomplete())
+        self.__get_frame_counters(idx).count(frame_id, incomplete)
+        telemetry = self.__telemetry.get(idx)
+        if telemetry:
+            telemetry.frame(host_time or time.perf_counter())
+        return frame_id, incomplete
+
+    def __get_frame_settings(self, idx=0):
+        """ (exposure, gain) in effect, read from the camera only after a change. """
+        settings = self.__frame_settings.get(idx)
+        if settings is None:
+            nodemap = self._get_nodemap(idx)
+            settings = (nodemap.value("ExposureTime"), nodemap.value("Gain"))
+            self.__frame_settings[idx] = settings
+        return settings
+
+    def __convert_buffer_to_output(self, buff, out, idx=0, telemetry=None):
+        """ Converts a finished buffer into out, binning it in software if needed. """
+        if idx not in self.__soft_binning:
+            self.__convert_buffer_into(buff, out, idx, telemetry)
+            return
+        scratch = self.__binning_scratch.get(idx)
+        if scratch is None:
+            scratch = np.empty(*self.__converted_layout(idx))
+            self.__binning_scratch[idx] = scratch
+        self.__convert_buffer_into(buff, scratch, idx, telemetry)
+        lap = time.perf_counter() if telemetry else 0
+        factor, mode = self.__soft_binning[idx]
+        bin_pixels(scratch, factor, mode, out)
+        if telemetry:
+            telemetry.lap("binning", lap)
+
+    def capture_raw(self, idx=0, out=None):
+        """ Captures the raw packed buffer (in the inner pixel format) without
+            converting it, so the acquisition thread is free straight away.
+
+            It returns a packed_formats.RawFrame. Call its decode() method, or
+            submit it to a packed_formats.RawDecoderPool, to get the same image
+            that capture() would return. out is an optional uint8 array of
+            get_raw_size(idx) bytes to copy the buffer into.
+        """
+        if not self.__acquisition_ready[idx]:
+            raise RuntimeError("Acquisition not ready. Start acquisition before capture.")
+        if idx in self.__streams:
+            raise RuntimeError(f"Device {idx} is streaming. Use get_latest_frame() "
+                               f"or get_next_frame() instead.")
+
+        telemetry = self.__telemetry.get(idx)
+        datastream = self.__datastreams[idx]
+        start = time.perf_counter() if telemetry else 0
+        buff = self.__wait_buffer(idx, 500)
+        lap = telemetry.lap("wait", start) if telemetry else 0
+        try:
+            self.__count_frame(buff, idx, lap)
+            raw = self.__ipl_extension.BufferToImage(buff).get_numpy_1D()
+            if out is None:
+                out = raw.copy()
+            else:
+                np.copyto(out, raw)
+        finally:
+            datastream.QueueBuffer(buff)
+
+        if telemetry:
+            telemetry.lap("copy", lap)
+            telemetry.lap("total", start)
+
+        return self.__make_raw_frame(out, idx)
+
+    def get_raw_size(self, idx=0):
+        """ Number of bytes of the raw frames of device idx. """
+        width, height = self.get_resolution(idx=idx)
+        return packed_size(self.__pixel_modes[idx][0], width, height)
+
+    def __make_raw_frame(self, data, idx=0):
+        width, height = self.get_resolution(idx=idx)
+        inner_mode, colorness = self.__pixel_modes[idx]
+        return RawFrame(data, inner_mode, width, height, colorness)
+
+    def preallocate_conversion(self, idx=0, pool_size=0):
+        """ Preallocates the converter from the inner to the outer pixel format,
+            so the conversion of every frame reuses the same internal memory.
+
+            If pool_size > 0, it also allocates a pool of output arrays and
+            capture() returns them in turn instead of a new array per frame.
+            Then, an array returned by capture() is overwritten pool_size
+            captures later. Copy it if you need it for longer.
+
+            It must be called again after changing the pixel format, the ROI or
+            the binning. Returns the list of pooled arrays.
+        """
+        width, height = self.get_resolution(idx=idx)
+        converter = self.__ipl.ImageConverter()
+        converter.PreAllocateConversion(self.__inner_pixel_format[idx],
+                                        self.__outer_pixel_format[idx],
+                                        width, height)
+        self.__converters[idx] = converter
+
+        if pool_size > 0:
+            shape, dtype = self.get_frame_layout(idx)
+            arrays = [np.empty(shape, dtype=dtype) for _ in range(pool_size)]
+            self.__output_pools[idx] = [arrays, 0]
+        else:
+            arrays = []
+            self.__output_pools.pop(idx, None)
+        return arrays
+
+    def __convert_buffer(self, buff, idx=0, force8bit=False, telemetry=None):
+        """ Converts a finished buffer to the outer pixel format.
+
+            It returns a numpy view of the converted image, which is only valid
+            until the next conversion. Copy it before queuing the buffer again.
+        """
+        lap = time.perf_counter() if telemetry else 0
         # Recuperem la imatge i fem debayering si cal
-        ipl_image = ids_peak_ipl_extension.BufferToImage(buff)
+        ipl_image = self.__ipl_extension.BufferToImage(buff)
+        if telemetry:
+            lap = telemetry.lap("buffer_to_image", lap)
         if not self.__outer_pixel_format[idx]:
             raise RuntimeError("Pixel format not selected")
         converted_image = ipl_image.ConvertTo(self.__outer_pixel_format[idx])
-
-        # Indiquem que el búffer es pot tornar a utilitzar
-        datastream.QueueBuffer(buff)
+        if telemetry:
+            lap = telemetry.lap("convert", lap)
 
         # Retornem la imatge en format numpy amb les dimensions correctes
         converted_pixel_format = converted_image.PixelFormat()
@@ -393,22 +1330,604 @@ class IDSinterface(object):
                 converter = converted_image.get_numpy_3D
             else:
                 converter = converted_image.get_numpy_3D_16
-        image_array = converter().copy()
+        image = converter()
+        if telemetry:
+            telemetry.lap("get_numpy", lap)
+        return image
+
+    def __convert_buffer_into(self, buff, out, idx=0, telemetry=None):
+        """ Converts a finished buffer to the outer pixel format writing the
+            pixels directly in the memory of out.
+        """
+        if not out.flags.c_contiguous or not out.flags.writeable:
+            raise ValueError("The output array must be C-contiguous and writeable.")
 
-        return image_array
+        lap = time.perf_counter() if telemetry else 0
+        ipl_image = self.__ipl_extension.BufferToImage(buff)
+        if telemetry:
+            lap = telemetry.lap("buffer_to_image", lap)
+        if not self.__outer_pixel_format[idx]:
+            raise RuntimeError("Pixel format not selected")
+        pixel_format = self.__ipl.PixelFormat(self.__outer_pixel_format[idx])
+        channels = pixel_format.NumChannels()
+        itemsize = 1 if pixel_format.NumSignificantBitsPerChannel() <= 8 else 2
+        shape = (ipl_image.Height(), ipl_image.Width())
+        if channels > 1:
+            shape += (channels,)
+        if out.shape != shape or out.itemsize != itemsize:
+            raise ValueError(f"The output array must be {shape} with "
+                             f"{8*itemsize} bits per channel, "
+                             f"not {out.shape} {out.dtype}.")
+
+        converter = self.__converters.get(idx)
+        if converter is None:
+            converter = self.__ipl.ImageConverter()
+            self.__converters[idx] = converter
+        # not out.ctypes.data: it builds objects in reference cycles every call,
+        # which pile up until the garbage collector runs
+        address = out.__array_interface__["data"][0]
+        converter.Convert(ipl_image, self.__outer_pixel_format[idx], address, out.nbytes)
+        if telemetry:
+            telemetry.lap("convert", lap)
+
+    def start_streaming(self, idx=0, ring_size=16, timeout_ms=500, raw=False, ring=None):
+        """ Starts a grabber thread that drains the datastream of device idx into
+            a preallocated ring buffer of ring_size frames.
+
+            Meanwhile, use get_latest_frame() or get_next_frame() instead of
+            capture(). They never block the grabber, so the time spent processing
+            a frame does not make the driver buffers overflow.
+
+            If raw is True, the ring keeps the packed buffers without converting
+            them and the getters return packed_formats.RawFrame objects.
+
+            ring: an existing FrameRingBuffer to convert the frames into (e.g. a
+                  SharedFrameRingBuffer), instead of a new one. Its frames must
+                  have the layout of get_frame_layout() (or the raw size).
+        """
+        if not self.__acquisition_ready.get(idx):
+            raise RuntimeError("Acquisition not ready. Start acquisition before streaming.")
+        if idx in self.__streams:
+            raise RuntimeError(f"Device {idx} is already streaming.")
+
+        if raw:
+            shape, dtype = (self.get_raw_size(idx),), np.uint8
+        else:
+            shape, dtype = self.get_frame_layout(idx)
+        if ring is None:
+            ring = FrameRingBuffer(ring_size, shape, dtype)
+        elif ring.shape != tuple(shape) or ring.dtype != np.dtype(dtype):
+            raise ValueError(f"The ring has frames of {ring.shape} {ring.dtype}, "
+                             f"but device {idx} delivers {tuple(shape)} {np.dtype(dtype)}.")
+        stream = _StreamState(ring, raw, timeout_ms)
+        self.__start_grabber(idx, stream)
+        return stream.ring
+
+    def __start_grabber(self, idx, stream):
+        stream.stop_event.clear()
+        stream.thread = threading.Thread(target=self.__grab_loop,
+                                         args=(idx, stream, stream.timeout_ms),
+                                         name=f"IDSgrabber-{idx}", daemon=True)
+        self.__streams[idx] = stream
+        stream.thread.start()
+
+    def stop_streaming(self, idx=0):
+        """ Stops the grabber thread of device idx, and its recording if any.
+            Acquisition keeps running.
+        """
+        self.stop_recording(idx)
+        stream = self.__streams.pop(idx, None)
+        if stream is None:
+            return
+        stream.stop_event.set()  # seen within _STOP_POLL_MS
+        stream.thread.join()
+        self.__notify_stopped(stream)
+        if stream.error is not None:
+            raise RuntimeError(f"Grabber of device {idx} failed.") from stream.error
+
+    @staticmethod
+    def __notify_stopped(stream):
+        """ Calls the on_stop callbacks of the sinks of stream, just once. """
+        callbacks, stream.on_stop = list(stream.on_stop.values()), {}
+        for on_stop in callbacks:
+            on_stop()
+
+    def is_streaming(self, idx=0):
+        return idx in self.__streams
+
+    def get_stream_ring(self, idx=0):
+        """ The FrameRingBuffer the grabber thread of device idx writes to. """
+        return self.__get_stream(idx).ring
+
+    def __grab_loop(self, idx, stream, timeout_ms):
+        datastream = self.__datastreams[idx]
+        ring = stream.ring
+        # Short waits, to see the stop event: a KillWait() would stay pending
+        # if it came between two waits, and abort the next capture()
+        poll_ms = min(timeout_ms, _STOP_POLL_MS)
+        waited_ms = 0
+        while not stream.stop_event.is_set():
+            telemetry = self.__telemetry.get(idx)
+            start = time.perf_counter() if telemetry else 0
+            try:
+                buff = datastream.WaitForFinishedBuffer(poll_ms)
+            except self.__peak.TimeoutException:
+                waited_ms += poll_ms
+                if waited_ms >= timeout_ms:
+                    stream.timeouts += 1
+                    waited_ms = 0
+                continue
+            except self.__peak.AbortedException:  # a stale KillWait()
+                continue
+            except Exception as e:
+                stream.error = e
+                self.__notify_stopped(stream)
+                break
+
+            waited_ms = 0
+            host_time = time.perf_counter()
+            if telemetry:
+                telemetry.lap("wait", start)
+            frame = ring.begin_write()
+            try:
+                if stream.raw:
+                    np.copyto(frame, self.__ipl_extension.BufferToImage(buff).get_numpy_1D())
+                else:
+                    self.__convert_buffer_to_output(buff, frame, idx, telemetry)
+                frame_id = self.__count_frame(buff, idx, host_time)[0]
+                timestamp = buff.Timestamp_ns()
+            except Exception as e:
+                stream.error = e
+                self.__notify_stopped(stream)
+                break
+            finally:
+                datastream.QueueBuffer(buff)
+
+            if stream.last_frame_id is not None and frame_id > stream.last_frame_id + 1:
+                stream.dropped += frame_id - stream.last_frame_id - 1
+            stream.last_frame_id = frame_id
+            ring.commit(timestamp, frame_id, host_time)
+            lap = time.perf_counter() if telemetry else 0
+            for sink in stream.sinks:
+                sink(frame, timestamp, frame_id, host_time)
+            if telemetry:
+                if stream.sinks:
+                    telemetry.lap("sinks", lap)
+                telemetry.lap("total", start)
+
+    def get_latest_frame(self, idx=0, out=None):
+        """ Returns a copy of the most recent streamed frame (or None, if there
+            is no frame yet). It never blocks.
+        """
+        stream = self.__get_stream(idx)
+        return self.__stream_output(stream.ring.latest(out)[1], stream, idx)
+
+    def get_next_frame(self, idx=0, timeout=0, out=None):
+        """ Returns a copy of the next streamed frame not read yet, waiting for it
+            up to timeout seconds. It returns None if there is no new frame.
+        """
+        stream = self.__get_stream(idx)
+        return self.__stream_output(stream.ring.next(timeout, out)[1], stream, idx)
+
+    def __stream_output(self, frame, stream, idx):
+        if frame is None or not stream.raw:
+            return frame
+        return self.__make_raw_frame(frame, idx)
+
+    def get_stream_stats(self, idx=0):
+        """ Counters of the streaming of device idx:
+                grabbed: frames written to the ring.
+                dropped: frames lost before reaching the grabber (FrameID gaps).
+                overwritten: frames overwritten in the ring before
+                             get_next_frame() read them.
+                pending: frames in the ring not read by get_next_frame() yet.
+                timeouts: waits of timeout_ms without any frame.
+        """
+        stream = self.__get_stream(idx)
+        return {"grabbed": stream.ring.write_count,
+                "dropped": stream.dropped,
+                "overwritten": stream.ring.overwritten,
+                "pending": stream.ring.pending(),
+                "timeouts": stream.timeouts}
+
+    def __get_stream(self, idx):
+        stream = self.__streams.get(idx)
+        if stream is None:
+            raise RuntimeError(f"Device {idx} is not streaming. "
+                               f"Call start_streaming({idx}) before.")
+        return stream
+
+    def add_stream_sink(self, sink, idx=0, on_stop=None):
+        """ Makes the grabber thread of device idx call
+            sink(frame, timestamp_ns, frame_id, host_time) for every frame, right
+            after writing it to the ring. frame is only valid during the call,
+            and the sink must be quick, or the driver buffers will overflow.
+
+            on_stop: called once the streaming stops for good (stop_streaming(),
+                     stop_acquisition(), or the grabber failing), unless the
+                     sink is removed before. Pauses to change settings don't.
+        """
+        stream = self.__get_stream(idx)
+        stream.sinks.append(sink)
+        if on_stop is not None:
+            stream.on_stop[sink] = on_stop
+
+    def remove_stream_sink(self, sink, idx=0):
+        stream = self.__streams.get(idx)
+        if stream is not None and sink in stream.sinks:
+            stream.sinks.remove(sink)
+            stream.on_stop.pop(sink, None)
+
+    def start_recording(self, path, max_frames, idx=0, queue_size=16, block=False,
+                        ring_size=16, frame_format="raw"):
+        """ Records the frames of device idx to disk (see recorder.Recorder), in
+            the directory path, up to max_frames. The grabber thread hands every
+            frame over to the writer thread of the recorder, so streaming (with
+            ring_size frames) is started if needed.
+
+            The frames are stored as get_next_frame() returns them (packed, if
+            streaming raw), along with their device timestamps, frame IDs and the
+            acquisition settings, updated on every change. frame_format 'packed12'
+            or 'compressed' makes them smaller on disk (see recorder.Recorder).
+            Check its progress with get_recording_stats().
+        """
+        return self.__attach_recorder(idx, ring_size, Recorder, path,
+                                      max_frames=max_frames, queue_size=queue_size,
+                                      block=block, frame_format=frame_format)
+
+    def start_triggered_recording(self, path, pre_frames, post_frames=1, idx=0,
+                                  condition=None, rearm=False, ring_size=16,
+                                  frame_format="raw"):
+        """ Keeps the last pre_frames frames of device idx in memory and, when
+            triggered, saves them along with the next post_frames ones in
+            path/event_000... (see recorder.TriggeredRecorder).
+
+            Trigger it with trigger_recording() or with condition(frame), e.g.
+            recorder.mean_above(threshold, roi). If rearm is True, it waits for
+            the next trigger afterwards. Streaming (with ring_size frames) is
+            started if needed. Stop it with stop_recording().
+        """
+        return self.__attach_recorder(idx, ring_size, TriggeredRecorder, path,
+                                      pre_frames=pre_frames, post_frames=post_frames,
+                                      condition=condition, rearm=rearm,
+                                      frame_format=frame_format)
+
+    def trigger_recording(self, idx=0):
+        """ Software trigger of the triggered recording of device idx. """
+        recorder = self.__recorders.get(idx)
+        if not isinstance(recorder, TriggeredRecorder):
+            raise RuntimeError(f"Device {idx} has no triggered recording. "
+                               f"Call start_triggered_recording() before.")
+        recorder.trigger()
+
+    def __attach_recorder(self, idx, ring_size, recorder_class, path, **kwargs):
+        """ Creates a recorder of the streamed frames of device idx and makes the
+            grabber thread feed it.
+        """
+        if idx in self.__recorders:
+            raise RuntimeError(f"Device {idx} is already recording.")
+        if idx not in self.__streams:
+            self.start_streaming(idx, ring_size=ring_size)
+        stream = self.__streams[idx]
+        pixel_format, colorness = self.__pixel_modes.get(idx, (None, None))
+        device = self._get_device(idx)
+        info = {"model": device.ModelName(), "serial": device.SerialNumber(),
+                "pixel_format": pixel_format, "colorness": colorness,
+                "raw": stream.raw, "resolution": list(self.get_resolution(idx))}
+        recorder = recorder_class(path, stream.ring.shape, stream.ring.dtype, info=info,
+                                  settings=self.get_settings(idx), **kwargs)
+        self.__recorders[idx] = recorder
+        self.add_stream_sink(recorder.write, idx)
+        return recorder
+
+    def stop_recording(self, idx=0):
+        """ Stops the recording (or triggered recording) of device idx, waiting
+            until the queued frames are written. Streaming keeps running. Returns the final stats of the
+            recording (None if it was not recording).
+        """
+        recorder = self.__recorders.pop(idx, None)
+        if recorder is None:
+            return None
+        self.remove_stream_sink(recorder.write, idx)
+        return recorder.close()
+
+    def get_recording_stats(self, idx=0):
+        """ Counters of the recording of device idx, see the stats() of
+            recorder.Recorder and recorder.TriggeredRecorder.
+        """
+        recorder = self.__recorders.get(idx)
+        if recorder is None:
+            raise RuntimeError(f"Device {idx} is not recording.")
+        return recorder.stats()
+
+    def start_group_streaming(self, idxs=(0, 1), ring_size=32, match="host",
+                              tolerance=None):
+        """ Starts streaming all the devices in idxs, each one on its own grabber
+            thread, to capture simultaneous frames with capture_group().
+
+            match: how frames of different devices are paired.
+                'host': by the time they reached the computer (default).
+                'device': by the device timestamps. Only meaningful if the
+                          camera clocks are synchronized (e.g. PTP).
+                'frame_id': by the frame IDs, e.g. with a common hardware trigger.
+            tolerance: maximum difference within a group, in seconds (in frames
+                       for 'frame_id'). By default, half the frame period of the
+                       slowest device (exact frame IDs for 'frame_id').
+
+            Frames grabbed before are not paired: those waiting in the driver
+            buffers of the devices not streaming yet are discarded.
+        """
+        idxs = tuple(idxs)
+        if match not in ("host", "device", "frame_id"):
+            raise ValueError(f"{match} : Match mode not supported. Choose one valid: "
+                             f"host, device, frame_id")
+        if tolerance is None and match == "frame_id":
+            tolerance = 0
+        elif tolerance is None:
+            tolerance = 0.5 / min(self.get_fps(idx) for idx in idxs)
+        for idx in idxs:
+            if idx not in self.__streams:
+                # frames queued before would reach the ring in a burst, all with
+                # the same host time, and be paired with the wrong ones
+                self.__discard_finished(idx)
+                self.start_streaming(idx, ring_size=ring_size)
+        group = _GroupState(idxs, match, tolerance)
+        for idx in idxs:  # start pairing from the frames to come
+            group.cursors[idx] = self.__streams[idx].ring.write_count
+        self.__groups[idxs] = group
+        return group
+
+    def stop_group_streaming(self, idxs=(0, 1)):
+        idxs = tuple(idxs)
+        self.__groups.pop(idxs, None)
+        for idx in idxs:
+            self.stop_streaming(idx)
+
+    def capture_group(self, idxs=(0, 1), timeout=1.):
+        """ Returns a list with one frame per device in idxs, all of them taken
+            at the same time (within the tolerance of start_group_streaming()),
+            or None if no complete group arrives within timeout seconds.
+
+            Frames that can't be paired with frames of every other device are
+            discarded and counted in get_group_stats(). The group streaming is
+            started with default settings if it was not started before.
+        """
+        idxs = tuple(idxs)
+        group = self.__groups.get(idxs) or self.start_group_streaming(idxs)
+        rings = {idx: self.__get_stream(idx).ring for idx in idxs}
+        deadline = time.perf_counter() + timeout
+
+        while True:
+            keys = {}
+            for idx in idxs:
+                ring = rings[idx]
+                oldest = max(ring.write_count - ring.size + 1, 0)
+                if group.cursors[idx] < oldest:  # overwritten before pairing it
+                    group.unmatched[idx] += oldest - group.cursors[idx]
+                    group.cursors[idx] = oldest
+                meta = ring.metadata(group.cursors[idx])
+                if meta is None:
+                    break  # not arrived yet (or overwritten right now)
+                keys[idx] = group.key(meta)
+
+            if len(keys) < len(idxs):
+                if time.perf_counter() >= deadline:
+                    return None
+                time.sleep(0.0002)
+                continue
+
+            newest = max(keys.values())
+            late = [idx for idx in idxs if newest - keys[idx] > group.tolerance]
+            if late:  # they have no partner in the other devices
+                for idx in late:
+                    group.unmatched[idx] += 1
+                    group.cursors[idx] += 1
+                continue
+
+            frames = [rings[idx].get(group.cursors[idx]) for idx in idxs]
+            for idx in idxs:
+                group.cursors[idx] += 1
+            if any(frame is None for frame in frames):  # overwritten while copying
+                for idx, frame in zip(idxs, frames):
+                    group.unmatched[idx] += frame is not None
+                continue
+            group.matched += 1
+            return frames
+
+    def get_group_stats(self, idxs=(0, 1)):
+        """ Counters of capture_group():
+                matched: groups returned.
+                unmatched: {idx: frames discarded without a partner}.
+        """
+        group = self.__groups.get(tuple(idxs))
+        if group is None:
+            raise RuntimeError(f"Devices {idxs} are not streaming as a group. "
+                               f"Call start_group_streaming({idxs}) before.")
+        return {"matched": group.matched, "unmatched": dict(group.unmatched)}
 
     def __destroy(self):
+        if self.__peak is None:
+            return
+        for idx in list(self.__streams):
+            try:
+                self.stop_streaming(idx)
+            except Exception:
+                pass
+        for idx in list(self.__exporters):
+            try:
+                self.disable_telemetry(idx)
+            except Exception:
+                pass
         try:
             self.__stop_all_acquisitions()
         except Exception as e:
             pass
         
-        ids_peak.Library.Close()
+        self.__peak.Library.Close()
 
     def __del__(self):
         self.__destroy()
 
 
+# Nodes used by the setters and getters, looked up once when selecting a device
+_FREQUENT_NODES = ("TLParamsLocked", "AcquisitionStart", "AcquisitionStop",
+                   "AcquisitionFrameRate", "ExposureTime", "Gain", "Width", "Height",
+                   "PayloadSize", "PixelFormat")
+
+# Limits changing when a node is written: name written: names whose limits change
+_DEPENDENT_LIMITS = {"AcquisitionFrameRate": ("ExposureTime",),
+                     "ExposureTime": ("AcquisitionFrameRate",)}
+
+
+class _NodeCache(object):
+    """ Wraps a nodemap keeping the handles of the nodes already found, so every
+        FindNode() of the same name after the first one is just a dict lookup.
+        Names not found are cached too, and raise the same exception again.
+        limits() are cached as well, until forget_limits() or invalidate().
+
+        Any other attribute is taken from the wrapped nodemap.
+    """
+
+    def __init__(self, nodemap, not_found=Exception):
+        self.nodemap = nodemap
+        self._not_found = not_found
+        self._nodes = {}  # name: node or the exception raised by FindNode(name)
+        self._limits = {}  # name: (minimum, maximum)
+
+    def FindNode(self, name):
+        node = self._nodes.get(name)
+        if node is None:
+            try:
+                node = self.nodemap.FindNode(name)
+            except self._not_found as e:
+                node = e
+            self._nodes[name] = node
+        if isinstance(node, BaseException):
+            raise node
+        return node
+
+    def prefetch(self, names):
+        """ Looks up all names now (the missing ones are skipped). """
+        for name in names:
+            try:
+                self.FindNode(name)
+            except self._not_found:
+                pass
+
+    def invalidate(self):
+        """ Forgets all handles and limits, e.g. when the device configuration
+            changes.
+        """
+        self._nodes.clear()
+        self._limits.clear()
+
+    def forget_limits(self, names):
+        for name in names:
+            self._limits.pop(name, None)
+
+    def value(self, name):
+        return self.FindNode(name).Value()
+
+    def set_value(self, name, value):
+        self.FindNode(name).SetValue(value)
+
+    def limits(self, name):
+        """ (Minimum, Maximum) of a numeric node. """
+        limits = self._limits.get(name)
+        if limits is None:
+            node = self.FindNode(name)
+            limits = self._limits[name] = (node.Minimum(), node.Maximum())
+        return limits
+
+    def __getattr__(self, name):
+        return getattr(self.nodemap, name)
+
+
+class _StreamState(object):
+    """ Bookkeeping of a grabber thread started by IDSinterface.start_streaming. """
+
+    def __init__(self, ring, raw=False, timeout_ms=500):
+        self.ring = ring
+        self.raw = raw
+        self.timeout_ms = timeout_ms
+        self.thread = None
+        self.stop_event = threading.Event()
+        self.error = None
+        self.last_frame_id = None
+        self.dropped = 0
+        self.timeouts = 0
+        self.sinks = []  # callables(frame, timestamp_ns, frame_id, host_time) run per frame
+        self.on_stop = {}  # sink: callable() run when the streaming stops
+
+
+class _FrameCounters(object):
+    """ Running counters of the frames received from a device, see
+        IDSinterface.get_frame_stats().
+    """
+
+    __slots__ = ("received", "lost", "incomplete", "last_frame_id")
+
+    def __init__(self):
+        self.received = 0
+        self.lost = 0
+        self.incomplete = 0
+        self.last_frame_id = None
+
+    def count(self, frame_id, incomplete=False):
+        self.received += 1
+        if incomplete:
+            self.incomplete += 1
+        # a FrameID going backwards means the camera restarted counting
+        if self.last_frame_id is not None and frame_id > self.last_frame_id + 1:
+            self.lost += frame_id - self.last_frame_id - 1
+        self.last_frame_id = frame_id
+
+
+class _TriggerStats(object):
+    """ Counters and histograms of IDSinterface.get_trigger_stats(). """
+
+    def __init__(self):
+        self.triggers = 0
+        self.bursts = 0
+        self.frames = 0
+        self.timeouts = 0
+        self.latency = LatencyHistogram()
+        self.interval = LatencyHistogram()
+        self._interval_squares = 0.
+
+    def add_interval(self, seconds):
+        self.interval.record(seconds)
+        self._interval_squares += seconds * seconds
+
+    def jitter(self):
+        """ Standard deviation of the intervals, in seconds. """
+        count = self.interval.count
+        if count < 2:
+            return None
+        mean = self.interval.total / count
+        return math.sqrt(max(self._interval_squares / count - mean * mean, 0))
+
+
+class _GroupState(object):
+    """ Pairing state of IDSinterface.capture_group for a group of devices. """
+
+    def __init__(self, idxs, match, tolerance):
+        self.match = match
+        self.tolerance = tolerance
+        self.cursors = {idx: 0 for idx in idxs}  # next sequence number to pair
+        self.unmatched = {idx: 0 for idx in idxs}
+        self.matched = 0
+
+    def key(self, meta):
+        """ Pairing key (in seconds, or frames) of (timestamp_ns, frame_id, host_time). """
+        timestamp_ns, frame_id, host_time = meta
+        if self.match == "host":
+            return host_time
+        elif self.match == "device":
+            return timestamp_ns * 1e-9
+        return frame_id
+
+
 class IDSCamera(IDSinterface):
     """ It is just for backward compatibility. """
     def __init__(self, *args, **kwargs):
@@ -1,19 +1,44 @@
 # from numba import jit
+import atexit
 import numpy as np
 import os
 import imageio
 
 import interface
+from bridge import FrameBridge
+from calibration import Calibration, CalibrationStore, average_frames, calibration_key
+from frame_stats import FrameStatistics
+from frame_store import load_frame, save_frame
+from metadata_log import MetadataLog, compact, read_log
+from processing import CapturePipeline, image_stats
+from simulated_camera import SimulatedBackend
 import matplotlib.pyplot as plt
 
-import json
 
+NUM_OF_SIM_CAMERAS = 1  # set this just to test with different cameras
+METADATA_IN_BACKGROUND = False  # write the metadata of save() from a thread
+SAVE_FORMAT = "float32"  # default frame_format of save(), see frame_store.FORMATS
+CALIBRATION_DIR = "calibration"  # master dark and flat frames, see calibrate()
 
-try:
-    IDS_interface_Obj = interface.IDSCamera()
-except interface.ids_peak.NotFoundException:
-    import time
-    IDS_interface_Obj = None
+_metadata_logs = {}  # path: MetadataLog, kept open between saves
+_bridges = {}  # cam_id: FrameBridge, see start_bridge()
+_pipelines = {}  # cam_id: CapturePipeline, see configure_capture()
+_statistics = {}  # cam_id: FrameStatistics of the captures, see start_statistics()
+
+
+def _open_interface():
+    """ Opens the IDS cameras or, if there is none, simulated ones. """
+    try:
+        return interface.IDSCamera()
+    except ImportError:  # IDS SDK not installed
+        pass
+    except interface.ids_peak.NotFoundException:
+        pass
+    print("No IDS camera found. Using simulated cameras.")
+    return interface.IDSCamera(backend=SimulatedBackend(num_devices=NUM_OF_SIM_CAMERAS))
+
+
+IDS_interface_Obj = _open_interface()
 
 roi = None
 ref = None
@@ -27,11 +52,6 @@ def init(is16bits=False):
     bitness = 12 if is16bits else 8
     # Obrim la llibreria
     global IDS_interface_Obj
-    if IDS_interface_Obj is None:
-        cam_names = ["NotFound", "aaa", "bbb", "ccc"]
-        cam_serials = ["-1", "-2", "-3", "-4"]
-        NUM_OF_SIM_CAMERAS = 1  # set this just to test with different cameras
-        return cam_names[:NUM_OF_SIM_CAMERAS], cam_serials[:NUM_OF_SIM_CAMERAS]
 
     # Busquem dispositius disponibles
     devicesSerial = []
@@ -47,88 +67,231 @@ def init(is16bits=False):
     return devicesName, devicesSerial
 
 
-def start(cam_id=0, exposure_ms=1, fps=100, gain=0):
+def start(cam_id=0, exposure_ms=1, fps=100, gain=0, binning=1, use_roi=False):
     # Comencem l'adquisició, que bloqueja canvis "crítics" en la càmera
     global IDS_interface_Obj
 
-    if IDS_interface_Obj is None:
-        return 1, 1, fps, exposure_ms  # Dummy values
-
     IDS_interface_Obj.select_device(cam_id)
-    # Seleccionem els fps
-    IDS_interface_Obj.set_fps(fps, cam_id)
-    true_fps = IDS_interface_Obj.get_fps(cam_id)
-
-    # Seleccionem el temps d'exposició, en us
-    IDS_interface_Obj.set_exposure_time(exposure_ms*1000, cam_id)
-    true_exposure = IDS_interface_Obj.get_exposure_time(cam_id)/1000  # in ms
-
-    # Seleccionem el gain
-    IDS_interface_Obj.set_gain(gain, cam_id)
-    true_gain = IDS_interface_Obj.get_gain(cam_id)
+    _pipelines.pop(cam_id, None)
+    # Seleccionem els fps, el temps d'exposició (en us) i el gain
+    settings = IDS_interface_Obj.apply_settings(cam_id, fps=fps,
+                                                exposure=exposure_ms*1000, gain=gain)
+    true_fps = settings["fps"]
+    true_exposure = settings["exposure"]/1000  # in ms
+    true_gain = settings["gain"]
 
     # Mirem la resolució
-    width, height = IDS_interface_Obj.get_resolution(cam_id)
+    width, height = settings["roi"][2:]
+
+    # Declarem el processat de les captures, abans de bloquejar la càmera
+    configure_capture(cam_id, binning, use_roi)
 
     # Comencem l'adquisició, que bloqueja canvis "crítics" en la càmera
     IDS_interface_Obj.start_acquisition(cam_id)
 
     return width, height, true_fps, true_exposure#, true_gain
 
-def capture(cam_id=0, binning=1, use_roi=False):
-    # Capturem imatges
-    global IDS_interface_Obj
-    global roi
 
-    if IDS_interface_Obj is None:
-        time.sleep(0.01)  # setting an effective FPS about 100
-        return np.random.randint(0, 2**16, (100, 100), np.uint16)  # Dummy values
+def configure_capture(cam_id=0, binning=1, use_roi=False, flip=True, dtype=np.uint16):
+    """ Declares how capture() processes the frames of cam_id: decimation by
+        binning, crop to the roi set by set_roi() (if use_roi), upside-down flip
+        and cast to dtype, fused in a single pass (see CapturePipeline).
+
+        start() calls it, and capture() again if its arguments change. Then,
+        during the acquisition, the sensor flip set by start() is kept (changing
+        it would restart the acquisition) and the rest is done in software.
+    """
+    crop = roi if use_roi else None
+    pipeline = _pipelines.get(cam_id)
+    if pipeline is None or pipeline.key != (binning, crop, flip, np.dtype(dtype)):
+        pipeline = _pipelines[cam_id] = CapturePipeline(IDS_interface_Obj, cam_id, binning,
+                                                        crop, flip, dtype)
+    return pipeline
 
-    image = IDS_interface_Obj.capture(cam_id)[::binning, ::binning]
 
-    if roi is not None and use_roi:
-        roix, roiy, roiw, roih = roi
-        image = image[roiy:roiy+roih, roix:roix+roiw]
+def capture(cam_id=0, binning=1, use_roi=False, reuse=False):
+    """ Captures a frame of cam_id decimated by binning, cropped to the roi (if
+        use_roi) and flipped upside down, as uint16, in a new array.
+
+        reuse: return the array of the capture pipeline instead, with no copy
+               nor allocation. It is overwritten by the next capture() of cam_id.
+    """
+    # Capturem imatges
+    global IDS_interface_Obj
 
-    # return myTolist(image[::-1,:])
-    return image[::-1,:].astype(np.uint16)
+    image = configure_capture(cam_id, binning, use_roi).capture()
+    statistics = _statistics.get(cam_id)
+    if statistics is not None:
+        statistics.update(image)
+    return image if reuse else image.copy()
+
+
+def _calibration_key(cam_id):
+    """ Key of the master frames of cam_id with its current settings and the
+        geometry of its captures.
+    """
+    pipeline = _pipelines.get(cam_id)
+    if pipeline is None:
+        raise RuntimeError(f"Camera {cam_id} not started. Call start({cam_id}) before.")
+    binning, crop, flip, _ = pipeline.key
+    geometry = f"bin{binning}"
+    if crop is not None:
+        geometry += "_roi" + "-".join(str(value) for value in crop)
+    if flip:
+        geometry += "_flip"
+    return pipeline, calibration_key(IDS_interface_Obj, cam_id, geometry)
+
+
+def calibrate(cam_id=0, kind="dark", n=32, rebuild=False):
+    """ Takes the master frame kind of cam_id: 'dark' (with the camera covered)
+        or 'flat' (with a uniform illumination), the mean of n frames of
+        capture() as declared in start(), without correction. It is cached in
+        CALIBRATION_DIR, for the camera, pixel format, exposure, gain and
+        geometry of the captures, so it is only taken again if rebuild.
+    """
+    pipeline, key = _calibration_key(cam_id)
+    calibration, pipeline.calibration = pipeline.calibration, None
+    try:
+        return CalibrationStore(CALIBRATION_DIR).get_or_build(
+            kind, key, lambda: average_frames(pipeline.capture, n), pipeline.out.shape,
+            rebuild)
+    finally:
+        pipeline.calibration = calibration
+
+
+def set_calibration(cam_id=0, dark=True, flat=True, use_ref=False, is_float=False):
+    """ Corrects every frame returned by capture(cam_id) with the dark and flat
+        frames taken by calibrate() with the current settings, and normalizes
+        them by the mean of the ref set by set_ref() if use_ref (see
+        calibration.Calibration). The frames are corrected in place, as uint16
+        (the ref at 2**14), or as float32 if is_float (the ref at 1).
+
+        It lasts until start(), or a capture() with other binning or use_roi.
+    """
+    pipeline, key = _calibration_key(cam_id)
+    store = CalibrationStore(CALIBRATION_DIR)
+    masters = {}
+    for kind, wanted in (("dark", dark), ("flat", flat)):
+        if wanted:
+            masters[kind] = store.load(kind, key, pipeline.out.shape)
+            if masters[kind] is None:
+                raise RuntimeError(f"No {kind} frame of camera {cam_id} with these settings. "
+                                   f"Take it with calibrate({cam_id}, '{kind}') before.")
+    if use_ref and ref is None:
+        raise RuntimeError("No reference to normalize by. Call set_ref() before.")
+    pipeline.calibration = Calibration(masters.get("dark"), masters.get("flat"),
+                                       ref if use_ref else None,
+                                       dtype=np.float32 if is_float else np.uint16)
+
+
+def clear_calibration(cam_id=0):
+    pipeline = _pipelines.get(cam_id)
+    if pipeline is not None:
+        pipeline.calibration = None
+
+
+def start_statistics(cam_id=0, every=1, background=True, bit_depth=None):
+    """ Keeps statistics of the frames returned by capture(cam_id): histograms,
+        saturated pixels and (mean, max, min) of the whole frame and of the ref
+        set by set_ref() (in coordinates of the captured frame), see
+        frame_stats.FrameStatistics. Only every every-th frame is analysed, on
+        a worker thread if background, so capture() is barely slowed down.
+
+        bit_depth: of the frames (that of the pixel format by default).
+    """
+    stop_statistics(cam_id)
+    if bit_depth is None:
+        bit_depth = IDS_interface_Obj.get_bit_depth(cam_id)
+    rois = {"ref": ref} if ref is not None else {}
+    _statistics[cam_id] = FrameStatistics(bit_depth, rois, every, background=background)
+
+
+def get_statistics(cam_id=0, last=False):
+    """ Statistics of the frames captured since start_statistics(cam_id),
+        or of the last one analysed (if last), or None.
+    """
+    statistics = _statistics.get(cam_id)
+    if statistics is None:
+        return None
+    if last:
+        statistics.flush()
+        return statistics.last
+    return statistics.summary()
+
+
+def stop_statistics(cam_id=0):
+    statistics = _statistics.pop(cam_id, None)
+    if statistics is not None:
+        statistics.close()
 
 
 def stop():
     global IDS_interface_Obj
-    if IDS_interface_Obj is not None:
-        IDS_interface_Obj.stop_acquisition()
+    IDS_interface_Obj.stop_acquisition()
+    close_metadata_logs()
 
 
 def set_exposure(exposure_ms, cam_id=0, set_max_fps=True):
     global IDS_interface_Obj
-    if IDS_interface_Obj is None:
-        exposure_ms += 1e-12
-        return [exposure_ms, 1.e3/exposure_ms]  # Dummy values
-    IDS_interface_Obj.set_exposure_time(exposure_ms*1000, cam_id)  # gets in um
-    if set_max_fps:
-        IDS_interface_Obj.set_max_fps(cam_id)
-    return [IDS_interface_Obj.get_exposure_time(cam_id)/1000,  # in ms
-            IDS_interface_Obj.get_fps(cam_id)]
+    settings = _apply_settings(cam_id, exposure=exposure_ms*1000,  # gets in um
+                               max_fps=set_max_fps)
+    return [settings["exposure"]/1000,  # in ms
+            settings["fps"]]
 
 
 def set_fps(fps, cam_id=0):
     global IDS_interface_Obj
-    if IDS_interface_Obj is None:
-        fps += 1e-12
-        return [fps, 1.e3/fps]  # Dummy values
-    IDS_interface_Obj.set_fps(fps, cam_id)
-    return [IDS_interface_Obj.get_fps(cam_id),
-            IDS_interface_Obj.get_exposure_time(cam_id)/1000]
+    settings = _apply_settings(cam_id, fps=fps)
+    return [settings["fps"],
+            settings["exposure"]/1000]
 
 
 def set_gain(gain, cam_id=0):
     global IDS_interface_Obj
-    if IDS_interface_Obj is None:
-        return [1., 1.]  # Dummy values
-    IDS_interface_Obj.set_gain(gain, cam_id)
-    return [IDS_interface_Obj.get_fps(cam_id),
-            IDS_interface_Obj.get_exposure_time(cam_id)/1000]
+    settings = _apply_settings(cam_id, gain=gain)
+    return [settings["fps"],
+            settings["exposure"]/1000]
+
+
+def _apply_settings(cam_id, **settings):
+    # bridged cameras belong to their grabber process
+    if cam_id in _bridges:
+        return _bridges[cam_id].apply_settings(**settings)
+    return IDS_interface_Obj.apply_settings(cam_id, **settings)
+
+
+def start_bridge(cam_id=0, exposure_ms=1, fps=100, gain=0, is16bits=False, ring_size=8):
+    """ Bridge mode: a grabber process keeps the camera streaming into shared
+        memory, so capture_bridge() just returns the latest frame, without
+        waiting for the camera nor copying it. Use it instead of start() and
+        capture(). set_exposure(), set_fps() and set_gain() work as usual.
+    """
+    stop_bridge(cam_id)
+    settings = {"fps": fps, "exposure": exposure_ms*1000, "gain": gain}
+    _bridges[cam_id] = FrameBridge(cam_id, ring_size, settings=settings,
+                                   bit_rate=12 if is16bits else 8)
+    settings = _bridges[cam_id].settings
+    width, height = settings["roi"][2:]
+    return width, height, settings["fps"], settings["exposure"]/1000
+
+
+def capture_bridge(cam_id=0):
+    """ Latest frame of a bridged camera, flipped upside down and uint16 as
+        capture() returns it, but as a view of shared memory: it stays valid
+        until ring_size - 1 frames more are grabbed.
+    """
+    return _bridges[cam_id].latest()[1]
+
+
+def latest_slot(cam_id=0):
+    """ (slot, frame number) of the latest frame of a bridged camera. """
+    return _bridges[cam_id].latest_slot()
+
+
+def stop_bridge(cam_id=0):
+    bridge = _bridges.pop(cam_id, None)
+    if bridge is not None:
+        bridge.close()
 
 
 def set_roi(roix, roiy, roiw, roih):
@@ -139,47 +302,50 @@ def set_roi(roix, roiy, roiw, roih):
 def set_ref(refx, refy, refw, refh):
     global ref
     ref = (refx, refy, refw, refh)
+    for statistics in _statistics.values():
+        statistics.set_roi("ref", ref)
+
 
+def save(image, filename, main_roi=None, ref_roi=None, bit_depth=16, frame_format=None):
+    """ Saves the main_roi crop of image, normalized by the mean of its ref_roi,
+        and appends its metadata to the log of the series. Returns the path.
 
-def save(image, filename, main_roi=None, ref_roi=None, bit_depth=16):
-    np_fn = filename.replace(".png", ".npy")
+        frame_format (SAVE_FORMAT by default): 'float32' saves the normalized
+        image, as always. 'uint16', 'packed12' and 'compressed' save the crop as
+        captured, much smaller, and the normalization goes to the metadata
+        (ref_mean). Use load() to get the normalized image back.
+    """
+    frame_format = frame_format or SAVE_FORMAT
 
     # main_roi implementation
     roi_xi, roi_yi, roi_xf, roi_yf = main_roi or (None, None, None, None)
-    image2save = image[roi_yi:roi_yf, roi_xi:roi_xf].astype(np.float32)
+    crop = image[roi_yi:roi_yf, roi_xi:roi_xf]
 
     ref_xi, ref_yi, ref_xf, ref_yf = ref_roi or (None, None, None, None)
     ref_mean = image[ref_yi:ref_yf, ref_xi:ref_xf].mean() if ref_roi else 1
-    ref_max = 2**14 if ref_roi else 1
 
-    image2save /= ref_mean
-    image2save16 = (image2save * ref_max).astype(np.uint16)
+    if frame_format == "float32":
+        image2save = crop.astype(np.float32)
+        image2save /= ref_mean
+    else:
+        image2save = crop
 
-    # # Save as PNG with imageio
-    # crop_fn = filename.replace(".png", "_crop.png")
-    # if os.path.isfile(crop_fn):
-    #     os.remove(crop_fn)
-    # imageio.imwrite(crop_fn, image2save16)
-
-    # Guardem la imatge com a numpy array
-    if os.path.isfile(np_fn):
-        os.remove(np_fn)
-    np.save(np_fn, image2save)
+    # Guardem la imatge com a numpy array (o en el format compacte triat)
+    np_fn = save_frame(filename, image2save, frame_format)
 
     try:
-        # Guardem metadades
+        # Guardem metadades, afegint una línia al log de la sèrie
         dir, fn = os.path.split(filename)
-        meta_fn = os.path.join(dir, fn.split('_')[0] + ".json")
-        if os.path.isfile(meta_fn):
-            # Load the dictionary from the file
-            with open(meta_fn, 'r') as meta_file:
-                meta_dict = json.load(meta_file)
-        else:
-            meta_dict = {}
-
-        current_dict = {"mean": float(image2save.mean()),
-                        "max": float(image2save.max()),
-                        "min": float(image2save.min())}
+        meta_fn = os.path.join(dir, fn.split('_')[0] + ".jsonl")
+
+        # stats of the crop before normalizing, in a single pass
+        crop_mean, crop_max, crop_min = image_stats(crop)
+        current_dict = {"mean": float(crop_mean / ref_mean),
+                        "max": float(crop_max / ref_mean),
+                        "min": float(crop_min / ref_mean),
+                        "path": os.path.basename(np_fn),
+                        "format": frame_format,
+                        "ref_mean": float(ref_mean)}
         if main_roi is not None:
             current_dict.update({'center': ((roi_xi+roi_xf)/2, (roi_yi+roi_yf)/2),
                                  'size': (roi_xf-roi_xi, roi_yf-roi_yi)})
@@ -188,16 +354,71 @@ def save(image, filename, main_roi=None, ref_roi=None, bit_depth=16):
             current_dict.update(ref_roi={'center': ((ref_xi+ref_xf)/2, (ref_yi+ref_yf)/2),
                                          'size': (ref_xf-ref_xi, ref_yf-ref_yi)})
 
-        meta_dict.update({fn: current_dict})
-        # Save the dictionary to the file
-        with open(meta_fn, 'w') as meta_file:
-            json.dump(meta_dict, meta_file, indent=4)
-    except:
-        pass
+        _metadata_log(meta_fn).append(fn, **current_dict)
+    except (OSError, ValueError) as e:
+        print(f"The metadata of {np_fn} could not be saved: {e}")
 
     return np_fn
 
 
+def load(filename, normalize=True):
+    """ Loads an image saved by save(), given its filename or the path save()
+        returned. If normalize is True, images saved as captured are divided by
+        the reference mean stored in the metadata (float32 ones already are).
+    """
+    dir, fn = os.path.split(filename)
+    meta_fn = os.path.join(dir, fn.split('_')[0] + ".jsonl")
+    entries = {}
+    if os.path.isfile(meta_fn):
+        if meta_fn in _metadata_logs:
+            _metadata_logs[meta_fn].flush()
+        entries = read_log(meta_fn)
+    metadata = entries.get(fn) or next((entry for entry in entries.values()
+                                        if entry.get("path") == fn), {})
+    if "path" in metadata:
+        filename = os.path.join(dir, metadata["path"])
+    elif filename.endswith(".png"):
+        filename = filename.replace(".png", ".npy")
+    image = load_frame(filename)
+    if normalize and metadata.get("format", "float32") != "float32":
+        image = image / np.float32(metadata["ref_mean"])
+    return image
+
+
+def _metadata_log(path):
+    log = _metadata_logs.get(path)
+    if log is None:
+        log = _metadata_logs[path] = MetadataLog(path, background=METADATA_IN_BACKGROUND)
+    return log
+
+
+def close_metadata_logs():
+    """ Writes what is pending and closes the metadata logs of save(), which
+        opens them again when needed. stop() and the exit of Python call it.
+    """
+    while _metadata_logs:
+        path, log = _metadata_logs.popitem()
+        try:
+            log.close()
+        except (OSError, RuntimeError) as e:
+            print(f"The metadata log {path} could not be closed: {e.__cause__ or e}")
+
+
+atexit.register(close_metadata_logs)
+
+
+def export_metadata(filename):
+    """ Writes the metadata of the series of filename (any of its images, or the
+        .jsonl log itself) in the old layout: <prefix>.json with all the images.
+        Returns the path of the JSON file.
+    """
+    dir, fn = os.path.split(filename)
+    meta_fn = os.path.join(dir, fn.split('_')[0].split('.')[0] + ".jsonl")
+    if meta_fn in _metadata_logs:
+        _metadata_logs[meta_fn].flush()
+    return compact(meta_fn)
+
+
 if __name__ == "__main__":
     import matplotlib.pyplot as plt
     init(is16bits=True)
@@ -0,0 +1,131 @@
+""" Append-only metadata of saved images, as JSON lines.
+
+    Every saved image appends one line {"file": name, ...} to the log, so the
+    cost of a save doesn't grow with the number of images in the series, and
+    overlapping saves don't overwrite each other's entries.
+
+    The old layout, a single JSON dictionary {file name: metadata} per series,
+    is produced by compact():
+
+        $ python metadata_log.py path/to/series.jsonl  # writes path/to/series.json
+"""
+
+import json
+import os
+import queue
+import sys
+import threading
+
+
+class MetadataLog(object):
+    """ JSON-lines file where entries are only appended.
+
+        Every entry is written with a single write() call on a file opened in
+        append mode, so lines from different threads or processes don't mix.
+        With background=True, append() just queues the entry and a writer
+        thread writes it (call flush() or close() to wait for it).
+    """
+
+    def __init__(self, path, background=False):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, 'a', encoding='utf-8')
+        self._queue = None
+        self._thread = None
+        self.error = None
+        if background:
+            self._queue = queue.Queue()
+            self._thread = threading.Thread(target=self.__write_loop, name="IDSmetadata",
+                                            daemon=True)
+            self._thread.start()
+
+    def append(self, name, **metadata):
+        """ Adds the metadata of the file name. A later entry of the same name
+            replaces the previous one when reading the log.
+        """
+        line = json.dumps(dict(metadata, file=name)) + "\n"
+        if self._queue is None:
+            self.__write(line)
+        else:
+            self._queue.put(line)
+
+    def __write(self, line):
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+
+    def __write_loop(self):
+        while True:
+            line = self._queue.get()
+            try:
+                if line is not None:
+                    self.__write(line)
+            except Exception as e:
+                self.error = e
+            finally:
+                self._queue.task_done()
+            if line is None:
+                break
+
+    def flush(self):
+        """ Waits until all the entries appended are written. """
+        if self._queue is not None:
+            self._queue.join()
+        if self.error is not None:
+            raise RuntimeError(f"Writing to {self.path} failed.") from self.error
+
+    def close(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+        self._file.close()
+        if self.error is not None:
+            raise RuntimeError(f"Writing to {self.path} failed.") from self.error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_log(path):
+    """ Returns the entries of the log as {file name: metadata}, in the order they
+        were first saved. A truncated last line (interrupted write) is skipped.
+    """
+    entries = {}
+    with open(path, encoding='utf-8') as log_file:
+        for line in log_file:
+            try:
+                metadata = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            entries[metadata.pop("file")] = metadata
+    return entries
+
+
+def compact(path, json_path=None, indent=4):
+    """ Exports the log to the old layout: a JSON file with {file name: metadata}.
+        Entries already in json_path (e.g. from old saves) are kept, unless the
+        log has newer ones. By default, json_path is path with .json extension.
+        Returns json_path.
+    """
+    if json_path is None:
+        json_path = os.path.splitext(path)[0] + ".json"
+    entries = {}
+    if os.path.isfile(json_path):
+        with open(json_path, encoding='utf-8') as json_file:
+            entries = json.load(json_file)
+    entries.update(read_log(path))
+    with open(json_path, 'w', encoding='utf-8') as json_file:
+        json.dump(entries, json_file, indent=indent)
+    return json_path
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(f"Usage: python {sys.argv[0]} metadata.jsonl [more.jsonl...]")
+        sys.exit(1)
+    for log_path in sys.argv[1:]:
+        print(f"{log_path} -> {compact(log_path)}")
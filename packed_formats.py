@@ -0,0 +1,349 @@
+""" NumPy decoders for the packed pixel formats used as inner formats by
+    IDSinterface.set_pixel_format(), so the conversion can be done out of the
+    acquisition thread (or skipped for frames that are never used).
+
+    IDS grouped layouts (most significant bits first, then the remaining bits):
+
+        Mono10g40IDS / BayerGR10g40IDS: 4 pixels in 5 bytes.
+            bytes 0-3: bits 9..2 of pixels 0-3
+            byte 4:    bits 1..0 of pixel k at bits 2k+1..2k
+
+        Mono12g24IDS / BayerGR12g24IDS: 2 pixels in 3 bytes.
+            bytes 0-1: bits 11..4 of pixels 0-1
+            byte 2:    bits 3..0 of pixel 0 at bits 3..0
+                       bits 3..0 of pixel 1 at bits 7..4
+
+    Mono8 and BayerGR8 are plain bytes.
+
+    Usage:
+
+        from packed_formats import decode
+        image = decode(raw_bytes, "BayerGR12g24IDS", width, height)  # RGB 12bits
+
+    Recorded raw dumps (packed frames one after the other) can be processed
+    offline, without the IDS SDK, with read_raw_dump() and iter_raw_dump().
+    Check benchmarks.py to compare these decoders with the IPL conversion.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+# name: (bit depth, pixels per group, bytes per group, is bayer)
+PACKED_FORMATS = {"Mono8": (8, 1, 1, False),
+                  "Mono10g40IDS": (10, 4, 5, False),
+                  "Mono12g24IDS": (12, 2, 3, False),
+                  "BayerGR8": (8, 1, 1, True),
+                  "BayerGR10g40IDS": (10, 4, 5, True),
+                  "BayerGR12g24IDS": (12, 2, 3, True)}
+
+
+def _format_info(pixel_format):
+    try:
+        return PACKED_FORMATS[pixel_format]
+    except KeyError:
+        raise ValueError(f"{pixel_format} : Pixel format not supported. Choose one valid: "
+                         f"{', '.join(PACKED_FORMATS)}") from None
+
+
+def bit_depth(pixel_format):
+    return _format_info(pixel_format)[0]
+
+
+def is_bayer(pixel_format):
+    return _format_info(pixel_format)[3]
+
+
+def packed_size(pixel_format, width, height):
+    """ Number of bytes of a packed image. """
+    _, pixels, nbytes, _ = _format_info(pixel_format)
+    if width % pixels:
+        raise ValueError(f"The width of a {pixel_format} image must be "
+                         f"a multiple of {pixels}.")
+    return width * height // pixels * nbytes
+
+
+def _output(out, width, height):
+    if out is None:
+        return np.empty((height, width), dtype=np.uint16)
+    if out.shape != (height, width) or out.dtype != np.uint16 or not out.flags.c_contiguous:
+        raise ValueError(f"The output array must be a C-contiguous uint16 array "
+                         f"of shape {(height, width)}.")
+    return out
+
+
+def unpack_mono10g40(raw, width, height, out=None):
+    """ Unpacks Mono10g40IDS (or BayerGR10g40IDS) bytes to a (height, width) uint16 array.
+
+        out: optional preallocated (height, width) uint16 array to write into.
+    """
+    groups = np.frombuffer(raw, dtype=np.uint8, count=width * height // 4 * 5).reshape(-1, 5)
+    out = _output(out, width, height)
+    image = out.reshape(-1, 4)
+    image[:] = groups[:, :4]
+    image <<= 2
+    low = groups[:, 4]
+    for k in range(4):
+        image[:, k] |= (low >> (2 * k)) & 0x3
+    return out
+
+
+def unpack_mono12g24(raw, width, height, out=None):
+    """ Unpacks Mono12g24IDS (or BayerGR12g24IDS) bytes to a (height, width) uint16 array.
+
+        out: optional preallocated (height, width) uint16 array to write into.
+    """
+    groups = np.frombuffer(raw, dtype=np.uint8, count=width * height // 2 * 3).reshape(-1, 3)
+    out = _output(out, width, height)
+    image = out.reshape(-1, 2)
+    image[:] = groups[:, :2]
+    image <<= 4
+    image[:, 0] |= groups[:, 2] & 0xF
+    image[:, 1] |= groups[:, 2] >> 4
+    return out
+
+
+def unpack(raw, pixel_format, width, height, out=None):
+    """ Unpacks any supported format to a (height, width) array: uint8 for the
+        8 bits formats and uint16 for the others. Bayer mosaics are not
+        demosaiced here.
+
+        out: optional preallocated (height, width) uint16 array to write into
+             (the 8 bits formats are widened to uint16 then).
+    """
+    depth = bit_depth(pixel_format)
+    packed_size(pixel_format, width, height)  # validates the width
+    if depth == 8:
+        image = np.frombuffer(raw, dtype=np.uint8,
+                              count=width * height).reshape(height, width)
+        if out is None:
+            return image
+        _output(out, width, height)[:] = image
+        return out
+    elif depth == 10:
+        return unpack_mono10g40(raw, width, height, out)
+    else:
+        return unpack_mono12g24(raw, width, height, out)
+
+
+def _packed_output(out, nbytes):
+    if out is None:
+        return np.empty(nbytes, dtype=np.uint8)
+    if out.size != nbytes or out.dtype != np.uint8 or not out.flags.c_contiguous:
+        raise ValueError(f"The output array must be a C-contiguous uint8 array "
+                         f"of {nbytes} bytes.")
+    return out.reshape(-1)
+
+
+def pack_mono10g40(image, out=None):
+    """ Packs a 10 bits image (uint16) to Mono10g40IDS bytes. Higher bits are discarded.
+
+        out: optional preallocated uint8 array of packed_size() bytes.
+    """
+    pixels = np.ascontiguousarray(image, dtype=np.uint16).reshape(-1, 4)
+    groups = _packed_output(out, pixels.shape[0] * 5).reshape(-1, 5)
+    np.right_shift(pixels, 2, out=groups[:, :4], casting='unsafe')
+    low = (pixels[:, 0] & 0x3).astype(np.uint8)
+    for k in range(1, 4):
+        low |= ((pixels[:, k] & 0x3) << (2 * k)).astype(np.uint8)
+    groups[:, 4] = low
+    return groups.reshape(-1)
+
+
+def pack_mono12g24(image, out=None):
+    """ Packs a 12 bits image (uint16) to Mono12g24IDS bytes. Higher bits are discarded.
+
+        out: optional preallocated uint8 array of packed_size() bytes.
+    """
+    pixels = np.ascontiguousarray(image, dtype=np.uint16).reshape(-1, 2)
+    groups = _packed_output(out, pixels.shape[0] * 3).reshape(-1, 3)
+    np.right_shift(pixels, 4, out=groups[:, :2], casting='unsafe')
+    groups[:, 2] = (pixels[:, 0] & 0xF) | ((pixels[:, 1] & 0xF) << 4)
+    return groups.reshape(-1)
+
+
+def pack(image, pixel_format, out=None):
+    """ Packs a (height, width) image to the bytes of pixel_format, the inverse
+        of unpack(). Bayer formats expect the mosaic, not an RGB image.
+    """
+    height, width = image.shape
+    depth = bit_depth(pixel_format)
+    nbytes = packed_size(pixel_format, width, height)
+    if depth == 8:
+        out = _packed_output(out, nbytes)
+        out[:] = image.reshape(-1)
+        return out
+    elif depth == 10:
+        return pack_mono10g40(image, out)
+    else:
+        return pack_mono12g24(image, out)
+
+
+def read_raw_dump(filename, pixel_format, width, height):
+    """ Memory-maps a file with packed frames one after the other and returns
+        a (n_frames, frame_bytes) uint8 array, without reading it from disk.
+    """
+    frame_bytes = packed_size(pixel_format, width, height)
+    dump = np.memmap(filename, dtype=np.uint8, mode='r')
+    if dump.size % frame_bytes:
+        raise ValueError(f"{filename} is not a sequence of {width}x{height} "
+                         f"{pixel_format} frames.")
+    return dump.reshape(-1, frame_bytes)
+
+
+def iter_raw_dump(filename, pixel_format, width, height, colorness="RGB"):
+    """ Yields the frames of a raw dump as RawFrame objects (decoded on demand). """
+    for data in read_raw_dump(filename, pixel_format, width, height):
+        yield RawFrame(data, pixel_format, width, height, colorness)
+
+
+def demosaic_bilinear(mosaic, pattern="GR"):
+    """ Bilinear demosaicing of a Bayer mosaic to a (height, width, 3) RGB array
+        with the same dtype and bit depth.
+
+        pattern: the two first pixels of the first row ("GR", "RG", "GB", "BG").
+    """
+    height, width = mosaic.shape
+    if height % 2 or width % 2:
+        raise ValueError("Bayer mosaics must have an even width and height.")
+    first_row = {"GR": "GRBG", "RG": "RGGB", "GB": "GBRG", "BG": "BGGR"}[pattern]
+    red = first_row.index("R")
+    blue = first_row.index("B")
+
+    padded = np.pad(mosaic.astype(np.uint32), 1, mode='reflect')
+    rgb = np.empty((height, width, 3), dtype=mosaic.dtype)
+
+    def around(r0, c0, offsets):
+        """ Rounded mean of the neighbours at offsets of the sub-lattice (r0, c0). """
+        parts = [padded[1 + r0 + di:1 + height + di:2, 1 + c0 + dj:1 + width + dj:2]
+                 for di, dj in offsets]
+        acc = parts[0].copy()
+        for part in parts[1:]:
+            acc += part
+        acc += len(offsets) // 2
+        acc //= len(offsets)
+        return acc
+
+    centre = [(0, 0)]
+    cross = [(-1, 0), (1, 0), (0, -1), (0, 1)]
+    diagonal = [(-1, -1), (-1, 1), (1, -1), (1, 1)]
+    horizontal = [(0, -1), (0, 1)]
+    vertical = [(-1, 0), (1, 0)]
+
+    for position in range(4):
+        r0, c0 = divmod(position, 2)
+        sub = rgb[r0::2, c0::2]
+        if position == red:
+            sub[..., 0] = around(r0, c0, centre)
+            sub[..., 1] = around(r0, c0, cross)
+            sub[..., 2] = around(r0, c0, diagonal)
+        elif position == blue:
+            sub[..., 0] = around(r0, c0, diagonal)
+            sub[..., 1] = around(r0, c0, cross)
+            sub[..., 2] = around(r0, c0, centre)
+        else:  # green, in the row of the red or in the row of the blue
+            red_in_row = red // 2 == r0
+            sub[..., 1] = around(r0, c0, centre)
+            sub[..., 0] = around(r0, c0, horizontal if red_in_row else vertical)
+            sub[..., 2] = around(r0, c0, vertical if red_in_row else horizontal)
+    return rgb
+
+
+def _decode_rows(raw, pixel_format, width, height, colorness):
+    mosaic = unpack(raw, pixel_format, width, height)
+    if not is_bayer(pixel_format) or colorness is None:
+        return mosaic
+    rgb = demosaic_bilinear(mosaic, pattern=pixel_format[5:7])
+    if colorness == "RGB":
+        return rgb
+    # Mono from a color sensor: mean of the three channels
+    return (rgb.sum(axis=2, dtype=np.uint32) // 3).astype(mosaic.dtype)
+
+
+def decode(raw, pixel_format, width, height, colorness="RGB", threads=1):
+    """ Decodes a raw packed buffer to the image that IDSinterface.capture()
+        would return.
+
+        raw: bytes-like or uint8 array with the packed buffer.
+        colorness: 'RGB' or 'Mono' for Bayer formats ('RGB' by default).
+                   None returns the mosaic without demosaicing.
+        threads: if > 1, the image is split in horizontal bands decoded in
+                 parallel (NumPy releases the GIL).
+    """
+    raw = np.frombuffer(raw, dtype=np.uint8)
+    if threads <= 1 or height < 8 * threads:
+        return _decode_rows(raw, pixel_format, width, height, colorness)
+
+    row_bytes = packed_size(pixel_format, width, 1)
+    halo = 2 if is_bayer(pixel_format) and colorness is not None else 0
+    bounds = [(height * k // threads) & ~1 for k in range(threads)] + [height]
+
+    def decode_band(k):
+        first = max(bounds[k] - halo, 0)
+        last = min(bounds[k + 1] + halo, height)
+        band = _decode_rows(raw[first * row_bytes:last * row_bytes],
+                            pixel_format, width, last - first, colorness)
+        return band[bounds[k] - first:bounds[k + 1] - first]
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        bands = list(pool.map(decode_band, range(threads)))
+    return np.concatenate(bands, axis=0)
+
+
+class RawFrame(object):
+    """ A raw packed frame as delivered by the camera, decoded only on demand. """
+
+    __slots__ = ("data", "pixel_format", "width", "height", "colorness", "_image")
+
+    def __init__(self, data, pixel_format, width, height, colorness="RGB"):
+        self.data = data
+        self.pixel_format = pixel_format
+        self.width = width
+        self.height = height
+        self.colorness = colorness
+        self._image = None
+
+    def decode(self, threads=1):
+        """ Decodes the frame (just once) and returns the image. """
+        if self._image is None:
+            self._image = decode(self.data, self.pixel_format, self.width,
+                                 self.height, self.colorness, threads)
+        return self._image
+
+
+class RawDecoderPool(object):
+    """ Decodes raw frames in a pool of workers, off the acquisition thread.
+
+        Usage:
+
+            pool = RawDecoderPool(max_workers=4)
+            future = pool.submit(my_interface.capture_raw())
+            image = future.result()
+
+        Threads are used by default, since NumPy releases the GIL. Pass
+        executor=concurrent.futures.ProcessPoolExecutor(...) to use processes.
+    """
+
+    def __init__(self, max_workers=None, executor=None):
+        self._executor = executor or ThreadPoolExecutor(max_workers=max_workers)
+
+    def submit(self, raw_frame):
+        return self._executor.submit(decode, raw_frame.data, raw_frame.pixel_format,
+                                     raw_frame.width, raw_frame.height,
+                                     raw_frame.colorness)
+
+    def map(self, raw_frames):
+        """ Decodes an iterable of raw frames, yielding the images in order. """
+        futures = [self.submit(frame) for frame in raw_frames]
+        for future in futures:
+            yield future.result()
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
@@ -0,0 +1,142 @@
+""" Live preview of a camera at a fixed display rate, whatever its frame rate.
+
+    The camera streams on its grabber thread (IDSinterface.start_streaming) and
+    the preview only takes the latest frame at every display tick, so the
+    frames in between are dropped, not queued. Every frame shown is reduced to
+    8 bits with a lookup table and decimated in a single pass, straight into a
+    preallocated buffer (or into the display surface itself).
+
+    Usage (with pygame):
+
+        from preview import Preview
+
+        preview = Preview(cams_interface, idx=0, binning=3, display_fps=30)
+        display = pygame.display.set_mode(preview.size)
+        surface = pygame.surfarray.pixels3d(display)  # (width, height, 3)
+        while running:
+            preview.next(out=surface.transpose(1, 0, 2))
+            pygame.display.flip()
+        preview.close()
+"""
+
+import time
+
+import numpy as np
+
+from telemetry import LatencyHistogram
+
+
+def make_lut(bit_depth, gamma=1., black=0, white=None):
+    """ uint8 lookup table for bit_depth bits images: black and below go to 0,
+        white (full scale by default) and above to 255, with the given gamma.
+        With the defaults, it is a plain shift of bit_depth - 8 bits.
+    """
+    levels = 2 ** bit_depth
+    if white is None:
+        white = levels - 1
+    if gamma == 1 and black == 0 and white == levels - 1:
+        return (np.arange(levels, dtype=np.uint32) >> max(bit_depth - 8, 0)).astype(np.uint8)
+    values = np.clip((np.arange(levels) - black) / max(white - black, 1), 0, 1)
+    return np.round(255 * values ** (1 / gamma)).astype(np.uint8)
+
+
+class PreviewRenderer(object):
+    """ Turns frames of bit_depth bits into 8 bits RGB (height // binning,
+        width // binning, 3) images for display: decimation and the lookup
+        table (make_lut(bit_depth) by default) in a single pass.
+    """
+
+    def __init__(self, shape, bit_depth=8, binning=1, lut=None):
+        self.shape = tuple(shape)
+        self.binning = binning
+        self.lut = make_lut(bit_depth) if lut is None else np.asarray(lut, dtype=np.uint8)
+        height, width = self.shape[0], self.shape[1]
+        self.size = (len(range(0, width, binning)), len(range(0, height, binning)))
+        self.image = np.empty((self.size[1], self.size[0], 3), dtype=np.uint8)
+        self._gray = None
+        if len(self.shape) == 2:  # gray frames are mapped once, then copied to R, G, B
+            self._gray = np.empty((self.size[1], self.size[0]), dtype=np.uint8)
+        self.render_time = LatencyHistogram()
+
+    def render(self, frame, out=None):
+        """ Renders frame into out (any (height, width, 3) uint8 array or view,
+            e.g. a transposed pygame surface) or into self.image. Returns it.
+        """
+        start = time.perf_counter()
+        if out is None:
+            out = self.image
+        view = frame[::self.binning, ::self.binning]
+        if self._gray is None:
+            np.take(self.lut, view, out=out, mode='clip')
+        else:
+            np.take(self.lut, view, out=self._gray, mode='clip')
+            np.copyto(out, self._gray[:, :, None])
+        self.render_time.record(time.perf_counter() - start)
+        return out
+
+
+class Preview(object):
+    """ Preview of device idx of cameras (an IDSinterface, already acquiring)
+        at display_fps. It starts streaming the device if it is not.
+
+        bit_depth: of the frames (that of the pixel format by default).
+        binning: decimation factor for the display.
+        lut: optional lookup table, see make_lut().
+    """
+
+    def __init__(self, cameras, idx=0, binning=1, display_fps=30, bit_depth=None,
+                 lut=None, ring_size=4):
+        self.cameras = cameras
+        self.idx = idx
+        self.period = 1 / display_fps
+        self._own_stream = not cameras.is_streaming(idx)
+        if self._own_stream:
+            cameras.start_streaming(idx, ring_size=ring_size)
+        shape, dtype = cameras.get_frame_layout(idx)
+        if bit_depth is None:
+            bit_depth = cameras.get_bit_depth(idx)
+        self.frame = np.empty(shape, dtype)  # last frame shown, as captured
+        self.renderer = PreviewRenderer(shape, bit_depth, binning, lut)
+        self.size = self.renderer.size  # (width, height) of the display
+        self.shown = 0
+        self.skipped = 0
+        self._last_seq = None
+        self._next_tick = time.perf_counter()
+
+    def next(self, out=None, timeout=1.):
+        """ Waits for the next display tick and renders the latest frame into
+            out (see PreviewRenderer.render()). The frames grabbed since the
+            last one shown are skipped. Returns the rendered image, or None if
+            there is no new frame within timeout seconds.
+        """
+        now = time.perf_counter()
+        if now < self._next_tick:
+            time.sleep(self._next_tick - now)
+        self._next_tick = max(self._next_tick + self.period, time.perf_counter())
+
+        deadline = time.perf_counter() + timeout
+        ring = self.cameras.get_stream_ring(self.idx)
+        seq, _ = ring.latest(self.frame)
+        while seq is None or seq == self._last_seq:
+            if time.perf_counter() >= deadline:
+                return None
+            time.sleep(0.0005)
+            seq, _ = ring.latest(self.frame)
+        if self._last_seq is not None:
+            self.skipped += seq - self._last_seq - 1
+        self._last_seq = seq
+        self.shown += 1
+        return self.renderer.render(self.frame, out)
+
+    def stats(self):
+        """ Frames shown and skipped, and the cost of rendering (in seconds),
+            which does not include the acquisition.
+        """
+        return {"shown": self.shown, "skipped": self.skipped,
+                "render": self.renderer.render_time.summary()}
+
+    def close(self):
+        """ Stops the streaming, if the preview started it. """
+        if self._own_stream:
+            self.cameras.stop_streaming(self.idx)
+            self._own_stream = False
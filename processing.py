@@ -0,0 +1,154 @@
+""" Image processing helpers for the capture pipeline, working in place on
+    preallocated arrays where possible.
+"""
+
+import numpy as np
+
+
+def binned_shape(shape, factor):
+    """ Shape of an image of the given shape after binning it by factor. """
+    return (shape[0] // factor, shape[1] // factor) + tuple(shape[2:])
+
+
+def bin_pixels(image, factor, mode="average", out=None):
+    """ Software binning: every factor x factor block of pixels becomes one pixel
+        with their average (or their sum, clipped to the dtype), unlike the
+        decimation of image[::factor, ::factor].
+
+        Rows and columns that don't fill a whole block are dropped.
+        image: (height, width) or (height, width, channels) array.
+        mode: 'average' or 'sum'.
+        out: optional preallocated array of binned_shape(image.shape, factor).
+    """
+    if mode not in ("average", "sum"):
+        raise ValueError(f"{mode} : Binning mode not supported. Choose one valid: "
+                         f"average, sum")
+    shape = binned_shape(image.shape, factor)
+    if out is None:
+        out = np.empty(shape, dtype=image.dtype)
+    elif out.shape != shape:
+        raise ValueError(f"The output array must be {shape}, not {out.shape}.")
+    if factor == 1:
+        np.copyto(out, image, casting='unsafe')
+        return out
+
+    blocks = image[:shape[0] * factor, :shape[1] * factor]
+    blocks = blocks.reshape((shape[0], factor, shape[1], factor) + shape[2:])
+    acc_dtype = np.float64 if np.issubdtype(image.dtype, np.floating) else np.uint64
+    acc = blocks.sum(axis=(1, 3), dtype=acc_dtype)
+    if mode == "average":
+        if acc_dtype is np.uint64:
+            acc += factor * factor // 2  # rounding
+            acc //= factor * factor
+        else:
+            acc /= factor * factor
+    elif np.issubdtype(out.dtype, np.integer):
+        np.minimum(acc, np.iinfo(out.dtype).max, out=acc)
+    np.copyto(out, acc, casting='unsafe')
+    return out
+
+
+class CapturePipeline(object):
+    """ Fused post-processing of the frames of camera idx of cameras (an
+        IDSinterface): decimation by binning (image[::binning, ::binning]), crop
+        to crop = (x, y, width, height) of the decimated frame, upside-down flip
+        and cast to dtype, with all the arrays preallocated.
+
+        The frame is converted into a scratch array and the rest is a single
+        strided copy into the output. The flip is done by the sensor when it can
+        (no decimation, Mono sensor), and when nothing is left to do in software
+        the frame is converted straight into the output.
+
+        Declare it before start_acquisition(): setting the sensor flip would
+        restart the acquisition, so while acquiring the sensor is left as it is
+        and the flip is done (or undone) in software.
+
+        calibration: optional calibration.Calibration applied to every frame
+                     (in place in self.out, if uint16).
+    """
+
+    def __init__(self, cameras, idx=0, binning=1, crop=None, flip=True, dtype=np.uint16):
+        self.cameras = cameras
+        self.idx = idx
+        self.key = (binning, crop, flip, np.dtype(dtype))
+        self.calibration = None
+
+        # The sensor flips at no cost, but only on the full-resolution grid
+        sensor_flip = flip and binning == 1
+        if cameras.get_reverse(idx)[1] != sensor_flip:
+            if cameras.is_acquiring(idx):
+                sensor_flip = not sensor_flip
+            else:
+                sensor_flip = cameras.set_reverse(reverse_y=sensor_flip, idx=idx)[1]
+        self.sensor_flip = sensor_flip
+
+        cameras.preallocate_conversion(idx)
+        shape, frame_dtype = cameras.get_frame_layout(idx)
+        self._frame = np.empty(shape, frame_dtype)
+        view = self._frame
+        rows = np.arange(shape[0])[::binning]
+        if crop is not None:
+            x, y, width, height = crop
+            rows = rows[y:y + height]
+        if not rows.size:
+            view = view[:0]
+        elif sensor_flip:  # the same rows, counted from the bottom
+            view = view[shape[0] - 1 - rows[-1]:shape[0] - rows[0]:binning]
+        else:
+            view = view[rows[0]:rows[-1] + 1:binning]
+        view = view[:, ::binning]
+        if crop is not None:
+            view = view[:, x:x + width]
+        soft_flip = flip != sensor_flip
+        if soft_flip:
+            view = view[::-1]
+
+        # a flipped view has the shape of the frame too, but it is not the frame
+        self._direct = view.shape == shape and np.dtype(dtype) == frame_dtype \
+            and not soft_flip
+        if self._direct:  # the view is the whole frame, as it is
+            self.out = self._frame
+        else:
+            self._view = view
+            self.out = np.empty(view.shape, dtype)
+
+    def capture(self):
+        """ Returns the next frame in self.out (or in the output of the
+            calibration), overwritten by the next call.
+        """
+        if self._direct:
+            self.cameras.capture_into(self.out, self.idx)
+        else:
+            self.cameras.capture_into(self._frame, self.idx)
+            np.copyto(self.out, self._view, casting='unsafe')
+        if self.calibration is not None:
+            return self.calibration.apply(self.out)
+        return self.out
+
+
+def image_stats(image, block_size=1 << 18):
+    """ Returns (mean, max, min) of image reading it from memory just once: the
+        three reductions run over blocks of rows, while each block is in cache.
+        Crops (non-contiguous views) are not copied.
+
+        block_size: approximate bytes per block.
+    """
+    if image.size == 0:
+        raise ValueError("Statistics of an empty image.")
+    if np.issubdtype(image.dtype, np.unsignedinteger):
+        acc_dtype = np.uint64
+    elif np.issubdtype(image.dtype, np.integer):
+        acc_dtype = np.int64
+    else:
+        acc_dtype = None  # pairwise summation in the float type is accurate enough
+    row_size = image[0].size * image.itemsize if image.ndim > 1 else image.itemsize
+    rows = max(block_size // row_size, 1)
+    total = 0
+    maximum = minimum = None
+    for start in range(0, len(image), rows):
+        block = image[start:start + rows]
+        total += float(block.sum(dtype=acc_dtype))
+        block_max, block_min = block.max(), block.min()
+        maximum = block_max if maximum is None else max(maximum, block_max)
+        minimum = block_min if minimum is None else min(minimum, block_min)
+    return total / image.size, maximum, minimum
@@ -0,0 +1,477 @@
+""" Recording of frame streams to disk at the full rate of the camera.
+
+    A recording is a directory with:
+
+        frames.npy      all the frames, preallocated for max_frames (memory-mapped),
+                        or frames.idsz for compressed recordings
+        index.npy       per-frame metadata (INDEX_DTYPE), preallocated as well
+        recording.json  shape, dtype, number of frames, settings and counters
+
+    Both .npy files can be read by numpy directly, e.g.
+    np.load("frames.npy", mmap_mode='r'), but load_recording() trims them to the
+    frames actually recorded and decodes packed or compressed frames.
+
+    Usage:
+
+        with Recorder("run1", shape=(1944, 2592), dtype=np.uint8, max_frames=10000) as rec:
+            rec.write(image, timestamp_ns, frame_id)  # from the acquisition thread
+        frames, index, info = load_recording("run1")
+
+    Or straight from a camera, see IDSinterface.start_recording().
+
+    TriggeredRecorder keeps just the frames around a trigger, in constant memory,
+    saving every event as a recording like the above.
+"""
+
+import json
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+from frame_store import compress, decompress, pack12, unpack12
+from ring_buffer import FrameRingBuffer
+
+FRAMES_FILE = "frames.npy"
+COMPRESSED_FRAMES_FILE = "frames.idsz"
+INDEX_FILE = "index.npy"
+INFO_FILE = "recording.json"
+
+# seq is -1 until the frame has been written, so an interrupted recording can be recovered
+INDEX_DTYPE = np.dtype([("seq", np.int64),
+                        ("timestamp_ns", np.int64),  # device time
+                        ("frame_id", np.int64),
+                        ("host_time", np.float64),  # time.perf_counter() [s]
+                        ("settings", np.int32),  # position in info["settings"]
+                        ("offset", np.int64),  # position of the frame in the frames file
+                        ("size", np.int64)])  # bytes of the frame in the frames file
+
+
+class Recorder(object):
+    """ Writes frames into a preallocated recording from a writer thread, so
+        the caller (typically the grabber thread) only copies each frame into a
+        free slot of a bounded queue.
+
+        When the queue is full, write() drops the frame and counts it (or waits
+        for a free slot if block is True). Both the drops and the waiting time
+        are reported by stats(), as a measure of backpressure.
+
+        path: directory of the recording. It is created if needed, but it must
+              not contain a recording yet.
+        shape, dtype: of every frame.
+        max_frames: frames preallocated on disk. Frames beyond it are not written.
+        queue_size: frames that can wait for the writer thread (preallocated).
+        block: whether write() waits for a free slot instead of dropping.
+        info: extra items (JSON serializable) saved in recording.json.
+        settings: acquisition settings (dict) of the first frames.
+        frame_format: how frames are stored (see frame_store):
+                      'raw': as they come.
+                      'packed12': 12 bits packed, 1.5 bytes per pixel (mono
+                                  uint16 only). Frames with higher values are
+                                  not written, and close() raises.
+                      'compressed': lossless, compressed by threads threads.
+    """
+
+    FRAME_FORMATS = ("raw", "packed12", "compressed")
+
+    def __init__(self, path, shape, dtype, max_frames, queue_size=16, block=False,
+                 info=None, settings=None, frame_format="raw", threads=2):
+        if max_frames < 1:
+            raise ValueError("max_frames must be at least 1.")
+        if queue_size < 1:
+            raise ValueError("queue_size must be at least 1.")
+        if frame_format not in self.FRAME_FORMATS:
+            raise ValueError(f"{frame_format} : Frame format not supported. Choose one "
+                             f"valid: {', '.join(self.FRAME_FORMATS)}")
+        if frame_format == "packed12" and (len(shape) != 2 or np.dtype(dtype) != np.uint16):
+            raise ValueError("Only mono uint16 frames can be packed to 12 bits.")
+        os.makedirs(path, exist_ok=True)
+        if os.path.exists(os.path.join(path, INFO_FILE)):
+            raise FileExistsError(f"There is already a recording in {path}.")
+        self.path = path
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.max_frames = max_frames
+        self.block = block
+        self.frame_format = frame_format
+        self.threads = threads
+
+        if frame_format == "compressed":  # variable size: appended one after the other
+            self._frames_offset = self._frame_size = 0
+            self._frames_file = open(os.path.join(path, COMPRESSED_FRAMES_FILE), 'wb',
+                                     buffering=0)
+        else:
+            # The frames are preallocated as a .npy file, but written with plain
+            # file writes: faster than page-faulting through a memmap
+            if frame_format == "packed12":
+                self._packed = pack12(np.zeros(self.shape, np.uint16))
+                stored_dtype, stored_shape = self._packed.dtype, self._packed.shape
+            else:
+                stored_dtype, stored_shape = self.dtype, self.shape
+            frames_path = os.path.join(path, FRAMES_FILE)
+            frames = np.lib.format.open_memmap(frames_path, mode='w+', dtype=stored_dtype,
+                                               shape=(max_frames,) + stored_shape)
+            self._frames_offset = frames.offset
+            self._frame_size = stored_dtype.itemsize * int(np.prod(stored_shape))
+            del frames
+            self._frames_file = open(frames_path, 'r+b', buffering=0)
+        self._end = self._frames_offset  # end of the last frame written
+        self._index = np.lib.format.open_memmap(os.path.join(path, INDEX_FILE), mode='w+',
+                                                dtype=INDEX_DTYPE, shape=(max_frames,))
+        self._index["seq"] = -1
+
+        self._slots = np.empty((queue_size,) + self.shape, dtype=self.dtype)
+        self._free = queue.Queue()
+        for slot in range(queue_size):
+            self._free.put(slot)
+        self._filled = queue.Queue()
+
+        self._info = dict(info or {})
+        self._settings = [dict(settings or {})]
+        self._accepted = 0  # frames queued so far
+        self.written = 0  # frames already in the memmap
+        self.dropped = 0  # frames dropped because the queue was full
+        self.overflow = 0  # frames beyond max_frames
+        self.max_queued = 0  # high-water mark of the queue
+        self.blocked_time = 0.  # seconds write() waited for a free slot
+        self.error = None
+        self._closed = False
+        self._lock = threading.Lock()  # write() vs close()
+        self._write_info()
+
+        self._thread = threading.Thread(target=self.__write_loop, name="IDSrecorder",
+                                        daemon=True)
+        self._thread.start()
+
+    def write(self, frame, timestamp_ns=0, frame_id=0, host_time=None):
+        """ Queues a copy of frame to be written. Returns False if it was not
+            queued (queue full, recording full or closed). A frame queued is
+            always written, even if close() is called meanwhile.
+        """
+        if host_time is None:
+            host_time = time.perf_counter()
+        with self._lock:
+            if self._closed:
+                return False
+            if self._accepted >= self.max_frames:
+                self.overflow += 1
+                return False
+            try:
+                slot = self._free.get_nowait()
+            except queue.Empty:
+                if not self.block:
+                    self.dropped += 1
+                    return False
+                t0 = time.perf_counter()
+                slot = self._free.get()  # the writer thread frees it, no lock needed
+                self.blocked_time += time.perf_counter() - t0
+            np.copyto(self._slots[slot], frame, casting='unsafe')
+            self._filled.put((slot, timestamp_ns, frame_id, host_time,
+                              len(self._settings) - 1))
+            self._accepted += 1
+            self.max_queued = max(self.max_queued, self._filled.qsize())
+        return True
+
+    def update_settings(self, **settings):
+        """ Acquisition settings changed: the frames written from now on refer to
+            the new ones (merged with the previous ones).
+        """
+        self._settings.append(dict(self._settings[-1], **settings))
+
+    def __write_loop(self):
+        while True:
+            item = self._filled.get()
+            if item is None:
+                break
+            slot, timestamp_ns, frame_id, host_time, settings = item
+            seq = self.written
+            try:
+                data = self.__encode(self._slots[slot])
+                offset = self._end
+                self._frames_file.seek(offset)
+                self._frames_file.write(data)
+                self._end = offset + len(data)
+                self._index[seq] = (seq, timestamp_ns, frame_id, host_time, settings,
+                                    offset, len(data))
+            except Exception as e:  # e.g. disk full; keep draining the queue
+                if self.error is None:
+                    self.error = e
+            else:
+                self.written = seq + 1
+            self._free.put(slot)
+
+    def __encode(self, frame):
+        if self.frame_format == "packed12":
+            return memoryview(pack12(frame, self._packed)).cast('B')
+        if self.frame_format == "compressed":
+            return compress(frame, self.threads)
+        return memoryview(frame).cast('B')
+
+    def stats(self):
+        """ Counters of the recording:
+                written: frames on disk.
+                queued: frames waiting for the writer thread.
+                dropped: frames dropped because the queue was full.
+                overflow: frames not written because max_frames was reached.
+                max_queued: maximum number of frames waiting at once.
+                blocked_time: seconds write() waited for the writer (block=True).
+        """
+        return {"written": self.written,
+                "queued": self._filled.qsize(),
+                "dropped": self.dropped,
+                "overflow": self.overflow,
+                "max_queued": self.max_queued,
+                "blocked_time": self.blocked_time}
+
+    def close(self):
+        """ Writes the queued frames, flushes the files and saves the metadata.
+            Returns stats().
+        """
+        with self._lock:  # after the write() in progress, if any
+            closing, self._closed = not self._closed, True
+            if closing:
+                self._filled.put(None)
+        if closing:
+            self._thread.join()
+            self._frames_file.close()
+            self._index.flush()
+            self._write_info()
+            if self.error is not None:
+                raise RuntimeError(f"Recording to {self.path} failed.") from self.error
+        return self.stats()
+
+    def _write_info(self):
+        info = dict(self._info, shape=list(self.shape), dtype=self.dtype.str,
+                    frame_format=self.frame_format, max_frames=self.max_frames,
+                    count=self.written if self._closed else None,
+                    settings=self._settings, stats=self.stats())
+        with open(os.path.join(self.path, INFO_FILE), 'w') as info_file:
+            json.dump(info, info_file, indent=4)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class TriggeredRecorder(object):
+    """ Circular recording around a trigger: it keeps the last pre_frames frames
+        in a preallocated ring and, when triggered, keeps post_frames more
+        frames (the trigger one included) and writes all of them to disk from a
+        background thread, as a recording in path/event_000, event_001...
+
+        It is triggered by trigger() or by condition(frame) being True (e.g.
+        mean_above()). Meanwhile, the frames are just copied into the ring, so
+        memory stays constant however long it runs. The frames arriving while an
+        event is being written are not kept (they are counted as missed). Then,
+        it is armed again for the next event if rearm is True.
+
+        write() has the same signature as Recorder.write(), so it can be fed by
+        IDSinterface.start_triggered_recording() or by hand. frame_format is
+        the one of the events, see Recorder.
+    """
+
+    ARMED, TRIGGERED, FLUSHING, DONE = "armed", "triggered", "flushing", "done"
+
+    def __init__(self, path, shape, dtype, pre_frames, post_frames=1, condition=None,
+                 rearm=False, info=None, settings=None, frame_format="raw"):
+        if pre_frames < 0 or post_frames < 0 or pre_frames + post_frames < 1:
+            raise ValueError("pre_frames and post_frames can't be negative, "
+                             "and at least one frame must be kept.")
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.pre_frames = pre_frames
+        self.post_frames = post_frames
+        self.condition = condition
+        self.rearm = rearm
+        self.frame_format = frame_format
+        self._ring = FrameRingBuffer(max(pre_frames + post_frames, 2), shape, dtype)
+        self._scratch = np.empty(self._ring.shape, self._ring.dtype)
+        self._info = dict(info or {})
+        self._settings = dict(settings or {})
+
+        self.state = self.ARMED
+        self.events = []  # paths of the events written
+        self.missed = 0  # frames not kept while writing an event
+        self.error = None
+        self._trigger_requested = False
+        self._trigger_seq = None  # sequence number of the trigger frame
+        self._armed_seq = 0  # first frame kept since armed (older ones were saved)
+        self._trigger_source = None
+        self._flushed = threading.Event()
+        self._flushed.set()
+        self._thread = None
+
+    def trigger(self):
+        """ Triggers with the next frame written (if armed). """
+        self._trigger_requested = True
+
+    def write(self, frame, timestamp_ns=0, frame_id=0, host_time=None):
+        """ Keeps a copy of frame. Returns False if it was not kept. """
+        if self.state == self.ARMED:
+            if self._trigger_requested:
+                self.__triggered("software")
+            elif self.condition is not None and self.condition(frame):
+                self.__triggered("condition")
+        elif self.state != self.TRIGGERED:
+            self.missed += 1
+            return False
+        if self.__complete():
+            self.missed += 1
+            return False
+        self._ring.push(frame, timestamp_ns, frame_id, host_time)
+        self.__complete()
+        return True
+
+    def __triggered(self, source):
+        self._flushed.clear()
+        self._trigger_requested = False
+        self._trigger_seq = self._ring.write_count
+        self._trigger_source = source
+        self.state = self.TRIGGERED
+
+    def __complete(self):
+        """ Starts writing the event if all the post-trigger frames are in. """
+        if (self.state != self.TRIGGERED
+                or self._ring.write_count < self._trigger_seq + self.post_frames):
+            return False
+        self.state = self.FLUSHING
+        self._thread = threading.Thread(target=self.__flush, name="IDStriggered",
+                                        daemon=True)
+        self._thread.start()
+        return True
+
+    def __flush(self):
+        first = max(self._trigger_seq - self.pre_frames, self._armed_seq)
+        last = self._trigger_seq + self.post_frames
+        path = os.path.join(self.path, f"event_{len(self.events):03d}")
+        info = dict(self._info, trigger_index=self._trigger_seq - first,
+                    trigger_source=self._trigger_source)
+        try:
+            if last == first:  # triggered before any frame, and no post_frames
+                raise ValueError("No frames to save for this trigger.")
+            with Recorder(path, self._ring.shape, self._ring.dtype, last - first,
+                          queue_size=2, block=True, info=info, settings=self._settings,
+                          frame_format=self.frame_format) as recorder:
+                for seq in range(first, last):
+                    recorder.write(self._ring.get(seq, self._scratch),
+                                   *self._ring.metadata(seq))
+            self.events.append(path)
+        except Exception as e:
+            self.error = e
+        self._armed_seq = self._ring.write_count
+        self.state = self.ARMED if self.rearm and self.error is None else self.DONE
+        self._flushed.set()
+
+    def wait(self, timeout=None):
+        """ Waits until the current event, if any, is on disk. Returns False on
+            timeout.
+        """
+        return self._flushed.wait(timeout)
+
+    def update_settings(self, **settings):
+        """ Acquisition settings changed: saved with the next events. """
+        self._settings.update(settings)
+
+    def stats(self):
+        """ Counters: state, frames kept in the ring, events written and frames
+            missed while writing them.
+        """
+        return {"state": self.state,
+                "frames": self._ring.write_count,
+                "events": len(self.events),
+                "missed": self.missed}
+
+    def close(self):
+        """ Waits for the event being written, if any, and stops keeping frames.
+            Returns stats().
+        """
+        if self._thread is not None:
+            self._thread.join()
+        self.state = self.DONE
+        if self.error is not None:
+            raise RuntimeError(f"Writing an event to {self.path} failed.") from self.error
+        return self.stats()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def mean_above(threshold, roi=None):
+    """ Trigger condition for TriggeredRecorder: the mean of the frame, or of
+        its roi (x, y, width, height), is above threshold.
+    """
+    if roi is None:
+        return lambda frame: frame.mean() > threshold
+    x, y, width, height = roi
+    return lambda frame: frame[y:y + height, x:x + width].mean() > threshold
+
+
+class LazyFrames(object):
+    """ Frames of a packed or compressed recording, decoded when indexed:
+        frames[i] is an array, frames[i:j] a stacked array of several.
+    """
+
+    def __init__(self, count, decode, shape, dtype):
+        self._count = count
+        self._decode = decode  # i: frame i
+        self.shape = (count,) + tuple(shape)
+        self.dtype = np.dtype(dtype)
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return np.stack([self._decode(i) for i in range(*item.indices(self._count))])
+        if item < 0:
+            item += self._count
+        if not 0 <= item < self._count:
+            raise IndexError(f"Frame {item} out of range, there are {self._count}.")
+        return self._decode(item)
+
+    def __iter__(self):
+        for i in range(self._count):
+            yield self._decode(i)
+
+
+def load_recording(path, mode='r'):
+    """ Returns (frames, index, info) of the recording in path: the frames and
+        their metadata (INDEX_DTYPE) as memory-mapped arrays of the frames
+        recorded, and the contents of recording.json. Packed and compressed
+        frames are returned as LazyFrames, decoding each frame when read.
+
+        If the recording was interrupted, the frames written up to that point
+        are returned.
+    """
+    with open(os.path.join(path, INFO_FILE)) as info_file:
+        info = json.load(info_file)
+    index = np.load(os.path.join(path, INDEX_FILE), mmap_mode=mode)
+    count = info["count"]
+    if count is None:  # not closed
+        written = np.flatnonzero(index["seq"] < 0)
+        count = int(written[0]) if written.size else len(index)
+    index = index[:count]
+
+    frame_format = info.get("frame_format", "raw")
+    if frame_format == "compressed":
+        if not count:
+            return np.empty([0] + info["shape"], info["dtype"]), index, info
+        data = np.memmap(os.path.join(path, COMPRESSED_FRAMES_FILE), dtype=np.uint8,
+                         mode='r')
+        frames = LazyFrames(count, lambda i: decompress(
+                                data[index[i]["offset"]:][:index[i]["size"]]),
+                            info["shape"], info["dtype"])
+    else:
+        frames = np.load(os.path.join(path, FRAMES_FILE), mmap_mode=mode)[:count]
+        if frame_format == "packed12":
+            packed = frames
+            frames = LazyFrames(count, lambda i: unpack12(packed[i]),
+                                info["shape"], info["dtype"])
+    return frames, index, info
@@ -0,0 +1,297 @@
+import json
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+class FrameRingBuffer(object):
+    """ Preallocated ring of frames written by a single producer (the grabber thread)
+        and read without locks.
+
+        Every slot carries a sequence number. The producer marks the slot as busy
+        (-1) while it is being written and stores the frame's sequence number once
+        it is complete. Readers copy the slot and check that the sequence number
+        did not change meanwhile (seqlock), so they never get a torn frame and
+        never block the producer.
+
+        Usage (producer side):
+
+            slot = ring.begin_write()
+            np.copyto(slot, image)
+            ring.commit(timestamp_ns=..., frame_id=...)
+
+        Usage (consumer side):
+
+            seq, image = ring.latest()  # the most recent frame
+            seq, image = ring.next(timeout=0.1)  # the next frame not read yet
+
+        Any number of consumers can call latest() and get(), but next() keeps a
+        single position (that of capture_stream()): every other consumer that
+        needs all the frames takes its own cursor().
+
+            cursor = ring.cursor()
+            seq, image = cursor.next(timeout=0.1)
+    """
+
+    def __init__(self, size, shape, dtype):
+        if size < 2:
+            raise ValueError("The ring buffer needs at least 2 slots.")
+        self.size = size
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+
+        self._frames = np.zeros((size,) + self.shape, dtype=self.dtype)
+        self._seqs = np.full(size, -1, dtype=np.int64)
+        self._timestamps = np.zeros(size, dtype=np.int64)  # device time [ns]
+        self._host_times = np.zeros(size, dtype=np.float64)  # time.perf_counter() [s]
+        self._frame_ids = np.zeros(size, dtype=np.int64)
+
+        self._write_count = 0  # frames committed so far (only the producer writes it)
+        self._cursor = RingCursor(self, 0)  # that of next()
+
+    @property
+    def write_count(self):
+        return self._write_count
+
+    @property
+    def overwritten(self):
+        """ Frames overwritten before next() could read them. """
+        return self._cursor.overwritten
+
+    def cursor(self, start=None):
+        """ A new RingCursor, from frame start (the next one written by default). """
+        return RingCursor(self, start)
+
+    def begin_write(self):
+        """ Returns the slot (a view) where the next frame must be written. """
+        slot = self._write_count % self.size
+        self._seqs[slot] = -1  # busy
+        return self._frames[slot]
+
+    def commit(self, timestamp_ns=0, frame_id=0, host_time=None):
+        """ Publishes the slot returned by the last begin_write(). """
+        seq = self._write_count
+        slot = seq % self.size
+        self._timestamps[slot] = timestamp_ns
+        self._host_times[slot] = time.perf_counter() if host_time is None else host_time
+        self._frame_ids[slot] = frame_id
+        self._seqs[slot] = seq
+        self._write_count = seq + 1
+        return seq
+
+    def push(self, image, timestamp_ns=0, frame_id=0, host_time=None):
+        """ Copies image into the next slot and publishes it. """
+        np.copyto(self.begin_write(), image, casting='unsafe')
+        return self.commit(timestamp_ns, frame_id, host_time)
+
+    def get(self, seq, out=None):
+        """ Returns a copy of the frame with sequence number seq, or None if it has
+            not been written yet or it has already been overwritten.
+        """
+        if seq < 0 or seq >= self._write_count or seq < self._write_count - self.size:
+            return None
+        slot = seq % self.size
+        if self._seqs[slot] != seq:
+            return None
+        if out is None:
+            out = self._frames[slot].copy()
+        else:
+            np.copyto(out, self._frames[slot])
+        if self._seqs[slot] != seq:  # the producer wrote over it while copying
+            return None
+        return out
+
+    def metadata(self, seq):
+        """ Returns (timestamp_ns, frame_id, host_time) of frame seq, or None. """
+        slot = seq % self.size
+        if seq < 0 or self._seqs[slot] != seq:
+            return None
+        meta = (int(self._timestamps[slot]), int(self._frame_ids[slot]),
+                float(self._host_times[slot]))
+        if self._seqs[slot] != seq:
+            return None
+        return meta
+
+    def latest(self, out=None):
+        """ Returns (seq, frame) for the most recent frame, or (None, None) if
+            there is no frame yet. It never blocks.
+        """
+        while self._write_count:
+            seq = self._write_count - 1
+            frame = self.get(seq, out)
+            if frame is not None:
+                return seq, frame
+        return None, None
+
+    def next(self, timeout=0, out=None):
+        """ Returns (seq, frame) for the oldest frame not read by next() yet.
+            See RingCursor.next().
+        """
+        return self._cursor.next(timeout, out)
+
+    def pending(self):
+        """ Number of frames committed but not read by next() yet. """
+        return self._cursor.pending()
+
+
+class RingCursor(object):
+    """ Position of a consumer that reads every frame of a FrameRingBuffer, in
+        order. Only its consumer must use it.
+    """
+
+    def __init__(self, ring, start=None):
+        self.ring = ring
+        self.read_count = ring.write_count if start is None else start
+        self.overwritten = 0  # frames overwritten before it could read them
+
+    def next(self, timeout=0, out=None):
+        """ Returns (seq, frame) for the oldest frame not read by this cursor yet.
+
+            If the consumer is too slow and the frame it was waiting for has been
+            overwritten, it jumps to the oldest available one and the skipped
+            frames are added to self.overwritten.
+
+            With timeout=0 it returns (None, None) straight away when there is no
+            new frame. Otherwise, it polls for up to timeout seconds.
+        """
+        ring = self.ring
+        deadline = time.perf_counter() + timeout
+        while True:
+            write_count = ring.write_count
+            oldest = max(write_count - ring.size + 1, 0)  # oldest slot is being written
+            if self.read_count < oldest:
+                self.overwritten += oldest - self.read_count
+                self.read_count = oldest
+            if self.read_count < write_count:
+                seq = self.read_count
+                frame = ring.get(seq, out)
+                if frame is not None:
+                    self.read_count = seq + 1
+                    return seq, frame
+                continue  # overwritten meanwhile, try again with the new oldest
+            if time.perf_counter() >= deadline:
+                return None, None
+            time.sleep(0.0002)
+
+    def pending(self):
+        """ Number of frames committed but not read by this cursor yet. """
+        return self.ring.write_count - self.read_count
+
+
+class SharedFrameRingBuffer(FrameRingBuffer):
+    """ FrameRingBuffer in named shared memory, so the producer and the consumers
+        can live in different processes.
+
+        The producer creates it with a size, shape and dtype, and the consumers
+        attach to it by name. Every process keeps its own next() cursor, which
+        starts at the frames written after attaching.
+
+            ring = SharedFrameRingBuffer("cam0", 8, (1944, 2592), np.uint16)  # producer
+            ring = SharedFrameRingBuffer("cam0")  # consumer, in another process
+
+        The producer must unlink() it when done, and everyone close() it.
+    """
+
+    _HEADER_SIZE = 1024  # JSON with size, shape and dtype, zero padded
+
+    def __init__(self, name, size=None, shape=None, dtype=None):
+        created = size is not None
+        if created:
+            if size < 2:
+                raise ValueError("The ring buffer needs at least 2 slots.")
+            header = json.dumps({"size": size, "shape": list(shape),
+                                 "dtype": np.dtype(dtype).str}).encode()
+            frames_offset = self.__frames_offset(size)
+            nbytes = frames_offset + size * np.dtype(dtype).itemsize * int(np.prod(shape))
+            self._shm = shared_memory.SharedMemory(name=name, create=True, size=nbytes)
+            self._shm.buf[:len(header)] = header
+        else:
+            self._shm = _attach_shared_memory(name)
+            header = bytes(self._shm.buf[:self._HEADER_SIZE]).rstrip(b"\0")
+            header = json.loads(header)
+            size, shape, dtype = header["size"], header["shape"], header["dtype"]
+        self.name = name
+        self.size = size
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+
+        # np.frombuffer() keeps the mapping exported while any view is alive
+        buf = self._shm.buf
+        offset = self._HEADER_SIZE
+        self._counters = np.frombuffer(buf, np.int64, 8, offset)  # [write count, ...]
+        offset += self._counters.nbytes
+        self._seqs, self._timestamps, self._frame_ids = [
+            np.frombuffer(buf, np.int64, size, offset + i * 8 * size) for i in range(3)]
+        self._host_times = np.frombuffer(buf, np.float64, size, offset + 3 * 8 * size)
+        self._frames = np.frombuffer(buf, self.dtype, size * int(np.prod(self.shape)),
+                                     self.__frames_offset(size)).reshape((size,) + self.shape)
+        if created:
+            self._seqs[:] = -1
+        self._cursor = RingCursor(self)
+
+    @classmethod
+    def __frames_offset(cls, size):
+        offset = cls._HEADER_SIZE + 8 * 8 + 4 * 8 * size
+        return (offset + 63) // 64 * 64
+
+    @property
+    def _write_count(self):
+        return int(self._counters[0])
+
+    @_write_count.setter
+    def _write_count(self, value):
+        self._counters[0] = value
+
+    def latest_view(self):
+        """ Returns (seq, frame) for the most recent frame without copying it:
+            frame is a view of its slot, valid until size - 1 frames more are
+            written. (None, None) if there is no frame yet.
+        """
+        seq = self._write_count - 1
+        if seq < 0:
+            return None, None
+        return seq, self._frames[seq % self.size]
+
+    def close(self):
+        """ Detaches from the shared memory. If views of latest_view() are still
+            in use, the memory stays mapped until they are gone.
+        """
+        if self._frames is None:
+            return
+        self._counters = self._seqs = self._timestamps = self._frame_ids = None
+        self._host_times = self._frames = None
+        _close_shared_memory(self._shm)
+
+    def unlink(self):
+        """ Frees the shared memory, once every process has closed it. """
+        self._shm.unlink()
+
+
+_closing = []  # SharedMemory closed while views of it were in use
+
+
+def _close_shared_memory(shm):
+    """ Closes shm, or keeps it mapped while there are views of it (closing it
+        then would leave them pointing to unmapped memory). The ones kept are
+        closed by the next calls, once their views are gone.
+    """
+    _closing.append(shm)
+    for pending in list(_closing):
+        try:
+            pending.close()
+        except BufferError:  # views still in use
+            continue
+        _closing.remove(pending)
+
+
+def _attach_shared_memory(name):
+    """ Attaches to existing shared memory, without tracking it where possible
+        (its creator owns it). Before Python 3.13 it is always tracked, which is
+        harmless for processes started by multiprocessing (they share the
+        tracker of their parent).
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
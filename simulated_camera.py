@@ -0,0 +1,862 @@
+""" Simulated IDS cameras, to run IDSinterface without the IDS SDK or any
+    camera attached (CI machines, benchmarks, LabVIEW development...).
+
+    SimulatedBackend mimics the subset of the ids_peak, ids_peak_ipl and
+    ids_peak_ipl_extension modules used by IDSinterface: device manager,
+    devices, nodemaps, datastreams with announced/queued buffers, and IPL
+    images and conversions.
+
+    The cameras deliver deterministic frames (a static scene plus a bar that
+    moves 4 pixels per frame) in the selected packed pixel format, at the
+    selected frame rate and in real time. The signal scales with the exposure
+    time and the gain. When no queued buffer is available for a frame, the
+    frame is lost and counted as an underrun, as with a real camera.
+
+    With TriggerMode On, a frame is exposed for every trigger (TriggerSoftware,
+    or SimulatedCamera.fire() for the external lines), unless the sensor is
+    still busy with the previous one: then the trigger is missed.
+
+    Usage:
+
+        from interface import IDSinterface
+        from simulated_camera import SimulatedBackend
+
+        my_interface = IDSinterface(backend=SimulatedBackend(num_devices=2))
+        my_interface.select_and_start_device(0)
+        image = my_interface.capture(0)
+"""
+
+import collections
+import ctypes
+import threading
+import time
+
+import numpy as np
+
+import packed_formats
+
+
+# ---------------------------------------------------------------------------
+# ids_peak
+# ---------------------------------------------------------------------------
+
+class PeakException(Exception):
+    """ Base of the simulated ids_peak exceptions (ids_peak.Exception). """
+
+
+class NotFoundException(PeakException):
+    pass
+
+
+class NotAvailableException(PeakException):
+    pass
+
+
+class NotInitializedException(PeakException):
+    pass
+
+
+class BadAccessException(PeakException):
+    pass
+
+
+class OutOfRangeException(PeakException):
+    pass
+
+
+class TimeoutException(PeakException):
+    pass
+
+
+class AbortedException(PeakException):
+    pass
+
+
+class _List(list):
+    """ The containers of the SDK have an empty() method. """
+
+    def empty(self):
+        return not self
+
+
+class _Entry(object):
+    def __init__(self, name):
+        self._name = name
+
+    def StringValue(self):
+        return self._name
+
+    def SymbolicValue(self):
+        return self._name
+
+    def Value(self):
+        return self._name
+
+
+class _ValueNode(object):
+    """ Integer or float node. Limits can be callables, so they can depend on
+        other nodes (e.g. the exposure time limits the frame rate).
+    """
+
+    def __init__(self, camera, attribute, minimum, maximum, increment=None,
+                 locked=False, writable=True):
+        self._camera = camera
+        self._attribute = attribute
+        self._minimum = minimum
+        self._maximum = maximum
+        self._increment = increment
+        self._locked = locked
+        self._writable = writable
+
+    def Value(self):
+        return getattr(self._camera, self._attribute)
+
+    def Minimum(self):
+        return self._minimum() if callable(self._minimum) else self._minimum
+
+    def Maximum(self):
+        return self._maximum() if callable(self._maximum) else self._maximum
+
+    def Increment(self):
+        return self._increment or 1
+
+    def SetValue(self, value):
+        if not self._writable or (self._locked and self._camera.params_locked):
+            raise BadAccessException(f"{self._attribute} is not writable now.")
+        if not self.Minimum() <= value <= self.Maximum():
+            raise OutOfRangeException(f"{value} out of range [{self.Minimum()}, "
+                                      f"{self.Maximum()}] for {self._attribute}.")
+        if self._increment and (value - self.Minimum()) % self._increment:
+            raise OutOfRangeException(f"{self._attribute} must be a multiple "
+                                      f"of {self._increment}.")
+        self._camera.set(self._attribute, value)
+
+
+class _EnumerationNode(object):
+    def __init__(self, camera, attribute, entries, locked=False):
+        self._camera = camera
+        self._attribute = attribute
+        self._entries = entries
+        self._locked = locked
+
+    def Entries(self):
+        return _List(_Entry(x) for x in self._entries)
+
+    def CurrentEntry(self):
+        return _Entry(getattr(self._camera, self._attribute))
+
+    def SetCurrentEntry(self, entry):
+        if isinstance(entry, _Entry):
+            entry = entry.StringValue()
+        if entry not in self._entries:
+            raise OutOfRangeException(f"{entry} is not an entry of {self._attribute}.")
+        if self._locked and self._camera.params_locked:
+            raise BadAccessException(f"{self._attribute} is not writable now.")
+        self._camera.set(self._attribute, entry)
+
+
+class _CommandNode(object):
+    def __init__(self, func):
+        self._func = func
+
+    def Execute(self):
+        self._func()
+
+    def WaitUntilDone(self, timeout_ms=None):
+        pass
+
+    def IsDone(self):
+        return True
+
+
+class _NodeMap(object):
+    def __init__(self, nodes):
+        self._nodes = nodes
+
+    def FindNode(self, name):
+        try:
+            return self._nodes[name]
+        except KeyError:
+            raise NotFoundException(f"Node {name} not found.") from None
+
+    def HasNode(self, name):
+        return name in self._nodes
+
+
+class _Buffer(object):
+    def __init__(self, size):
+        self._data = np.zeros(size, dtype=np.uint8)
+        self._frame_id = 0
+        self._timestamp_ns = 0
+        self._width = 0
+        self._height = 0
+        self._pixel_format = None
+
+    def BasePtr(self):
+        return self._data.ctypes.data
+
+    def Size(self):
+        return self._data.size
+
+    def FrameID(self):
+        return self._frame_id
+
+    def Timestamp_ns(self):
+        return self._timestamp_ns
+
+    def IsIncomplete(self):
+        return False
+
+    def Width(self):
+        return self._width
+
+    def Height(self):
+        return self._height
+
+    def PixelFormat(self):
+        return self._pixel_format
+
+
+class _DataStream(object):
+    """ Frames are produced lazily, when the consumer waits for them: every
+        frame due since the last call takes the oldest queued buffer, or it is
+        lost (underrun) if there is none.
+    """
+
+    def __init__(self, camera):
+        self._camera = camera
+        self._condition = threading.Condition()
+        self._announced = []
+        self._queued = collections.deque()
+        self._finished = collections.deque()
+        self._grabbing = False
+        self._killed = False
+        self._next_time = 0.
+        self._next_frame_id = 0
+        self._delivered = 0
+        self._underruns = 0
+        self._started = 0
+        self._triggered = False
+        camera.datastream = self  # to wake it up on triggers
+        self._nodemap = _NodeMap({
+            "StreamLostFrameCount": _ValueNode(self, "_underruns", 0, 2**63,
+                                               writable=False),
+            "StreamDeliveredFrameCount": _ValueNode(self, "_delivered", 0, 2**63,
+                                                    writable=False)})
+
+    def NodeMaps(self):
+        return _List([self._nodemap])
+
+    def NumBuffersAnnouncedMinRequired(self):
+        return self._camera.min_buffers
+
+    def NumBuffersAnnounced(self):
+        return len(self._announced)
+
+    def NumBuffersQueued(self):
+        return len(self._queued)
+
+    def NumBuffersAwaitDelivery(self):
+        return len(self._finished)
+
+    def NumBuffersDelivered(self):
+        return self._delivered
+
+    def NumBuffersStarted(self):
+        return self._started
+
+    def NumUnderruns(self):
+        return self._underruns
+
+    def AnnouncedBuffers(self):
+        return _List(self._announced)
+
+    def AllocAndAnnounceBuffer(self, size, user_ptr=None):
+        buff = _Buffer(size)
+        with self._condition:
+            self._announced.append(buff)
+        return buff
+
+    def RevokeBuffer(self, buff):
+        with self._condition:
+            if self._grabbing:
+                raise BadAccessException("Buffers can't be revoked while grabbing.")
+            self._announced.remove(buff)
+            if buff in self._queued:
+                self._queued.remove(buff)
+            if buff in self._finished:
+                self._finished.remove(buff)
+
+    def QueueBuffer(self, buff):
+        with self._condition:
+            if buff not in self._announced:
+                raise BadAccessException("The buffer is not announced.")
+            self._queued.append(buff)
+
+    def StartAcquisition(self, mode=None, num_to_acquire=None):
+        with self._condition:
+            if self._grabbing:
+                raise BadAccessException("The datastream is already grabbing.")
+            self._grabbing = True
+            self._next_time = time.perf_counter() + 1 / self._camera.fps
+
+    def StopAcquisition(self, mode=None):
+        with self._condition:
+            self._grabbing = False
+            self._condition.notify_all()
+
+    def Flush(self, mode=None):
+        with self._condition:
+            self._queued.clear()
+            self._finished.clear()
+
+    def KillWait(self):
+        with self._condition:
+            self._killed = True
+            self._condition.notify_all()
+
+    def IsGrabbing(self):
+        return self._grabbing
+
+    def _produce(self, now):
+        """ Fills the queued buffers with the frames due until now. """
+        camera = self._camera
+        if not self._grabbing or not camera.acquiring:
+            self._next_time = max(self._next_time, now)
+            camera.triggers.clear()
+            return
+        if camera.trigger_mode == "On":
+            if not self._triggered:  # the sensor waits for the first trigger
+                self._triggered = True
+                self._next_time = 0.
+            self._produce_triggered(now)
+            return
+        if self._triggered:  # free running again, from now on
+            self._triggered = False
+            self._next_time = max(self._next_time, now)
+        while self._next_time <= now:
+            self._new_frame(self._next_time)
+            self._next_time += 1 / camera.fps
+
+    def _produce_triggered(self, now):
+        """ A frame per trigger, delivered once exposed and read out. Until
+            then (_next_time), the sensor misses any other trigger.
+        """
+        camera = self._camera
+        duration = camera.exposure / 1e6 + camera.readout_time()
+        while camera.triggers and camera.triggers[0] + duration <= now:
+            start = camera.triggers.popleft()
+            if start < self._next_time:  # still exposing or reading out
+                camera.missed_triggers += 1
+                continue
+            self._new_frame(start)
+            self._next_time = start + duration
+
+    def _next_due(self):
+        """ When the next frame will be due, if it is known. """
+        camera = self._camera
+        if camera.trigger_mode != "On":
+            return self._next_time
+        if camera.triggers:
+            return camera.triggers[0] + camera.exposure / 1e6 + camera.readout_time()
+        return float("inf")
+
+    def _new_frame(self, start):
+        frame_id = self._next_frame_id
+        self._next_frame_id += 1
+        if self._queued:
+            buff = self._queued.popleft()
+            buff._frame_id = frame_id
+            buff._timestamp_ns = int(start * 1e9)
+            self._finished.append(buff)
+            self._started += 1
+        else:
+            self._underruns += 1
+
+    def WaitForFinishedBuffer(self, timeout_ms):
+        deadline = time.perf_counter() + timeout_ms / 1000
+        with self._condition:
+            while True:
+                if self._killed:
+                    self._killed = False
+                    raise AbortedException("Wait aborted by KillWait().")
+                now = time.perf_counter()
+                self._produce(now)
+                if self._finished:
+                    buff = self._finished.popleft()
+                    break
+                if now >= deadline:
+                    raise TimeoutException("Wait timed out.")
+                wake = min(deadline, self._next_due()) if self._grabbing else deadline
+                self._condition.wait(max(wake - now, 0))
+        self._camera.render(buff)
+        self._delivered += 1
+        return buff
+
+
+class _Device(object):
+    def __init__(self, camera):
+        self._camera = camera
+        self._remote = _RemoteDevice(camera)
+        self._datastream = _DataStream(camera)
+
+    def ModelName(self):
+        return self._camera.model
+
+    def SerialNumber(self):
+        return self._camera.serial
+
+    def DataStreams(self):
+        return _List([_DataStreamDescriptor(self._datastream)])
+
+    def RemoteDevice(self):
+        return self._remote
+
+
+class _RemoteDevice(object):
+    def __init__(self, camera):
+        self._nodemap = camera.nodemap
+
+    def NodeMaps(self):
+        return _List([self._nodemap])
+
+
+class _DataStreamDescriptor(object):
+    def __init__(self, datastream):
+        self._datastream = datastream
+
+    def OpenDataStream(self):
+        return self._datastream
+
+
+class _DeviceDescriptor(object):
+    def __init__(self, camera):
+        self._camera = camera
+        self._device = None
+
+    def ModelName(self):
+        return self._camera.model
+
+    def SerialNumber(self):
+        return self._camera.serial
+
+    def IsOpenable(self, access_type=None):
+        return self._device is None
+
+    def OpenDevice(self, access_type=None):
+        if self._device is not None:
+            raise BadAccessException(f"{self._camera.model} is already open.")
+        self._device = _Device(self._camera)
+        return self._device
+
+
+class _DeviceManager(object):
+    def __init__(self, cameras):
+        self._cameras = cameras
+        self._devices = _List()
+
+    def Update(self):
+        if not self._devices:
+            self._devices.extend(_DeviceDescriptor(camera) for camera in self._cameras)
+
+    def Devices(self):
+        return self._devices
+
+
+class _Library(object):
+    def Initialize(self):
+        pass
+
+    def Close(self):
+        pass
+
+
+class _PeakModule(object):
+    """ Stands for the ids_peak module. """
+
+    Exception = PeakException
+    NotFoundException = NotFoundException
+    NotAvailableException = NotAvailableException
+    NotInitializedException = NotInitializedException
+    BadAccessException = BadAccessException
+    OutOfRangeException = OutOfRangeException
+    TimeoutException = TimeoutException
+    AbortedException = AbortedException
+
+    DeviceAccessType_Control = "Control"
+    AcquisitionStopMode_Default = "Default"
+    DataStreamFlushMode_DiscardAll = "DiscardAll"
+
+    def __init__(self, cameras):
+        self.Library = _Library()
+        manager = _DeviceManager(cameras)
+        self.DeviceManager = type("DeviceManager", (object,),
+                                  {"Instance": staticmethod(lambda: manager)})
+
+
+# ---------------------------------------------------------------------------
+# ids_peak_ipl and ids_peak_ipl_extension
+# ---------------------------------------------------------------------------
+
+# outer name: (channels, bit depth)
+_OUTER_FORMATS = {"Mono8": (1, 8), "Mono10": (1, 10), "Mono12": (1, 12),
+                  "RGB8": (3, 8), "RGB10": (3, 10), "RGB12": (3, 12)}
+
+
+class _PixelFormat(object):
+    def __init__(self, name):
+        if name in _OUTER_FORMATS:
+            self._channels, self._bits = _OUTER_FORMATS[name]
+        else:
+            self._channels, self._bits = 1, packed_formats.bit_depth(name)
+        self._name = name
+
+    def Name(self):
+        return self._name
+
+    def NumChannels(self):
+        return self._channels
+
+    def NumSignificantBitsPerChannel(self):
+        return self._bits
+
+
+class _Image(object):
+    """ An IPL image: either packed (as delivered by the camera) or converted. """
+
+    def __init__(self, pixel_format, data, width, height):
+        self._pixel_format = pixel_format
+        self._data = data
+        self._width = width
+        self._height = height
+
+    def PixelFormat(self):
+        return _PixelFormat(self._pixel_format)
+
+    def Width(self):
+        return self._width
+
+    def Height(self):
+        return self._height
+
+    def ConvertTo(self, pixel_format, output_ptr=None, output_size=None):
+        return _convert(self, pixel_format, output_ptr, output_size)
+
+    def get_numpy_1D(self):
+        return self._data.reshape(-1).view(np.uint8)
+
+    def get_numpy_2D(self):
+        return self._data.view(np.uint8).reshape(self._height, -1)
+
+    def get_numpy_2D_16(self):
+        return self._data.reshape(self._height, -1)
+
+    def get_numpy_3D(self):
+        return self._data.view(np.uint8).reshape(self._height, self._width, -1)
+
+    def get_numpy_3D_16(self):
+        return self._data.reshape(self._height, self._width, -1)
+
+
+def _output_layout(image, pixel_format):
+    channels, bits = _OUTER_FORMATS[pixel_format]
+    width, height = image.Width(), image.Height()
+    shape = (height, width) if channels == 1 else (height, width, channels)
+    return shape, np.uint8 if bits <= 8 else np.uint16
+
+
+def _output_view(shape, dtype, output_ptr, output_size):
+    """ Array over the memory at output_ptr. """
+    nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+    if output_size < nbytes:
+        raise BadAccessException("The output buffer is too small.")
+    memory = (ctypes.c_uint8 * nbytes).from_address(output_ptr)
+    return np.frombuffer(memory, dtype=dtype).reshape(shape)
+
+
+def _convert(image, pixel_format, output_ptr=None, output_size=None, out=None):
+    channels, bits = _OUTER_FORMATS[pixel_format]
+    width, height = image.Width(), image.Height()
+    if out is None:
+        shape, dtype = _output_layout(image, pixel_format)
+        out = np.empty(shape, dtype=dtype) if output_ptr is None else \
+            _output_view(shape, dtype, output_ptr, output_size)
+
+    inner = image._pixel_format
+    inner_bits = packed_formats.bit_depth(inner)
+    raw = image.get_numpy_1D()
+    if channels == 1 and not packed_formats.is_bayer(inner) and inner_bits == bits \
+            and out.dtype == np.uint16:
+        packed_formats.unpack(raw, inner, width, height, out)
+    else:
+        decoded = packed_formats.decode(raw, inner, width, height,
+                                        "RGB" if channels == 3 else "Mono")
+        if inner_bits > bits:
+            decoded = decoded >> (inner_bits - bits)
+        elif inner_bits < bits:
+            decoded = decoded.astype(np.uint16) << (bits - inner_bits)
+        np.copyto(out, decoded, casting='unsafe')
+    return _Image(pixel_format, out, width, height)
+
+
+class _ImageConverter(object):
+    def __init__(self):
+        self._view = None  # ((pointer, size, pixel format, shape), array over it)
+
+    def PreAllocateConversion(self, input_format, output_format, width, height):
+        pass
+
+    def Convert(self, image, pixel_format, output_ptr=None, output_size=None):
+        if output_ptr is None:
+            return _convert(image, pixel_format)
+        # like the SDK, it does not allocate per frame when the output is the same
+        key = (output_ptr, output_size, pixel_format, image.Width(), image.Height())
+        if self._view is None or self._view[0] != key:
+            shape, dtype = _output_layout(image, pixel_format)
+            self._view = (key, _output_view(shape, dtype, output_ptr, output_size))
+        return _convert(image, pixel_format, out=self._view[1])
+
+
+class _IplModule(object):
+    """ Stands for the ids_peak_ipl module. """
+
+    PixelFormat = _PixelFormat
+    ImageConverter = _ImageConverter
+    Image = _Image
+
+    def __init__(self):
+        for name in list(_OUTER_FORMATS) + list(packed_formats.PACKED_FORMATS):
+            setattr(self, "PixelFormatName_" + name, name)
+
+
+class _IplExtensionModule(object):
+    """ Stands for the ids_peak_ipl_extension module. """
+
+    @staticmethod
+    def BufferToImage(buff):
+        return _Image(buff.PixelFormat(), buff._data, buff.Width(), buff.Height())
+
+
+# ---------------------------------------------------------------------------
+# Cameras
+# ---------------------------------------------------------------------------
+
+class SimulatedCamera(object):
+    """ State and nodemap of a simulated camera.
+
+        color: the model name ends with "C" and the sensor delivers BayerGR
+               mosaics, otherwise it is a gray-scale camera ("M").
+        max_fps: frame rate at full resolution (limited by the exposure too).
+        min_buffers: NumBuffersAnnouncedMinRequired of its datastream.
+    """
+
+    MIN_EXPOSURE = 20.  # us
+
+    def __init__(self, serial="SIM0000", color=False, width=640, height=480,
+                 max_fps=500., min_buffers=3):
+        self.model = "SIM-368xXLE-" + ("C" if color else "M")
+        self.serial = serial
+        self.color = color
+        self.sensor_width = width
+        self.sensor_height = height
+        self.sensor_max_fps = max_fps
+        self.min_buffers = min_buffers
+        self.params_locked = 0
+        self.acquiring = False
+        self._scene = None
+        self._frame = None
+        self.load_default()
+        self.nodemap = self._build_nodemap()
+
+    @property
+    def pixel_formats(self):
+        return [x for x in packed_formats.PACKED_FORMATS
+                if packed_formats.is_bayer(x) == self.color]
+
+    def load_default(self):
+        self.binning_selector = "Region0"
+        self.binning_h = self.binning_v = 1
+        self.binning_h_mode = self.binning_v_mode = "Sum"
+        self.width = self.sensor_width
+        self.height = self.sensor_height
+        self.offset_x = self.offset_y = 0
+        self.reverse_x = self.reverse_y = False
+        self.pixel_format = self.pixel_formats[0]
+        self.fps = min(25., self.sensor_max_fps)
+        self.exposure = 10000.
+        self.gain = 1.
+        self.trigger_selector = "ExposureStart"
+        self.trigger_mode = "Off"
+        self.trigger_source = "Software"
+        self.trigger_activation = "RisingEdge"
+        self.triggers = collections.deque()  # times of the triggers not served yet
+        self.missed_triggers = 0
+        self.user_set = "Default"
+        self._scene = None
+
+    def fire(self, source="Line0"):
+        """ A trigger pulse on source ('Software', 'Line0'...). It is ignored
+            unless TriggerMode is On with that TriggerSource.
+        """
+        if self.trigger_mode != "On" or self.trigger_source != source:
+            return
+        datastream = getattr(self, "datastream", None)
+        if datastream is None:
+            self.triggers.append(time.perf_counter())
+            return
+        with datastream._condition:
+            self.triggers.append(time.perf_counter())
+            datastream._condition.notify_all()
+
+    def set(self, attribute, value):
+        if attribute in ("binning_h", "binning_v"):
+            # The ROI keeps the same area of the sensor, as far as possible
+            old = getattr(self, attribute)
+            size, offset, increment = (("width", "offset_x", 8) if attribute == "binning_h"
+                                       else ("height", "offset_y", 2))
+            sensor_size = getattr(self, "sensor_" + size) // value
+            new_size = getattr(self, size) * old // value // increment * increment
+            setattr(self, size, max(increment, min(new_size, sensor_size)))
+            setattr(self, offset, 0)
+        setattr(self, attribute, value)
+        self._scene = None
+
+    def max_width(self):
+        return self.sensor_width // self.binning_h - self.offset_x
+
+    def max_height(self):
+        return self.sensor_height // self.binning_v - self.offset_y
+
+    def max_offset_x(self):
+        return self.sensor_width // self.binning_h - self.width
+
+    def max_offset_y(self):
+        return self.sensor_height // self.binning_v - self.height
+
+    def max_fps(self):
+        return min(1 / self.readout_time(), 1e6 / self.exposure)
+
+    def readout_time(self):
+        """ Seconds to read a frame out of the sensor (binned rows). """
+        return self.height / (self.sensor_max_fps * self.sensor_height)
+
+    def max_exposure(self):
+        return 1e6 / self.fps
+
+    @property
+    def payload_size(self):
+        return packed_formats.packed_size(self.pixel_format, self.width, self.height)
+
+    @property
+    def bit_depth(self):
+        return packed_formats.bit_depth(self.pixel_format)
+
+    def _build_nodemap(self):
+        def command(func):
+            return _CommandNode(func)
+
+        def start():
+            self.acquiring = True
+
+        def stop():
+            self.acquiring = False
+
+        nodes = {
+            "DeviceModelName": _ValueNode(self, "model", None, None, writable=False),
+            "DeviceSerialNumber": _ValueNode(self, "serial", None, None, writable=False),
+            "UserSetSelector": _EnumerationNode(self, "user_set", ["Default"]),
+            "UserSetLoad": command(self.load_default),
+            "PixelFormat": _EnumerationNode(self, "pixel_format", self.pixel_formats,
+                                            locked=True),
+            "PayloadSize": _ValueNode(self, "payload_size", 0, 2**63, writable=False),
+            "Width": _ValueNode(self, "width", 8, self.max_width, increment=8,
+                                locked=True),
+            "Height": _ValueNode(self, "height", 2, self.max_height, increment=2,
+                                 locked=True),
+            "OffsetX": _ValueNode(self, "offset_x", 0, self.max_offset_x, increment=8,
+                                  locked=True),
+            "OffsetY": _ValueNode(self, "offset_y", 0, self.max_offset_y, increment=2,
+                                  locked=True),
+            "ReverseX": _ValueNode(self, "reverse_x", False, True, locked=True),
+            "ReverseY": _ValueNode(self, "reverse_y", False, True, locked=True),
+            "BinningSelector": _EnumerationNode(self, "binning_selector", ["Region0"]),
+            "BinningHorizontal": _ValueNode(self, "binning_h", 1, 4, locked=True),
+            "BinningVertical": _ValueNode(self, "binning_v", 1, 4, locked=True),
+            "BinningHorizontalMode": _EnumerationNode(self, "binning_h_mode",
+                                                      ["Sum", "Average"], locked=True),
+            "BinningVerticalMode": _EnumerationNode(self, "binning_v_mode",
+                                                    ["Sum", "Average"], locked=True),
+            "TLParamsLocked": _ValueNode(self, "params_locked", 0, 1),
+            "AcquisitionStart": command(start),
+            "AcquisitionStop": command(stop),
+            "AcquisitionFrameRate": _ValueNode(self, "fps", 1., self.max_fps),
+            "ExposureTime": _ValueNode(self, "exposure", self.MIN_EXPOSURE,
+                                       self.max_exposure),
+            "Gain": _ValueNode(self, "gain", 1., 16.),
+            "TriggerSelector": _EnumerationNode(self, "trigger_selector", ["ExposureStart"]),
+            "TriggerMode": _EnumerationNode(self, "trigger_mode", ["Off", "On"]),
+            "TriggerSource": _EnumerationNode(self, "trigger_source",
+                                              ["Software", "Line0", "Line2", "Line3"]),
+            "TriggerActivation": _EnumerationNode(self, "trigger_activation",
+                                                  ["RisingEdge", "FallingEdge"]),
+            "TriggerSoftware": command(lambda: self.fire("Software")),
+        }
+        return _NodeMap(nodes)
+
+    def _build_scene(self):
+        """ Static part of the frames, in counts, for the current settings. """
+        # Coordinates of the ROI in the whole (binned) sensor, within [0, 1]
+        yy, xx = np.mgrid[0:self.height, 0:self.width].astype(np.float32)
+        xx += self.offset_x
+        yy += self.offset_y
+        xx /= max(self.sensor_width // self.binning_h - 1, 1)
+        yy /= max(self.sensor_height // self.binning_v - 1, 1)
+        spot = np.exp(-((xx - 0.5) ** 2 + (yy - 0.5) ** 2) / 0.05)
+        scene = 0.2 + 0.3 * xx + 0.5 * spot  # within [0.2, 1]
+        if self.color:  # BayerGR mosaic of a warm-white light
+            scene[0::2, 1::2] *= 0.9  # R
+            scene[1::2, 0::2] *= 0.6  # B
+        full_scale = 2 ** self.bit_depth - 1
+        signal = scene * (self.exposure / 10000.) * self.gain * 0.8 * full_scale
+        if self.binning_h_mode == "Sum":
+            signal *= self.binning_h
+        if self.binning_v_mode == "Sum":
+            signal *= self.binning_v
+        signal = signal[::-1 if self.reverse_y else 1, ::-1 if self.reverse_x else 1]
+        return np.minimum(signal, full_scale).astype(np.uint16)
+
+    def render(self, buff):
+        """ Writes the frame buff._frame_id in the memory of buff. """
+        if self._scene is None:
+            self._scene = self._build_scene()
+            self._frame = np.empty_like(self._scene)
+        frame = self._frame  # reused, the camera does not allocate per frame
+        np.copyto(frame, self._scene)
+        column = (buff._frame_id * 4) % self.width
+        if self.reverse_x:
+            column = self.width - 4 - column
+        frame[:, column:column + 4] = 2 ** self.bit_depth - 1
+        size = self.payload_size
+        if buff._data.size < size:
+            raise BadAccessException("The buffer is smaller than the payload.")
+        packed_formats.pack(frame, self.pixel_format, out=buff._data[:size])
+        buff._width = self.width
+        buff._height = self.height
+        buff._pixel_format = self.pixel_format
+
+
+class SimulatedBackend(object):
+    """ Backend for IDSinterface with simulated cameras instead of the IDS SDK.
+
+        cameras: list of SimulatedCamera. Otherwise, num_devices cameras are
+                 created with the rest of keyword arguments.
+    """
+
+    def __init__(self, cameras=None, num_devices=1, **camera_kwargs):
+        if cameras is None:
+            cameras = [SimulatedCamera(serial=f"SIM{i:04d}", **camera_kwargs)
+                       for i in range(num_devices)]
+        self.cameras = cameras
+        self.peak = _PeakModule(cameras)
+        self.ipl = _IplModule()
+        self.ipl_extension = _IplExtensionModule()
@@ -0,0 +1,216 @@
+""" Acquisition telemetry: per-stage latency histograms, effective frame rate
+    and periodic export of the counters to a local file.
+
+    IDSinterface keeps a Telemetry per device once enable_telemetry() is called.
+    Until then, the capture paths only check for it, so it costs nothing.
+
+    Usage:
+
+        my_interface.enable_telemetry(idx=0, export_path="cam0.prom",
+                                      export_format="prometheus", interval=5)
+        ...
+        stats = my_interface.get_stats(idx=0)
+        print(stats["fps"], stats["stages"]["convert"]["p99"])
+"""
+
+import collections
+import json
+import os
+import threading
+import time
+
+_SUB_BITS = 4  # 16 buckets per power of two: values are known within 1/16 (6 %)
+_SUB_BUCKETS = 1 << _SUB_BITS
+_MAX_EXPONENT = 40  # up to 2**40 ns (18 min); longer values go to the last bucket
+
+EXPORT_FORMATS = ("jsonl", "prometheus")
+
+
+class LatencyHistogram(object):
+    """ Histogram of durations with a fixed memory footprint (HDR-style): the
+        buckets are log-linear in ns, so any duration from 1 ns to minutes is
+        stored with a relative error below 1/16. The count, sum, min and max
+        are exact.
+    """
+
+    __slots__ = ("counts", "count", "total", "min", "max")
+
+    def __init__(self):
+        self.counts = [0] * ((_MAX_EXPONENT - _SUB_BITS + 2) * _SUB_BUCKETS)
+        self.count = 0
+        self.total = 0.
+        self.min = None
+        self.max = None
+
+    @staticmethod
+    def _index(value_ns):
+        exponent = value_ns.bit_length() - 1
+        if exponent < _SUB_BITS:
+            return max(value_ns, 0)
+        exponent = min(exponent, _MAX_EXPONENT)
+        mantissa = min(value_ns >> (exponent - _SUB_BITS), 2 * _SUB_BUCKETS - 1)
+        return (exponent - _SUB_BITS + 1) * _SUB_BUCKETS + mantissa - _SUB_BUCKETS
+
+    @staticmethod
+    def _value(index):
+        """ Middle of the bucket index, in seconds. """
+        if index < _SUB_BUCKETS:
+            return index * 1e-9
+        shift = index // _SUB_BUCKETS - 1
+        mantissa = index % _SUB_BUCKETS + _SUB_BUCKETS
+        return ((mantissa << shift) + ((1 << shift) - 1) / 2) * 1e-9
+
+    def record(self, seconds):
+        self.counts[self._index(int(seconds * 1e9))] += 1
+        self.count += 1
+        self.total += seconds
+        if self.min is None or seconds < self.min:
+            self.min = seconds
+        if self.max is None or seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, q):
+        """ Duration (in seconds) below which q percent of the values are. """
+        if not self.count:
+            return None
+        target = q / 100 * self.count
+        accumulated = 0
+        for index, count in enumerate(self.counts):
+            accumulated += count
+            if count and accumulated >= target:
+                return min(max(self._value(index), self.min), self.max)
+        return self.max
+
+    def summary(self):
+        """ count, mean, min, max and percentiles 50, 90, 99 and 99.9 [s]. """
+        summary = {"count": self.count, "sum": self.total,
+                   "mean": self.total / self.count if self.count else None,
+                   "min": self.min, "max": self.max}
+        for name, q in (("p50", 50), ("p90", 90), ("p99", 99), ("p999", 99.9)):
+            summary[name] = self.percentile(q)
+        return summary
+
+
+class Telemetry(object):
+    """ Latency histograms per stage of the capture of a device, and the
+        effective frame rate over the last fps_window frames.
+
+        The stages are timed with lap(stage, start), which records the time
+        since start and returns the current time, ready for the next stage.
+    """
+
+    def __init__(self, fps_window=100):
+        self.stages = collections.OrderedDict()
+        self._frame_times = collections.deque(maxlen=fps_window)
+        self.started = time.time()
+
+    def lap(self, stage, start):
+        now = time.perf_counter()
+        histogram = self.stages.get(stage)
+        if histogram is None:
+            histogram = self.stages[stage] = LatencyHistogram()
+        histogram.record(now - start)
+        return now
+
+    def frame(self, host_time):
+        """ Counts a frame received at host_time (time.perf_counter()). """
+        self._frame_times.append(host_time)
+
+    def fps(self):
+        """ Effective frame rate over the last frames, or None. """
+        times = list(self._frame_times)
+        if len(times) < 2 or times[-1] == times[0]:
+            return None
+        return (len(times) - 1) / (times[-1] - times[0])
+
+    def summary(self):
+        return {"fps": self.fps(),
+                "stages": {name: histogram.summary()
+                           for name, histogram in list(self.stages.items())}}
+
+
+def to_prometheus(stats_by_device, prefix="ids"):
+    """ Prometheus text exposition of {idx: IDSinterface.get_stats(idx)}. """
+    lines = [f"# TYPE {prefix}_stage_latency_seconds summary"]
+    for idx, stats in stats_by_device.items():
+        for stage, summary in stats["stages"].items():
+            labels = f'device="{idx}",stage="{stage}"'
+            for name, q in (("p50", "0.5"), ("p90", "0.9"), ("p99", "0.99"),
+                            ("p999", "0.999")):
+                if summary[name] is not None:
+                    lines.append(f'{prefix}_stage_latency_seconds{{{labels},quantile="{q}"}} '
+                                 f'{summary[name]:.9g}')
+            lines.append(f"{prefix}_stage_latency_seconds_sum{{{labels}}} {summary['sum']:.9g}")
+            lines.append(f"{prefix}_stage_latency_seconds_count{{{labels}}} {summary['count']}")
+    for name, kind, key in (("fps", "gauge", ("fps",)),
+                            ("frames_received_total", "counter", ("frames", "received")),
+                            ("frames_lost_total", "counter", ("frames", "lost")),
+                            ("frames_incomplete_total", "counter", ("frames", "incomplete")),
+                            ("buffers_queued", "gauge", ("buffers", "queued")),
+                            ("buffers_await_delivery", "gauge", ("buffers", "await_delivery")),
+                            ("buffer_underruns_total", "counter", ("buffers", "underruns")),
+                            ("driver_lost_frames_total", "counter", ("buffers", "lost"))):
+        lines.append(f"# TYPE {prefix}_{name} {kind}")
+        for idx, stats in stats_by_device.items():
+            value = stats
+            for k in key:
+                value = value.get(k) if value is not None else None
+            if value is not None:
+                lines.append(f'{prefix}_{name}{{device="{idx}"}} {value:.9g}')
+    return "\n".join(lines) + "\n"
+
+
+class TelemetryExporter(object):
+    """ Thread writing get_stats() to path every interval seconds.
+
+        get_stats: callable returning {idx: stats}.
+        export_format: 'jsonl' appends a line {"time": ..., "devices": ...} per
+                       export; 'prometheus' rewrites path atomically with the
+                       text format, for the textfile collector of node_exporter.
+    """
+
+    def __init__(self, path, get_stats, interval=1., export_format="jsonl"):
+        if export_format not in EXPORT_FORMATS:
+            raise ValueError(f"{export_format} : Export format not supported. Choose one "
+                             f"valid: {', '.join(EXPORT_FORMATS)}")
+        self.path = path
+        self.interval = interval
+        self.export_format = export_format
+        self.error = None
+        self._get_stats = get_stats
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self.__export_loop, name="IDStelemetry",
+                                        daemon=True)
+        self._thread.start()
+
+    def export(self):
+        """ Writes the current stats now. """
+        stats = self._get_stats()
+        if self.export_format == "jsonl":
+            line = json.dumps({"time": time.time(),
+                               "devices": {str(idx): s for idx, s in stats.items()}})
+            with open(self.path, 'a', encoding='utf-8') as export_file:
+                export_file.write(line + "\n")
+        else:
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as export_file:
+                export_file.write(to_prometheus(stats))
+            os.replace(tmp_path, self.path)
+
+    def __export_loop(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.export()
+            except Exception as e:
+                self.error = e
+
+    def close(self):
+        """ Stops the thread, after a last export. """
+        if self._thread is None:
+            return
+        self._stop_event.set()
+        if self._thread is threading.current_thread():  # e.g. from get_stats()
+            return  # it stops after this export
+        self._thread.join()
+        self._thread = None
+        self.export()
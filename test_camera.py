@@ -1,7 +1,6 @@
-import numpy as np
-
 from interface import IDSinterface
 from analyze_picture import analyze_picture
+from preview import Preview
 import pygame
 
 pygame.init()
@@ -47,25 +46,17 @@ def main():
 
     # Setting pygame to render images
     binning = 3  # pygame work pixel by pixel, we reduce the resolution to fit a reasonable window
-    display = pygame.display.set_mode((width//binning, height//binning))
-    disp_array = pygame.surfarray.pixels3d(display)  # 3d array for RGB images
+    # The camera streams at its own fps, the window is refreshed at 30 fps
+    preview = Preview(cams_interface, camID, binning=binning, display_fps=30,
+                      bit_depth=DESIRED_BIT_DEPTH)
+    display = pygame.display.set_mode(preview.size)
+    disp_array = pygame.surfarray.pixels3d(display)  # 3d array for RGB images, (x, y, c)
 
     running = True  # video loop
     while running:
 
-        # Capturing the current image that camera gets
-        rawimage = cams_interface.capture(camID)
-
-        # Converting the image to a 8-bit RGB image just for display
-        image8 = ((rawimage.astype(np.float64) / 2 ** DESIRED_BIT_DEPTH) * 2 ** 8).astype(np.uint8)
-        if image8.ndim == 3 and image8.shape[2] == 3:
-            disp_array[:, :, 0] = image8[::binning, ::binning, 0].T
-            disp_array[:, :, 1] = image8[::binning, ::binning, 1].T
-            disp_array[:, :, 2] = image8[::binning, ::binning, 2].T
-        else:
-            disp_array[:, :, 0] = image8[::binning, ::binning].T
-            disp_array[:, :, 1] = image8[::binning, ::binning].T
-            disp_array[:, :, 2] = image8[::binning, ::binning].T
+        # Rendering the latest image that camera gets, as 8-bit RGB, straight in the window
+        preview.next(out=disp_array.transpose(1, 0, 2))
 
         events = pygame.event.get()
         for event in events:
@@ -73,7 +64,11 @@ def main():
                 running = False
         pygame.display.flip()
 
+    print(preview.stats())
+    preview.close()
+
     # Analyzing the last rawimage to check the bit-depth and its histograms
+    rawimage = preview.frame
     analyze_picture(rawimage)
 
 
@@ -0,0 +1,56 @@
+""" Fixtures of the tests: IDSinterface instances over simulated cameras, so
+    they run without the IDS SDK nor any camera.
+"""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from interface import IDSinterface  # noqa: E402
+from simulated_camera import SimulatedBackend  # noqa: E402
+
+
+@pytest.fixture
+def make_cameras():
+    """ make_cameras(bit_rate, colorness, num_devices=1, backend=None, **camera_kwargs)
+        returns an IDSinterface with its devices selected, on backend or on a
+        new SimulatedBackend. They are released at the end of the test.
+    """
+    created = []
+
+    def make_cameras(bit_rate=8, colorness="Mono", num_devices=1, backend=None,
+                     **camera_kwargs):
+        camera_kwargs.setdefault("max_fps", 2000.)
+        if backend is None:
+            backend = SimulatedBackend(num_devices=num_devices, **camera_kwargs)
+        cameras = IDSinterface(backend=backend)
+        for idx in range(num_devices):
+            cameras.set_pixel_format(bit_rate, colorness=colorness, idx=idx)
+            cameras.select_device(idx)
+        created.append((cameras, num_devices))
+        return cameras
+
+    yield make_cameras
+    for cameras, num_devices in created:
+        for idx in range(num_devices):
+            cameras.stop_acquisition(idx)
+            cameras.release_device(idx)
+
+
+class ReplayCameras(object):
+    """ Wraps an IDSinterface so capture_into() always gives the same frame. """
+
+    def __init__(self, cameras, frame):
+        self.cameras = cameras
+        self.frame = frame
+
+    def capture_into(self, out, idx=0):
+        np.copyto(out, self.frame)
+        return out
+
+    def __getattr__(self, name):
+        return getattr(self.cameras, name)
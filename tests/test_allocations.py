@@ -0,0 +1,56 @@
+import tracemalloc
+
+import numpy as np
+
+MAX_PEAK = 4096  # B/frame: Python objects of the wrappers, never pixel data
+MAX_GROWTH = 16  # B/frame
+
+
+def _acquiring(make_cameras, pool_size=0):
+    cameras = make_cameras(8, "Mono", max_fps=10000.)
+    cameras.set_exposure_time(50, 0)
+    cameras.set_max_fps(0)
+    cameras.start_acquisition(0)
+    cameras.preallocate_conversion(0, pool_size=pool_size)
+    return cameras
+
+
+def _allocations(capture, frames=300):
+    """ (peak of the transient allocations, net growth) per frame of capture(). """
+    for _ in range(5):  # warming up
+        capture()
+    tracemalloc.start()
+    try:
+        start, _ = tracemalloc.get_traced_memory()
+        peak = 0
+        for _ in range(frames):
+            tracemalloc.reset_peak()
+            current, _ = tracemalloc.get_traced_memory()
+            capture()
+            peak = max(peak, tracemalloc.get_traced_memory()[1] - current)
+        growth = (tracemalloc.get_traced_memory()[0] - start) / frames
+    finally:
+        tracemalloc.stop()
+    return peak, growth
+
+
+def test_capture_into_does_not_allocate_per_frame(make_cameras):
+    cameras = _acquiring(make_cameras)
+    out = np.empty(*cameras.get_frame_layout(0))
+    peak, growth = _allocations(lambda: cameras.capture_into(out, 0))
+    assert peak < MAX_PEAK
+    assert growth < MAX_GROWTH
+
+
+def test_pooled_capture_does_not_allocate_per_frame(make_cameras):
+    cameras = _acquiring(make_cameras, pool_size=2)
+    peak, growth = _allocations(lambda: cameras.capture(0))
+    assert peak < MAX_PEAK
+    assert growth < MAX_GROWTH
+
+
+def test_tracemalloc_sees_the_frames(make_cameras):
+    cameras = _acquiring(make_cameras)
+    shape, dtype = cameras.get_frame_layout(0)
+    peak, _ = _allocations(lambda: cameras.capture(0), frames=20)
+    assert peak >= int(np.prod(shape)) * np.dtype(dtype).itemsize
@@ -0,0 +1,48 @@
+import json
+
+import numpy as np
+import pytest
+
+pytest.importorskip("imageio")
+pytest.importorskip("matplotlib")
+
+import analyze_picture
+from metadata_log import MetadataLog
+
+
+def _image(value=1000):
+    image = np.full((8, 12), value, np.uint16)
+    image[0, 0] = 4095
+    return image
+
+
+def test_float_frames_of_the_jsonl_log(tmp_path):
+    np.save(tmp_path / "series_001.npy", _image().astype(np.float32) / 500)
+    with MetadataLog(str(tmp_path / "series.jsonl")) as log:
+        log.append("series_001.png", path="series_001.npy", format="float32", ref_mean=500.)
+    (row,) = analyze_picture.analyze_frames(str(tmp_path), workers=1)
+    assert row["ref_mean"] == 500. and "error" not in row
+    assert (row["min"], row["max"]) == (1000, 4095)
+
+
+def test_float_frames_of_the_legacy_json(tmp_path):
+    # the old save(): float32 frames and one .json per series, without ref_mean
+    np.save(tmp_path / "old_001.npy", _image().astype(np.float32))
+    np.save(tmp_path / "old_002.npy", _image().astype(np.float32) / 1000)
+    with open(tmp_path / "old.json", 'w') as meta_file:
+        json.dump({"old_001.png": {"mean": 1000.},
+                   "old_002.png": {"mean": 1., "ref_roi": {"center": [1, 1], "size": [2, 2]}}},
+                  meta_file)
+    first, second = analyze_picture.analyze_frames(str(tmp_path), workers=1)
+    assert first["ref_mean"] == 1 and first["max"] == 4095
+    assert second["ref_mean"] is None and "ref_mean" in second["error"]
+
+
+def test_broken_files_are_rows_of_the_summary(tmp_path):
+    (tmp_path / "broken.npy").write_bytes(b"not a frame")
+    np.save(tmp_path / "good.npy", _image())
+    summary = tmp_path / "summary.csv"
+    broken, good = analyze_picture.analyze_frames(str(tmp_path), str(summary), workers=2)
+    assert broken["path"].endswith("broken.npy") and broken["error"]
+    assert "error" not in good and good["max"] == 4095
+    assert summary.read_text().count("\n") == 3
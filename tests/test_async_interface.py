@@ -0,0 +1,134 @@
+import asyncio
+import time
+
+import numpy as np
+
+from async_interface import AsyncIDSInterface
+from interface import IDSinterface
+from simulated_camera import SimulatedBackend
+
+
+def _run(test):
+    async def main():
+        cameras = IDSinterface(backend=SimulatedBackend(num_devices=2, max_fps=1000.,
+                                                        width=64, height=48))
+        cam = AsyncIDSInterface(cameras)
+        await cam.start(0, fps=200, exposure=1000)
+        await cam.start(1, fps=200, exposure=1000)
+        try:
+            await test(cam)
+        finally:
+            await cam.close()
+
+    asyncio.run(main())
+
+
+def test_breaking_out_unsubscribes():
+    async def test(cam):
+        async for frame in cam.frames(0, maxsize=2):
+            assert frame.image.shape == (48, 64)
+            assert len(cam.get_stats(0)["consumers"]) == 1
+            break
+        assert cam.get_stats(0)["consumers"] == []
+
+    _run(test)
+
+
+def test_async_with_unsubscribes_a_kept_stream():
+    async def test(cam):
+        async with cam.frames_from([0, 1]) as frames:
+            async for idx, frame in frames:
+                assert idx in (0, 1)
+                break
+            assert len(cam.get_stats(1)["consumers"]) == 1  # still referenced
+        assert cam.get_stats(0)["consumers"] == cam.get_stats(1)["consumers"] == []
+        assert [item async for item in frames] == []  # closed
+
+        frames = cam.frames(1)
+        await frames.aclose()
+        assert cam.get_stats(1)["consumers"] == []
+
+    _run(test)
+
+
+def test_stream_ends_when_devices_stop():
+    async def test(cam):
+        frames = cam.frames_from([0, 1], maxsize=1)
+        await cam.stop(0)
+        await cam.stop(1)
+        assert [idx async for idx, _ in frames] == []
+        assert cam.get_stats(0)["consumers"] == []
+
+    _run(test)
+
+
+def test_next_frame():
+    async def test(cam):
+        frame = await cam.next_frame(1, timeout=2.)
+        assert frame.image.shape == (48, 64) and frame.exposure is not None
+        assert cam.get_stats(1)["consumers"] == []
+
+    _run(test)
+
+
+def test_stalled_loop_does_not_pile_up_frames():
+    async def test(cam):
+        frames = cam.frames(0, maxsize=2)
+        time.sleep(0.2)  # blocks the loop: about 40 frames grabbed meanwhile
+        stats = cam.get_stats(0)
+        assert stats["backlog_dropped"] > 10
+        await asyncio.sleep(0)  # the callbacks handed over run now
+        assert frames.subscription.delivered <= 2
+        await frames.aclose()
+
+    _run(test)
+
+
+def test_settings_changes_keep_the_frames_coming():
+    async def test(cam):
+        async with cam.frames(0) as frames:
+            await frames.__anext__()
+            await cam.apply_settings(0, roi=(0, 0, 32, 24))
+            frame = await asyncio.wait_for(frames.__anext__(), 2.)
+            while frame.image.shape != (24, 32):  # frames queued before the change
+                frame = await asyncio.wait_for(frames.__anext__(), 2.)
+
+    _run(test)
+
+
+def test_consumers_end_when_the_stream_stops_under_them():
+    async def test(cam):
+        frames = cam.frames(1)
+        await frames.__anext__()
+        await cam._run(cam.cameras.stop_acquisition, 1)  # not through cam.stop()
+        assert await asyncio.wait_for(_drain(frames), 2.) >= 0
+
+    _run(test)
+
+
+async def _drain(frames):
+    count = 0
+    async for _ in frames:
+        count += 1
+    return count
+
+
+def test_frames_carry_their_metadata():
+    async def test(cam):
+        frames = []
+        async for frame in cam.frames(0, maxsize=16):
+            frames.append(frame)
+            if len(frames) == 5:
+                break
+        for frame in frames:
+            image = frame.image
+            band = np.flatnonzero((image == image.max()).all(axis=0))
+            assert list(band) == [(frame.frame_id * 4 + i) % 64 for i in range(4)]
+            assert frame.timestamp_ns <= frame.host_time * 1e9
+            assert frame.exposure == 1000
+        frame_ids = [frame.frame_id for frame in frames]
+        assert frame_ids == sorted(set(frame_ids))
+        timestamps = np.diff([frame.timestamp_ns for frame in frames])
+        np.testing.assert_allclose(timestamps, np.diff(frame_ids) * 5e6, atol=1e3)
+
+    _run(test)
@@ -0,0 +1,29 @@
+import json
+
+import benchmarks
+
+
+def test_save_and_check_baseline(tmp_path):
+    path = str(tmp_path / "baseline.json")
+    results = {"capture": {"capture": 0.010, "capture_into": 0.005, "fps": 100},
+               "unpack": {"Mono8": "numpy unpack"}}
+    benchmarks.save_baseline(path, results)
+    with open(path, encoding='utf-8') as baseline_file:
+        baseline = json.load(baseline_file)
+    assert baseline["timings"] == {"capture/capture": 0.010, "capture/capture_into": 0.005}
+    assert baseline["machine"] == benchmarks.machine()
+    assert benchmarks.baseline_benchmarks(path) == ["capture"]
+
+    slower = {"capture": {"capture": 0.014, "capture_into": 0.009, "new case": 1.}}
+    assert benchmarks.check_baseline(path, slower) == [("capture/capture_into", 0.009, 0.005)]
+    assert benchmarks.check_baseline(path, slower, tolerance=2) == []
+
+
+def test_baseline_of_another_machine_only_warns(tmp_path, capsys):
+    path = tmp_path / "baseline.json"
+    machine = dict(benchmarks.machine(), node="elsewhere", cpus=1)
+    path.write_text(json.dumps({"machine": machine, "timings": {"capture/capture": 0.001}}))
+    assert not benchmarks.same_machine(machine)
+    assert benchmarks.check_baseline(str(path), {"capture": {"capture": 0.1}}) == []
+    out = capsys.readouterr().out
+    assert "Warning" in out and "elsewhere" in out and "x100" in out
@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+from bridge import FrameBridge
+from ring_buffer import SharedFrameRingBuffer
+
+
+def test_views_outlive_close():
+    producer = SharedFrameRingBuffer("ids_test_views", 4, (32, 16), np.uint16)
+    consumer = SharedFrameRingBuffer("ids_test_views")
+    producer.push(np.full((32, 16), 7, np.uint16))
+    seq, view = consumer.latest_view()
+    consumer.close()
+    producer.close()
+    producer.unlink()
+    assert seq == 0 and int(view.sum()) == 7 * 32 * 16  # still mapped
+
+
+@pytest.mark.parametrize("bit_rate, dtype", [(12, np.uint16),  # converted into the slots
+                                             (8, np.uint16)])  # cast by a copy
+def test_bridge_with_simulated_camera(bit_rate, dtype):
+    bridge = FrameBridge(cam_id=0, bit_rate=bit_rate, dtype=dtype, simulated=True,
+                         settings={"fps": 200, "exposure": 1000})
+    try:
+        seq, frame = bridge.latest(timeout=10.)
+        width, height = bridge.settings["roi"][2:]
+        assert frame.shape == (height, width) and frame.dtype == dtype
+        assert frame.max() > 0
+        seq2, copy = bridge.next(timeout=2.)
+        assert seq2 is not None and copy.shape == frame.shape
+        assert bridge.stats()["grabbed"] > 0
+    finally:
+        bridge.close()
+    assert frame.shape == (height, width)
+    frame.sum()  # views of the ring can still be read after close()
@@ -0,0 +1,81 @@
+import pytest
+
+from interface import IDSinterface
+from simulated_camera import SimulatedBackend, SimulatedCamera
+
+
+def _buffer_sizes(cameras):
+    datastream = cameras._IDSinterface__datastreams[0]
+    return {buff.Size() for buff in datastream.AnnouncedBuffers()}
+
+
+def _cameras(make_cameras, **camera_kwargs):
+    backend = SimulatedBackend(cameras=[SimulatedCamera(width=64, height=48, max_fps=2000.,
+                                                        **camera_kwargs)])
+    return make_cameras(12, "Mono", backend=backend), backend
+
+
+def test_minimum_required_by_default(make_cameras):
+    cameras, _ = _cameras(make_cameras, min_buffers=4)
+    stats = cameras.get_buffer_stats(0)
+    assert stats["announced"] == stats["queued"] == 4
+    assert stats["payload_size"] == 64 * 48 * 3 // 2  # Mono12g24IDS
+
+
+def test_count_and_duration(make_cameras):
+    cameras, _ = _cameras(make_cameras)
+    cameras.set_exposure_time(1000, 0)
+    cameras.set_fps(200, 0)
+    cameras.set_buffering(buffer_count=10)
+    assert cameras.get_buffer_stats(0)["announced"] == 10
+    cameras.set_buffering(buffer_count=10, buffer_duration=0.1)  # 20 frames at 200 fps
+    assert cameras.get_buffer_stats(0)["announced"] == 20
+    cameras.set_buffering(buffer_count=5)  # shrunk, while not acquiring
+    assert cameras.get_buffer_stats(0)["announced"] == 5
+
+
+def test_duration_follows_the_fps(make_cameras):
+    cameras, _ = _cameras(make_cameras)
+    cameras.set_exposure_time(1000, 0)
+    cameras.set_fps(100, 0)
+    cameras.set_buffering(buffer_duration=0.2)
+    cameras.start_acquisition(0)
+    assert cameras.get_buffer_stats(0)["announced"] == 20
+    cameras.set_fps(500, 0)  # grows while acquiring
+    assert cameras.get_buffer_stats(0)["announced"] == 100
+    cameras.set_fps(100, 0)  # but it doesn't shrink then
+    assert cameras.get_buffer_stats(0)["announced"] == 100
+    cameras.apply_settings(0, fps=250)
+    assert cameras.get_buffer_stats(0)["announced"] == 100
+    cameras.capture(0)
+
+
+@pytest.mark.parametrize("acquiring", [False, True])
+def test_reallocated_after_roi_and_binning(make_cameras, acquiring):
+    cameras, _ = _cameras(make_cameras)
+    cameras.set_buffering(buffer_count=6)
+    if acquiring:
+        cameras.start_acquisition(0)
+    cameras.set_roi(0, 0, 32, 24)
+    stats = cameras.get_buffer_stats(0)
+    assert stats["announced"] == 6 and stats["payload_size"] == 32 * 24 * 3 // 2
+    assert _buffer_sizes(cameras) == {32 * 24 * 3 // 2}
+    cameras.set_roi()
+    cameras.set_binning(2)
+    stats = cameras.get_buffer_stats(0)
+    assert stats["announced"] == 6 and stats["payload_size"] == 32 * 24 * 3 // 2
+    assert _buffer_sizes(cameras) == {32 * 24 * 3 // 2}
+    if acquiring:
+        assert cameras.capture(0).shape == (24, 32)
+
+
+def test_set_before_selecting(make_cameras):
+    backend = SimulatedBackend(width=64, height=48)
+    cameras = IDSinterface(backend=backend)
+    cameras.set_buffering(buffer_count=7)
+    cameras.set_pixel_format(8, colorness="Mono")
+    cameras.select_device(0)
+    try:
+        assert cameras.get_buffer_stats(0)["announced"] == 7
+    finally:
+        cameras.release_device(0)
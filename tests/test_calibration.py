@@ -0,0 +1,161 @@
+import numpy as np
+import pytest
+
+from calibration import MAX_GAIN, Calibration, CalibrationStore, average_frames
+
+SHAPE = (10, 8)
+
+
+def _masters(seed=0):
+    rng = np.random.default_rng(seed)
+    dark = rng.uniform(90, 110, SHAPE).astype(np.float32)
+    flat = dark + rng.uniform(800, 1200, SHAPE).astype(np.float32)
+    return dark, flat
+
+
+def _frame(seed=1, low=0, high=3000):
+    return np.random.default_rng(seed).integers(low, high, SHAPE).astype(np.uint16)
+
+
+def _expected(frame, dark=None, flat=None, integer=True):
+    """ The correction in float64, from the formula in the docstring. """
+    corrected = frame.astype(np.float64)
+    if dark is not None:  # rounded to integers for uint16 frames, but not in the gains
+        corrected -= np.rint(dark) if integer else dark
+        if integer:
+            corrected = np.maximum(corrected, 0)
+    if flat is not None:
+        signal = flat.astype(np.float64) - (0 if dark is None else dark)
+        corrected *= signal.mean() / np.maximum(signal, signal.mean() / MAX_GAIN)
+    return corrected
+
+
+@pytest.mark.parametrize("block_size", [64, 1 << 18])  # blocks of 2 rows or the whole frame
+def test_uint16_in_place(block_size):
+    dark, flat = _masters()
+    calibration = Calibration(dark, flat, block_size=block_size)
+    frame = _frame()
+    expected = np.clip(np.rint(_expected(frame, dark, flat)), 0, 2 ** 16 - 1)
+    corrected = calibration.apply(frame)
+    assert corrected is frame and corrected.dtype == np.uint16
+    np.testing.assert_allclose(corrected, expected, atol=1)  # float32 gains
+
+
+def test_uint16_dark_is_exact_and_clipped_at_0():
+    dark, _ = _masters()
+    frame = _frame(low=0, high=200)  # many pixels below the dark
+    expected = _expected(frame, dark)
+    assert (expected == 0).any()
+    np.testing.assert_array_equal(Calibration(dark).apply(frame), expected)
+
+
+def test_uint16_clipped_at_the_top():
+    dark, flat = _masters()
+    flat[0, 0] = dark[0, 0] + 100  # a dim pixel, with a high gain
+    frame = np.full(SHAPE, 60000, np.uint16)
+    corrected = Calibration(dark, flat).apply(frame)
+    assert corrected[0, 0] == 2 ** 16 - 1
+    assert corrected.max() == 2 ** 16 - 1 and corrected.min() > 0
+
+
+def test_gain_is_limited():
+    dark = np.zeros(SHAPE, np.float32)
+    flat = np.full(SHAPE, 1000, np.float32)
+    flat[3, 4] = 0  # dead pixel
+    frame = np.full(SHAPE, 100, np.uint16)
+    corrected = Calibration(dark, flat, dtype=np.float32).apply(frame)
+    mean = flat.mean()
+    assert corrected[3, 4] == pytest.approx(100 * MAX_GAIN)
+    assert corrected[0, 0] == pytest.approx(100 * mean / 1000)
+
+
+def test_uint16_into_out_keeps_the_frame():
+    dark, flat = _masters()
+    frame = _frame()
+    original = frame.copy()
+    out = np.empty_like(frame)
+    assert Calibration(dark, flat).apply(frame, out) is out
+    np.testing.assert_array_equal(frame, original)
+    np.testing.assert_array_equal(out, Calibration(dark, flat).apply(original))
+
+
+@pytest.mark.parametrize("block_size", [64, 1 << 18])
+def test_float32_is_not_clipped(block_size):
+    dark, flat = _masters()
+    calibration = Calibration(dark, flat, dtype=np.float32, block_size=block_size)
+    frame = _frame(low=0, high=200)
+    original = frame.copy()
+    corrected = calibration.apply(frame)
+    assert corrected is calibration.out and corrected.dtype == np.float32
+    np.testing.assert_array_equal(frame, original)
+    expected = _expected(frame, dark, flat, integer=False)
+    assert (expected < 0).any()
+    np.testing.assert_allclose(corrected, expected, rtol=1e-5, atol=1e-3)
+
+
+def test_float32_from_float_frames():
+    dark, flat = _masters()
+    frame = _frame().astype(np.float32) + 0.25
+    corrected = Calibration(dark, flat, dtype=np.float32).apply(frame)
+    np.testing.assert_allclose(corrected, _expected(frame, dark, flat, integer=False),
+                               rtol=1e-5, atol=1e-3)
+
+
+@pytest.mark.parametrize("dtype, reference", [(np.float32, 1.), (np.uint16, 2 ** 14)])
+def test_normalized_by_the_reference_roi(dtype, reference):
+    dark, flat = _masters()
+    roi = (2, 3, 4, 2)
+    calibration = Calibration(dark, flat, ref_roi=roi, dtype=dtype)
+    frame = _frame(low=500, high=3000)
+    expected = _expected(frame, dark, flat, integer=dtype == np.uint16)
+    ref_mean = expected[3:5, 2:6].mean()
+    corrected = calibration.apply(frame)
+    assert calibration.ref_mean == pytest.approx(ref_mean)
+    assert corrected[3:5, 2:6].mean() == pytest.approx(reference, rel=1e-3)
+    np.testing.assert_allclose(corrected, expected * reference / ref_mean, rtol=1e-4, atol=1)
+
+
+def test_only_normalization():
+    calibration = Calibration(ref_roi=(0, 0, 2, 2), dtype=np.float32)
+    frame = np.full(SHAPE, 50, np.uint16)
+    frame[0, 0] = 250
+    corrected = calibration.apply(frame)
+    assert calibration.shape == SHAPE
+    assert corrected[0, 0] == pytest.approx(2.5) and corrected[5, 5] == pytest.approx(0.5)
+
+
+def test_errors():
+    dark, flat = _masters()
+    with pytest.raises(ValueError):
+        Calibration(dark, flat[:5])
+    with pytest.raises(ValueError):
+        Calibration(dark, dark)  # flat not brighter
+    with pytest.raises(ValueError):
+        Calibration(dark, dtype=np.float64)
+    with pytest.raises(ValueError):
+        Calibration(dark).apply(np.zeros((5, 8), np.uint16))
+    with pytest.raises(ValueError):
+        Calibration(dark, ref_roi=(0, 0, 2, 2)).apply(np.zeros(SHAPE, np.uint16))
+
+
+def test_average_frames_is_exact():
+    frames = iter([np.full(SHAPE, value, np.uint16) for value in (65535, 65535, 0)])
+    master = average_frames(lambda: next(frames), 3)
+    assert master.dtype == np.float32 and (master == 43690).all()
+    with pytest.raises(ValueError):
+        average_frames(lambda: None, 0)
+
+
+def test_store_builds_once(tmp_path):
+    store = CalibrationStore(str(tmp_path))
+    dark, _ = _masters()
+    builds = []
+    build = lambda: builds.append(1) or dark
+    np.testing.assert_array_equal(store.get_or_build("dark", "key", build), dark)
+    np.testing.assert_array_equal(store.get_or_build("dark", "key", build, SHAPE), dark)
+    assert len(builds) == 1
+    store.get_or_build("dark", "key", build, shape=(5, 8))  # another shape
+    store.get_or_build("dark", "key", build, rebuild=True)
+    assert len(builds) == 3
+    with pytest.raises(ValueError):
+        store.path("bias", "key")
@@ -0,0 +1,52 @@
+import numpy as np
+
+from frame_stats import FrameStatistics, channel_histograms
+
+
+def _frame(value, ref=100):
+    frame = np.full((8, 8), value, np.uint16)
+    frame[:2, :2] = ref
+    return frame
+
+
+def test_histograms_and_saturation():
+    frame = _frame(4095)
+    histograms = channel_histograms(frame, 4096)
+    assert histograms.shape == (1, 4096) and histograms[0, 100] == 4
+    stats = FrameStatistics(bit_depth=12)
+    stats.update(frame)
+    stats.update(frame)
+    summary = stats.summary()
+    assert summary["frames"] == 2 and summary["saturated"][0] == 2 * 60
+    assert summary["channels"][0][1:] == (4095, 100)
+
+
+def test_roi_means_over_the_frames_since_set():
+    stats = FrameStatistics(bit_depth=12, rois={"all": (0, 0, 8, 8)})
+    for _ in range(9):
+        stats.update(_frame(10))
+    stats.set_roi("ref", (0, 0, 2, 2))  # as labview.set_ref() after start_statistics()
+    stats.update(_frame(10))
+    rois = stats.summary()["rois"]
+    assert rois["ref"] == (100, 100, 100)
+    assert rois["all"][0] == (4 * 100 + 60 * 10) / 64
+
+    stats.set_roi("ref", (2, 2, 2, 2))  # starts over
+    assert stats.summary()["rois"]["ref"] == (None, None, None)
+    stats.set_roi("ref", None)
+    assert "ref" not in stats.summary()["rois"]
+
+
+def test_every_and_background():
+    stats = FrameStatistics(bit_depth=12, rois={"ref": (0, 0, 2, 2)}, every=2,
+                            background=True)
+    try:
+        for value in range(6):
+            stats.update(_frame(value, ref=50 + value))
+            stats.flush()
+        summary = stats.summary()
+        assert (summary["seen"], summary["frames"]) == (6, 3)
+        assert summary["rois"]["ref"] == (52, 54, 50)  # frames 0, 2 and 4
+        assert stats.last["frame"] == 4
+    finally:
+        stats.close()
@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+from frame_store import (FORMATS, compress, decompress, frame_path, load_frame, pack12,
+                         save_frame, unpack12)
+from recorder import Recorder
+
+
+def _image(seed=0, depth=12, shape=(20, 48)):
+    rng = np.random.default_rng(seed)
+    image = rng.integers(0, 2 ** depth, shape).astype(np.uint16)
+    image[0, :2] = [0, 2 ** depth - 1]
+    return image
+
+
+def test_pack12_round_trip():
+    image = _image()
+    packed = pack12(image)
+    assert packed.shape == (20, 48 * 3 // 2)
+    np.testing.assert_array_equal(unpack12(packed), image)
+    out = np.empty_like(image)
+    assert unpack12(pack12(image, np.empty_like(packed)), out) is out
+    np.testing.assert_array_equal(out, image)
+
+
+@pytest.mark.parametrize("image", [np.zeros((2, 3), np.uint16),  # odd width
+                                   np.full((2, 4), 4096, np.uint16),
+                                   np.full((2, 4), 0xFFF0, np.uint16),  # aligned to the MSB
+                                   np.full((2, 4), -1, np.int32),
+                                   np.zeros((2, 4), np.float32)])
+def test_pack12_refuses_what_does_not_fit(image):
+    with pytest.raises(ValueError):
+        pack12(image)
+
+
+@pytest.mark.parametrize("frame_format", list(FORMATS))
+def test_save_and_load_frame(tmp_path, frame_format):
+    image = _image(1, depth=16 if frame_format != "packed12" else 12)
+    path = save_frame(str(tmp_path / "frame_0001.png"), image, frame_format)
+    assert path == str(tmp_path / "frame_0001") + FORMATS[frame_format]
+    loaded = load_frame(path)
+    if frame_format == "float32":
+        assert loaded.dtype == np.float32
+    else:
+        assert loaded.dtype == np.uint16
+    np.testing.assert_array_equal(loaded, image)
+    np.testing.assert_array_equal(load_frame(path, mmap=False), image)
+
+
+def test_packed12_save_keeps_the_image(tmp_path):
+    with pytest.raises(ValueError):
+        save_frame(str(tmp_path / "frame"), _image(depth=16), "packed12")
+
+
+def test_compress_chunks_and_threads():
+    image = _image(2, depth=16, shape=(130, 30))
+    data = compress(image, threads=3, chunk_rows=64)
+    out = np.empty_like(image)
+    assert decompress(data, threads=2, out=out) is out
+    np.testing.assert_array_equal(out, image)
+    with pytest.raises(ValueError):
+        decompress(data, out=np.empty((130, 30), np.uint8))
+    with pytest.raises(ValueError):
+        decompress(b"NOPE" + data[4:])
+
+
+def test_frame_path():
+    assert frame_path("a/b.p12.npy", "compressed") == "a/b.idsz"
+    assert frame_path("a/b", "uint16") == "a/b.npy"
+    with pytest.raises(ValueError):
+        frame_path("a/b", "png")
+
+
+def test_packed12_recording_refuses_higher_values(tmp_path):
+    rec = Recorder(str(tmp_path / "run"), (4, 8), np.uint16, 4, frame_format="packed12")
+    rec.write(np.full((4, 8), 100, np.uint16))
+    rec.write(np.full((4, 8), 0xFFF0, np.uint16))
+    with pytest.raises(RuntimeError):
+        rec.close()
+    assert rec.stats()["written"] == 1
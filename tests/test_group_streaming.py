@@ -0,0 +1,29 @@
+import time
+
+from simulated_camera import SimulatedBackend
+
+
+def _selected(make_cameras, fps=100):
+    backend = SimulatedBackend(num_devices=2, max_fps=1000., width=64, height=48)
+    cameras = make_cameras(8, "Mono", num_devices=2, backend=backend)
+    for idx in (0, 1):
+        cameras.set_buffering(buffer_count=16, idx=idx)
+        cameras.set_exposure_time(100, idx)
+        cameras.set_fps(fps, idx)
+    return cameras
+
+
+def test_frames_queued_before_streaming_are_not_paired(make_cameras):
+    cameras = _selected(make_cameras)
+    cameras.start_acquisition(0)
+    time.sleep(0.15)
+    cameras.start_acquisition(1)
+    time.sleep(0.05)  # the driver buffers fill up meanwhile, more those of 0
+    cameras.start_group_streaming((0, 1), match="host")
+    for _ in range(10):
+        frames = cameras.capture_group((0, 1), timeout=1.)
+        assert frames is not None and len(frames) == 2
+    stats = cameras.get_group_stats((0, 1))
+    assert stats["matched"] == 10
+    assert max(stats["unmatched"].values()) <= 1  # just a different phase at the start
+    cameras.stop_group_streaming((0, 1))
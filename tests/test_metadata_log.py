@@ -0,0 +1,87 @@
+import json
+
+import numpy as np
+import pytest
+
+from metadata_log import MetadataLog, compact, read_log
+
+
+@pytest.mark.parametrize("background", [False, True])
+def test_append_and_read_back(tmp_path, background):
+    path = str(tmp_path / "series.jsonl")
+    with MetadataLog(path, background=background) as log:
+        log.append("series_001.png", mean=1.5, size=[4, 2])
+        log.append("series_002.png", mean=2.)
+        log.append("series_001.png", mean=3.)  # saved again
+    with MetadataLog(path) as log:  # appends to the existing log
+        log.append("series_003.png", mean=4.)
+    entries = read_log(path)
+    assert list(entries) == ["series_001.png", "series_002.png", "series_003.png"]
+    assert entries["series_001.png"] == {"mean": 3.}
+
+
+def test_truncated_last_line_is_skipped(tmp_path):
+    path = tmp_path / "series.jsonl"
+    with MetadataLog(str(path)) as log:
+        log.append("series_001.png", mean=1.)
+    with open(path, 'a') as log_file:
+        log_file.write('{"file": "series_002.png", "me')  # interrupted write
+    assert list(read_log(str(path))) == ["series_001.png"]
+
+
+def test_compact_keeps_the_old_entries(tmp_path):
+    path = tmp_path / "series.jsonl"
+    (tmp_path / "series.json").write_text(json.dumps({"series_000.png": {"mean": 0.},
+                                                      "series_001.png": {"mean": 0.}}))
+    with MetadataLog(str(path)) as log:
+        log.append("series_001.png", mean=1.)
+    with open(compact(str(path))) as json_file:
+        assert json.load(json_file) == {"series_000.png": {"mean": 0.},
+                                        "series_001.png": {"mean": 1.}}
+
+
+@pytest.mark.parametrize("background", [False, True])
+def test_failed_write_is_reported(tmp_path, background):
+    log = MetadataLog(str(tmp_path / "series.jsonl"), background=background)
+    log._file.close()  # as if the disk went away
+    if not background:
+        with pytest.raises(ValueError):
+            log.append("series_001.png", mean=1.)
+        return
+    log.append("series_001.png", mean=1.)
+    with pytest.raises(RuntimeError) as error:
+        log.flush()
+    assert isinstance(error.value.__cause__, ValueError)
+    with pytest.raises(RuntimeError):
+        log.close()
+
+
+def test_labview_save_and_load(tmp_path, monkeypatch, capsys):
+    pytest.importorskip("imageio")
+    pytest.importorskip("matplotlib")
+    import labview
+
+    image = np.arange(48, dtype=np.uint16).reshape(6, 8) * 50
+    try:
+        for i, frame_format in enumerate(["float32", "uint16"]):
+            filename = str(tmp_path / f"series_{i:03d}.png")
+            labview.save(image, filename, main_roi=(0, 0, 8, 4), ref_roi=(0, 4, 8, 6),
+                         frame_format=frame_format)
+            ref_mean = image[4:6].mean()
+            np.testing.assert_allclose(labview.load(filename), image[:4] / ref_mean,
+                                       rtol=1e-6)
+        labview.close_metadata_logs()
+        entries = read_log(str(tmp_path / "series.jsonl"))
+        assert [entry["format"] for entry in entries.values()] == ["float32", "uint16"]
+        assert entries["series_001.png"]["ref_mean"] == pytest.approx(image[4:6].mean())
+
+        def failing_append(self, name, **metadata):
+            raise OSError("disk full")
+
+        monkeypatch.setattr(labview.MetadataLog, "append", failing_append)
+        path = labview.save(image, str(tmp_path / "series_002.png"))
+        assert path.endswith("series_002.npy")
+        out = capsys.readouterr().out
+        assert "could not be saved" in out and "disk full" in out
+    finally:
+        labview.close_metadata_logs()
@@ -0,0 +1,95 @@
+import numpy as np
+import pytest
+
+import packed_formats
+from packed_formats import PACKED_FORMATS, decode, pack, packed_size, unpack
+
+WIDTH, HEIGHT = 48, 20
+
+
+def _random_image(pixel_format, seed=0):
+    depth = packed_formats.bit_depth(pixel_format)
+    rng = np.random.default_rng(seed)
+    image = rng.integers(0, 2 ** depth, (HEIGHT, WIDTH))
+    image[0, :4] = [0, 2 ** depth - 1, 1, 2 ** (depth - 1)]  # the extremes
+    return image.astype(np.uint8 if depth == 8 else np.uint16)
+
+
+def _random_raw(pixel_format, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, 256, packed_size(pixel_format, WIDTH, HEIGHT)).astype(np.uint8)
+
+
+def test_documented_layouts_are_unpacked():
+    # 10 bits: the 8 high bits of every pixel, then the 2 low bits of pixel k at 2k
+    raw = np.array([0xFF, 0x00, 0x00, 0x80, 0b00100111], np.uint8)
+    np.testing.assert_array_equal(unpack(raw, "Mono10g40IDS", 4, 1),
+                                  [[0x3FF, 0x001, 0x002, 0x200]])
+    # 12 bits: the 8 high bits of both pixels, then their 4 low bits
+    raw = np.array([0xAB, 0x12, 0x3C], np.uint8)
+    np.testing.assert_array_equal(unpack(raw, "Mono12g24IDS", 2, 1), [[0xABC, 0x123]])
+
+
+def test_documented_layouts_are_packed():
+    pixels = np.array([[0x3FF, 0x001, 0x002, 0x200]], np.uint16)
+    np.testing.assert_array_equal(pack(pixels, "Mono10g40IDS"),
+                                  [0xFF, 0x00, 0x00, 0x80, 0b00100111])
+    pixels = np.array([[0xABC, 0x123]], np.uint16)
+    np.testing.assert_array_equal(pack(pixels, "Mono12g24IDS"), [0xAB, 0x12, 0x3C])
+
+
+@pytest.mark.parametrize("pixel_format", list(PACKED_FORMATS))
+def test_round_trip_is_bit_exact(pixel_format):
+    image = _random_image(pixel_format)
+    raw = pack(image, pixel_format)
+    assert raw.dtype == np.uint8 and raw.size == packed_size(pixel_format, WIDTH, HEIGHT)
+    np.testing.assert_array_equal(unpack(raw, pixel_format, WIDTH, HEIGHT), image)
+
+    out = np.empty((HEIGHT, WIDTH), np.uint16)
+    assert unpack(raw, pixel_format, WIDTH, HEIGHT, out) is out
+    np.testing.assert_array_equal(out, image)
+    np.testing.assert_array_equal(pack(out, pixel_format, np.empty_like(raw)), raw)
+
+
+@pytest.mark.parametrize("pixel_format", list(PACKED_FORMATS))
+def test_unpacked_values_fit_the_bit_depth(pixel_format):
+    image = unpack(_random_raw(pixel_format), pixel_format, WIDTH, HEIGHT)
+    assert image.shape == (HEIGHT, WIDTH)
+    assert image.max() < 2 ** packed_formats.bit_depth(pixel_format)
+
+
+@pytest.mark.parametrize("pixel_format", ["Mono10g40IDS", "Mono12g24IDS"])
+def test_width_must_fill_the_groups(pixel_format):
+    with pytest.raises(ValueError):
+        packed_size(pixel_format, 6 if pixel_format.startswith("Mono10") else 5, 2)
+
+
+def test_unknown_format():
+    with pytest.raises(ValueError):
+        packed_formats.bit_depth("Mono16")
+
+
+@pytest.mark.parametrize("pixel_format", ["BayerGR8", "BayerGR12g24IDS", "Mono10g40IDS"])
+@pytest.mark.parametrize("colorness", ["RGB", "Mono", None])
+def test_threaded_decode_matches(pixel_format, colorness):
+    raw = _random_raw(pixel_format, seed=1)
+    single = decode(raw, pixel_format, WIDTH, HEIGHT, colorness)
+    np.testing.assert_array_equal(decode(raw, pixel_format, WIDTH, HEIGHT, colorness,
+                                         threads=2), single)
+
+
+def test_demosaic_of_a_flat_mosaic_is_flat():
+    mosaic = np.full((8, 8), 1000, np.uint16)
+    rgb = packed_formats.demosaic_bilinear(mosaic)
+    assert rgb.shape == (8, 8, 3) and rgb.dtype == np.uint16
+    assert (rgb == 1000).all()
+
+
+def test_raw_dump(tmp_path):
+    images = [_random_image("Mono12g24IDS", seed) for seed in range(3)]
+    path = tmp_path / "dump.raw"
+    path.write_bytes(b"".join(pack(image, "Mono12g24IDS").tobytes() for image in images))
+    frames = list(packed_formats.iter_raw_dump(path, "Mono12g24IDS", WIDTH, HEIGHT))
+    assert len(frames) == 3
+    for frame, image in zip(frames, images):
+        np.testing.assert_array_equal(frame.decode(), image)
@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+from preview import Preview, PreviewRenderer, make_lut
+from simulated_camera import SimulatedBackend
+
+
+def test_make_lut():
+    np.testing.assert_array_equal(make_lut(10)[[0, 4, 1023]], [0, 1, 255])
+    lut = make_lut(12, black=100, white=1100)
+    assert (lut[100], lut[600], lut[1100], lut[4095]) == (0, 128, 255, 255)
+
+
+def test_renderer_decimates_gray_to_rgb():
+    frame = np.arange(12 * 8, dtype=np.uint16).reshape(12, 8) * 10
+    renderer = PreviewRenderer(frame.shape, bit_depth=10, binning=3)
+    image = renderer.render(frame)
+    assert renderer.size == (3, 4) and image.shape == (4, 3, 3)
+    expected = (frame[::3, ::3] >> 2).astype(np.uint8)
+    for channel in range(3):
+        np.testing.assert_array_equal(image[:, :, channel], expected)
+
+
+@pytest.mark.parametrize("bit_rate", [8, 10, 12])
+def test_preview_uses_the_bit_depth_of_the_pixel_format(make_cameras, bit_rate):
+    backend = SimulatedBackend(max_fps=1000., width=64, height=48)
+    cameras = make_cameras(bit_rate, "Mono", backend=backend)
+    assert cameras.get_bit_depth(0) == bit_rate
+    cameras.set_exposure_time(100, 0)
+    cameras.start_acquisition(0)
+    preview = Preview(cameras, binning=2, display_fps=200)
+    try:
+        image = preview.next()
+        assert image is not None and image.max() == 255  # the full scale band
+        shift = bit_rate - 8
+        np.testing.assert_array_equal(image[:, :, 0],
+                                      (preview.frame[::2, ::2] >> shift).astype(np.uint8))
+        assert preview.next() is not None and preview.stats()["shown"] == 2
+    finally:
+        preview.close()
+    assert not cameras.is_streaming(0)
@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+from conftest import ReplayCameras
+from processing import CapturePipeline, image_stats
+
+
+def _replayed_pipeline(cameras, **kwargs):
+    pipeline = CapturePipeline(cameras, 0, **kwargs)
+    shape, dtype = cameras.get_frame_layout(0)
+    rng = np.random.default_rng(0)
+    frame = rng.integers(0, np.iinfo(dtype).max, shape, dtype=dtype, endpoint=True)
+    pipeline.cameras = ReplayCameras(cameras, frame)
+    return pipeline, frame
+
+
+@pytest.mark.parametrize("bit_rate", [8, 12])
+def test_software_flip_on_color_camera(make_cameras, bit_rate):
+    # Bayer sensors can't flip: the pipeline must do it, even on the whole frame
+    cameras = make_cameras(bit_rate, "Mono", color=True)
+    pipeline, frame = _replayed_pipeline(cameras, binning=1, flip=True,
+                                         dtype=cameras.get_frame_layout(0)[1])
+    assert not pipeline.sensor_flip
+    assert np.array_equal(pipeline.capture(), frame[::-1])
+
+
+def test_sensor_flip_on_mono_camera(make_cameras):
+    cameras = make_cameras(12, "Mono")
+    pipeline, frame = _replayed_pipeline(cameras, binning=1, flip=True)
+    assert pipeline.sensor_flip and cameras.get_reverse(0)[1]
+    assert np.array_equal(pipeline.capture(), frame)  # already flipped by the sensor
+
+
+@pytest.mark.parametrize("binning, crop", [(1, None), (2, None), (3, None),
+                                           (1, (10, 20, 100, 50)), (2, (3, 7, 40, 30)),
+                                           (1, (0, 400, 50, 200))])
+@pytest.mark.parametrize("color", [False, True])
+def test_pipeline_geometry(make_cameras, binning, crop, color):
+    cameras = make_cameras(12, "Mono", color=color)
+    pipeline, frame = _replayed_pipeline(cameras, binning=binning, crop=crop, flip=True)
+    if pipeline.sensor_flip:  # the sensor did it, on the full-resolution frame
+        frame = frame[::-1]
+    expected = frame[::binning, ::binning]
+    if crop is not None:
+        x, y, width, height = crop
+        expected = expected[y:y + height, x:x + width]
+    expected = expected[::-1].astype(np.uint16)
+    result = pipeline.capture()
+    assert result.dtype == np.uint16
+    assert np.array_equal(result, expected)
+
+
+@pytest.mark.parametrize("binning, crop", [(1, None), (2, None), (3, (3, 7, 40, 30))])
+@pytest.mark.parametrize("sensor_flip", [False, True])
+@pytest.mark.parametrize("flip", [False, True])
+def test_pipeline_while_acquiring_leaves_the_sensor(make_cameras, binning, crop,
+                                                    sensor_flip, flip, monkeypatch):
+    cameras = make_cameras(12, "Mono")
+    cameras.set_reverse(reverse_y=sensor_flip)
+    cameras.start_acquisition(0)
+
+    def set_reverse(*args, **kwargs):
+        raise AssertionError("It would restart the acquisition.")
+
+    monkeypatch.setattr(cameras, "set_reverse", set_reverse)
+    pipeline, frame = _replayed_pipeline(cameras, binning=binning, crop=crop, flip=flip)
+    assert pipeline.sensor_flip == sensor_flip == cameras.get_reverse(0)[1]
+    image = frame[::-1] if sensor_flip else frame  # as the scene is
+    expected = image[::binning, ::binning]
+    if crop is not None:
+        x, y, width, height = crop
+        expected = expected[y:y + height, x:x + width]
+    if flip:
+        expected = expected[::-1]
+    assert np.array_equal(pipeline.capture(), expected)
+    assert cameras.is_acquiring(0)
+
+
+def test_image_stats_of_a_crop():
+    image = np.arange(1000 * 300, dtype=np.uint16).reshape(1000, 300)
+    crop = image[10:900:3, 5:250]
+    mean, maximum, minimum = image_stats(crop, block_size=4096)
+    assert (maximum, minimum) == (crop.max(), crop.min())
+    assert mean == pytest.approx(crop.mean())
@@ -0,0 +1,157 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+import recorder
+from recorder import Recorder, load_recording
+
+SHAPE = (6, 8)
+
+
+def _frame(value):
+    return np.full(SHAPE, value, np.uint16)
+
+
+def _wait_written(rec, count, timeout=2.):
+    deadline = time.perf_counter() + timeout
+    while rec.stats()["written"] < count and time.perf_counter() < deadline:
+        time.sleep(0.001)
+
+
+@pytest.mark.parametrize("frame_format", Recorder.FRAME_FORMATS)
+def test_round_trip(tmp_path, frame_format):
+    path = str(tmp_path / "run")
+    with Recorder(path, SHAPE, np.uint16, max_frames=8, block=True, info={"user": "me"},
+                  settings={"fps": 10}, frame_format=frame_format) as rec:
+        for value in range(3):
+            assert rec.write(_frame(value * 1000), timestamp_ns=100 * value,
+                             frame_id=value + 5, host_time=float(value))
+        rec.update_settings(exposure=2000)
+        assert rec.write(_frame(4095), 300, 8, 3.)
+    frames, index, info = load_recording(path)
+    assert len(frames) == 4 and info["count"] == 4 and info["user"] == "me"
+    for value, frame in zip((0, 1000, 2000, 4095), frames):
+        assert frame.dtype == np.uint16 and (frame == value).all()
+    np.testing.assert_array_equal(index["seq"], range(4))
+    np.testing.assert_array_equal(index["timestamp_ns"], [0, 100, 200, 300])
+    np.testing.assert_array_equal(index["frame_id"], [5, 6, 7, 8])
+    np.testing.assert_array_equal(index["host_time"], [0., 1., 2., 3.])
+    assert [info["settings"][i] for i in index["settings"][[0, 3]]] == \
+        [{"fps": 10}, {"fps": 10, "exposure": 2000}]
+
+
+def test_full_queue_drops_and_blocks(tmp_path, monkeypatch):
+    writing = threading.Event()
+    release = threading.Event()
+    compress = recorder.compress
+
+    def slow_compress(frame, threads):
+        writing.set()
+        release.wait()
+        return compress(frame, threads)
+
+    monkeypatch.setattr(recorder, "compress", slow_compress)
+    rec = Recorder(str(tmp_path / "run"), SHAPE, np.uint16, max_frames=4, queue_size=2,
+                   frame_format="compressed")
+    assert rec.write(_frame(1)) and writing.wait(1.)
+    assert rec.write(_frame(2))
+    assert not rec.write(_frame(3))  # both slots in use
+    assert rec.stats()["dropped"] == 1 and rec.stats()["max_queued"] == 1
+
+    rec.block = True
+    threading.Timer(0.05, release.set).start()
+    assert rec.write(_frame(4))  # waits for the writer
+    assert rec.write(_frame(5))
+    assert not rec.write(_frame(6))  # max_frames
+    stats = rec.close()
+    assert stats["written"] == 4 and stats["overflow"] == 1
+    assert stats["blocked_time"] > 0.02
+    frames = load_recording(rec.path)[0]
+    assert [int(frame[0, 0]) for frame in frames] == [1, 2, 4, 5]
+
+
+def test_interrupted_recording(tmp_path):
+    rec = Recorder(str(tmp_path / "run"), SHAPE, np.uint16, max_frames=10)
+    for value in range(3):
+        rec.write(_frame(value))
+    _wait_written(rec, 3)
+    frames, index, info = load_recording(rec.path)  # before close()
+    assert info["count"] is None and len(frames) == len(index) == 3
+    assert (frames[2] == 2).all()
+    rec.close()
+    with pytest.raises(FileExistsError):
+        Recorder(rec.path, SHAPE, np.uint16, max_frames=10)
+
+
+def test_frames_written_while_closing_are_kept(tmp_path):
+    for run in range(20):
+        rec = Recorder(str(tmp_path / f"run{run}"), SHAPE, np.uint16, max_frames=10000,
+                       queue_size=4)
+        accepted = []
+        writing = threading.Event()
+
+        def write_loop():
+            while True:
+                writing.set()
+                if rec.write(_frame(len(accepted))):
+                    accepted.append(True)
+                elif rec._closed:
+                    break
+
+        thread = threading.Thread(target=write_loop)
+        thread.start()
+        writing.wait()
+        stats = rec.close()
+        thread.join()
+        assert stats["written"] == len(accepted) == load_recording(rec.path)[2]["count"]
+
+
+def test_packed12_needs_mono_uint16(tmp_path):
+    with pytest.raises(ValueError):
+        Recorder(str(tmp_path / "run"), SHAPE, np.uint8, 4, frame_format="packed12")
+
+
+def _feed(triggered, values):
+    for value in values:
+        triggered.write(_frame(value), timestamp_ns=value, frame_id=value)
+
+
+def test_triggered_keeps_pre_and_post_frames(tmp_path):
+    triggered = recorder.TriggeredRecorder(str(tmp_path), SHAPE, np.uint16, pre_frames=3,
+                                           post_frames=2)
+    _feed(triggered, range(10))
+    triggered.trigger()
+    _feed(triggered, range(10, 13))  # 10 triggers, 11 completes, 12 is missed
+    assert triggered.wait(2.)
+    stats = triggered.close()
+    assert stats["events"] == 1 and stats["state"] == "done" and stats["missed"] == 1
+    frames, index, info = load_recording(triggered.events[0])
+    assert [int(frame[0, 0]) for frame in frames] == [7, 8, 9, 10, 11]
+    np.testing.assert_array_equal(index["frame_id"], [7, 8, 9, 10, 11])
+    assert info["trigger_index"] == 3 and info["trigger_source"] == "software"
+
+
+def test_triggered_by_threshold_and_rearmed(tmp_path):
+    triggered = recorder.TriggeredRecorder(str(tmp_path), SHAPE, np.uint16, pre_frames=2,
+                                           post_frames=1, condition=recorder.mean_above(100),
+                                           rearm=True)
+    _feed(triggered, [0, 10, 20, 200])  # first event: 10, 20 and the trigger 200
+    assert triggered.wait(2.)
+    _feed(triggered, [30, 150])  # second one: only the frames since rearmed
+    assert triggered.wait(2.)
+    _feed(triggered, [100])  # not above
+    triggered.close()
+    events = [[int(frame[0, 0]) for frame in load_recording(path)[0]]
+              for path in triggered.events]
+    assert events == [[10, 20, 200], [30, 150]]
+    assert load_recording(triggered.events[1])[2]["trigger_index"] == 1
+
+
+def test_mean_above_roi():
+    frame = np.zeros(SHAPE, np.uint16)
+    frame[:2, :2] = 1000
+    assert not recorder.mean_above(100)(frame)
+    assert recorder.mean_above(100, roi=(0, 0, 2, 2))(frame)
+    assert not recorder.mean_above(100, roi=(2, 2, 2, 2))(frame)
@@ -0,0 +1,98 @@
+import numpy as np
+import pytest
+
+from ring_buffer import FrameRingBuffer, SharedFrameRingBuffer
+
+
+def _frame(value):
+    return np.full((4, 6), value, np.uint16)
+
+
+def test_needs_two_slots():
+    with pytest.raises(ValueError):
+        FrameRingBuffer(1, (4, 6), np.uint16)
+
+
+def test_push_get_and_metadata():
+    ring = FrameRingBuffer(4, (4, 6), np.uint16)
+    assert ring.latest() == (None, None)
+    for value in range(3):
+        assert ring.push(_frame(value), timestamp_ns=100 * value, frame_id=value + 10,
+                         host_time=float(value)) == value
+    seq, frame = ring.latest()
+    assert seq == 2 and (frame == 2).all()
+    assert (ring.get(0) == 0).all()
+    assert ring.get(3) is None
+    assert ring.metadata(1) == (100, 11, 1.)
+
+
+def test_overwritten_frames():
+    ring = FrameRingBuffer(3, (4, 6), np.uint16)
+    for value in range(7):
+        ring.push(_frame(value))
+    assert ring.get(3) is None  # overwritten
+    assert ring.pending() == 7
+    seq, frame = ring.next()
+    assert seq == 5 and (frame == 5).all()  # oldest slot not being written
+    assert ring.overwritten == 5
+    assert ring.next()[0] == 6
+    assert ring.next() == (None, None)
+
+
+def test_slot_being_written_is_not_read():
+    ring = FrameRingBuffer(2, (4, 6), np.uint16)
+    ring.push(_frame(1))
+    ring.push(_frame(2))
+    slot = ring.begin_write()  # seq 2 goes over seq 0
+    slot[:] = 3
+    assert ring.get(0) is None
+    assert ring.latest()[0] == 1
+    assert ring.commit() == 2
+    seq, frame = ring.latest()
+    assert seq == 2 and (frame == 3).all()
+
+
+def test_next_with_out_and_timeout():
+    ring = FrameRingBuffer(4, (4, 6), np.uint16)
+    out = np.empty((4, 6), np.uint16)
+    assert ring.next(timeout=0.01, out=out) == (None, None)
+    ring.push(_frame(9))
+    seq, frame = ring.next(out=out)
+    assert seq == 0 and frame is out and (out == 9).all()
+
+
+def test_shared_ring_between_producer_and_consumer():
+    producer = SharedFrameRingBuffer("ids_test_ring", 4, (4, 6), np.uint16)
+    try:
+        producer.push(_frame(1))
+        consumer = SharedFrameRingBuffer("ids_test_ring")
+        assert (consumer.size, consumer.shape, consumer.dtype) == (4, (4, 6), np.uint16)
+        assert consumer.next() == (None, None)  # only the frames written after attaching
+        producer.push(_frame(2), frame_id=5)
+        seq, frame = consumer.next()
+        assert seq == 1 and (frame == 2).all()
+        assert consumer.metadata(1)[1] == 5
+        seq, view = consumer.latest_view()
+        assert seq == 1 and (view == 2).all()
+        consumer.close()
+        consumer.close()  # twice is harmless
+    finally:
+        producer.close()
+        producer.unlink()
+
+
+def test_every_cursor_reads_all_the_frames():
+    ring = FrameRingBuffer(4, (4, 6), np.uint16)
+    ring.push(_frame(0))
+    first, second = ring.cursor(), ring.cursor(start=0)
+    for value in range(1, 3):
+        ring.push(_frame(value))
+    assert [first.next()[0] for _ in range(3)] == [1, 2, None]
+    assert ring.next()[0] == 0  # next() keeps its own position
+    seq, frame = second.next()
+    assert seq == 0 and (frame == 0).all()
+    for value in range(3, 8):
+        ring.push(_frame(value))
+    assert second.pending() == 7
+    assert second.next()[0] == 5 and second.overwritten == 4
+    assert first.pending() == 5 and ring.overwritten == 0  # not read since
@@ -0,0 +1,125 @@
+import pytest
+
+from interface import _NodeCache
+from simulated_camera import NotFoundException, SimulatedBackend, SimulatedCamera
+
+
+class _CountingNodeMap(object):
+    def __init__(self, nodemap):
+        self.nodemap = nodemap
+        self.found = []
+
+    def FindNode(self, name):
+        self.found.append(name)
+        return self.nodemap.FindNode(name)
+
+
+def _camera_and_cameras(make_cameras, **camera_kwargs):
+    camera = SimulatedCamera(width=64, height=48, max_fps=2000., **camera_kwargs)
+    cameras = make_cameras(8, "Mono", backend=SimulatedBackend(cameras=[camera]))
+    return camera, cameras
+
+
+def test_node_cache_finds_every_node_once():
+    camera = SimulatedCamera()
+    nodemap = _CountingNodeMap(camera._build_nodemap())
+    cache = _NodeCache(nodemap, NotFoundException)
+    for _ in range(3):
+        cache.set_value("Gain", 2.)
+        assert cache.value("Gain") == 2.
+        with pytest.raises(NotFoundException):
+            cache.FindNode("NoSuchNode")
+    assert nodemap.found == ["Gain", "NoSuchNode"]
+    cache.prefetch(["ExposureTime", "NoSuchNode"])
+    cache.invalidate()
+    cache.value("Gain")
+    assert nodemap.found == ["Gain", "NoSuchNode", "ExposureTime", "Gain"]
+
+
+def test_node_cache_limits_until_forgotten():
+    camera = SimulatedCamera(max_fps=2000.)
+    cache = _NodeCache(camera._build_nodemap(), NotFoundException)
+    camera.exposure = 10000.
+    assert cache.limits("AcquisitionFrameRate")[1] == pytest.approx(100.)
+    camera.exposure = 1000.
+    assert cache.limits("AcquisitionFrameRate")[1] == pytest.approx(100.)  # cached
+    cache.forget_limits(["AcquisitionFrameRate"])
+    assert cache.limits("AcquisitionFrameRate")[1] == pytest.approx(1000.)
+
+
+def test_exposure_refreshes_the_fps_limits(make_cameras):
+    camera, cameras = _camera_and_cameras(make_cameras)
+    cameras.set_exposure_time(10000, 0)
+    cameras.set_fps(50, 0)  # the fps limits are cached now: up to 100
+    cameras.set_exposure_time(1000, 0)
+    cameras.set_fps(500, 0)
+    assert camera.fps == cameras.get_fps(0) == 500
+
+
+def test_fps_refreshes_the_exposure_limits(make_cameras):
+    camera, cameras = _camera_and_cameras(make_cameras)
+    cameras.set_fps(1000, 0)
+    cameras.set_exposure_time(500, 0)  # the exposure limits are cached now: up to 1 ms
+    cameras.set_fps(10, 0)
+    cameras.set_exposure_time(50000, 0)
+    assert camera.exposure == cameras.get_exposure_time(0) == 50000
+
+
+def test_values_out_of_range_are_clipped(make_cameras):
+    camera, cameras = _camera_and_cameras(make_cameras)
+    cameras.set_fps(100, 0)
+    cameras.set_exposure_time(1e6, 0)
+    assert camera.exposure == pytest.approx(10000)
+    cameras.set_exposure_time(1, 0)
+    assert camera.exposure == SimulatedCamera.MIN_EXPOSURE
+    cameras.set_max_fps(0)
+    assert camera.fps == pytest.approx(min(1e6 / camera.exposure, 1 / camera.readout_time()))
+
+
+@pytest.mark.parametrize("start, target", [((100, 10000), (1000, 500)),  # exposure first
+                                           ((1000, 500), (50, 15000))])  # fps first
+def test_apply_settings_never_clips_one_by_the_other(make_cameras, start, target):
+    camera, cameras = _camera_and_cameras(make_cameras)
+    cameras.apply_settings(0, fps=start[0], exposure=start[1])
+    assert (camera.fps, camera.exposure) == start
+    settings = cameras.apply_settings(0, fps=target[0], exposure=target[1], gain=2.)
+    assert (camera.fps, camera.exposure, camera.gain) == target + (2.,)
+    assert (settings["fps"], settings["exposure"], settings["gain"]) == target + (2.,)
+
+
+def test_apply_settings_with_roi_and_binning(make_cameras):
+    camera, cameras = _camera_and_cameras(make_cameras)
+    cameras.set_binning(2)
+    # the half ROI reads out twice as fast: the fps only fits after the ROI
+    settings = cameras.apply_settings(0, roi=(8, 4, 16, 12), fps=7000, exposure=100)
+    assert (camera.binning_h, camera.binning_v) == (2, 2)
+    assert (camera.offset_x, camera.offset_y, camera.width, camera.height) == (8, 4, 16, 12)
+    assert settings["roi"] == (8, 4, 16, 12)
+    assert camera.fps == settings["fps"] == 7000 and camera.exposure == 100
+    assert cameras.get_frame_layout(0)[0] == (12, 16)
+
+
+def test_apply_settings_fps_wins(make_cameras):
+    camera, cameras = _camera_and_cameras(make_cameras)
+    settings = cameras.apply_settings(0, fps=200, exposure=20000)
+    assert settings["fps"] == 200 and settings["exposure"] == 5000
+    cameras.apply_settings(0, exposure=1000, max_fps=True)
+    assert camera.fps == 1000
+
+
+def test_apply_settings_partial_failure(make_cameras, monkeypatch):
+    camera, cameras = _camera_and_cameras(make_cameras)
+    cameras.apply_settings(0, fps=100, exposure=1000, gain=1.)
+    cameras.start_acquisition(0)
+    assert cameras.capture_frame(0).exposure == 1000
+
+    def broken(value):
+        raise NotFoundException("Gain is gone.")
+
+    monkeypatch.setattr(cameras._get_nodemap(0).FindNode("Gain"), "SetValue", broken)
+    with pytest.raises(RuntimeError) as error:
+        cameras.apply_settings(0, fps=50, exposure=2000, gain=4.)
+    assert isinstance(error.value.__cause__, NotFoundException)
+    assert "'exposure': 2000" in str(error.value)
+    assert (camera.fps, camera.exposure, camera.gain) == (50, 2000, 1.)
+    assert cameras.capture_frame(0).exposure == 2000  # not the one before the failure
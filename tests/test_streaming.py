@@ -0,0 +1,151 @@
+import time
+
+import numpy as np
+import pytest
+
+from simulated_camera import SimulatedBackend
+
+
+def _acquiring(make_cameras, **kwargs):
+    backend = SimulatedBackend(max_fps=2000., width=64, height=48)
+    cameras = make_cameras(8, "Mono", backend=backend, **kwargs)
+    cameras.set_exposure_time(100, 0)
+    cameras.set_max_fps(0)
+    cameras.start_acquisition(0)
+    return cameras, backend
+
+
+def test_start_stop_streaming_leaves_no_pending_abort(make_cameras):
+    cameras, _ = _acquiring(make_cameras)
+    for _ in range(30):
+        cameras.start_streaming(0, ring_size=4)
+        cameras.stop_streaming(0)
+        assert cameras.capture(0).shape == (48, 64)
+
+
+def test_stale_kill_wait_is_absorbed(make_cameras):
+    cameras, backend = _acquiring(make_cameras)
+    backend.cameras[0].datastream.KillWait()  # nobody waiting: it stays pending
+    assert cameras.capture(0).shape == (48, 64)
+    out = np.empty((48, 64), np.uint8)
+    assert cameras.capture_into(out, 0) is out
+
+
+def test_grabber_fills_the_ring(make_cameras):
+    cameras, _ = _acquiring(make_cameras)
+    ring = cameras.start_streaming(0, ring_size=8)
+    sunk = []
+    cameras.add_stream_sink(lambda frame, timestamp_ns, frame_id, host_time:
+                            sunk.append(frame_id), 0)
+    frame = cameras.get_next_frame(0, timeout=2.)
+    assert frame is not None and frame.shape == (48, 64)
+    deadline = time.perf_counter() + 2.
+    while ring.write_count < 20 and time.perf_counter() < deadline:
+        time.sleep(0.01)
+    cameras.stop_streaming(0)
+    assert ring.write_count >= 20
+    assert sunk == sorted(sunk) and len(sunk) >= 19
+
+
+def test_stop_streaming_is_prompt(make_cameras):
+    cameras, _ = _acquiring(make_cameras)
+    cameras.set_fps(1, 0)  # the grabber waits for frames most of the time
+    cameras.start_streaming(0, timeout_ms=5000)
+    time.sleep(0.05)
+    start = time.perf_counter()
+    cameras.stop_streaming(0)
+    assert time.perf_counter() - start < 0.5
+
+
+@pytest.mark.parametrize("raw", [False, True])
+def test_streaming_raw_and_converted(make_cameras, raw):
+    cameras, _ = _acquiring(make_cameras)
+    cameras.start_streaming(0, ring_size=4, raw=raw)
+    frame = cameras.get_next_frame(0, timeout=2.)
+    cameras.stop_streaming(0)
+    assert frame is not None
+
+
+def test_roi_change_keeps_streaming(make_cameras):
+    cameras, _ = _acquiring(make_cameras)
+    ring = cameras.start_streaming(0, ring_size=4)
+    sunk = []
+    cameras.add_stream_sink(lambda frame, *metadata: sunk.append(frame.shape), 0)
+    assert cameras.get_next_frame(0, timeout=2.).shape == (48, 64)
+
+    x, y, width, height = cameras.set_roi(0, 0, 32, 24, idx=0)
+    assert cameras.is_streaming(0)
+    new_ring = cameras.get_stream_ring(0)
+    assert new_ring is not ring and new_ring.size == 4
+    assert new_ring.shape == (height, width) == (24, 32)
+    assert cameras.get_next_frame(0, timeout=2.).shape == (24, 32)
+    assert sunk[-1] == (24, 32)  # the sinks are kept
+
+    cameras.set_reverse(reverse_y=True, idx=0)  # same layout, same ring
+    assert cameras.get_stream_ring(0) is new_ring
+    assert cameras.get_next_frame(0, timeout=2.) is not None
+    cameras.stop_streaming(0)
+
+
+def test_layout_change_while_recording_raises(make_cameras, tmp_path):
+    cameras, _ = _acquiring(make_cameras)
+    cameras.start_recording(str(tmp_path / "rec"), max_frames=1000, idx=0)
+    with pytest.raises(RuntimeError):
+        cameras.set_roi(0, 0, 32, 24, idx=0)
+    cameras.set_trigger("off", idx=0)  # keeps the layout: the recording goes on
+    assert cameras.is_streaming(0)
+    written = cameras.get_recording_stats(0)["written"]
+    time.sleep(0.1)
+    stats = cameras.stop_recording(0)
+    assert stats["written"] > written
+    assert cameras.get_roi(0)[2:] == (64, 48)
+    cameras.stop_streaming(0)
+
+
+def _band(image):
+    """ Columns of the full-scale band the simulated camera draws at frame_id * 4. """
+    return list(np.flatnonzero((image == image.max()).all(axis=0)))
+
+
+def test_capture_frame_metadata(make_cameras):
+    cameras, _ = _acquiring(make_cameras)
+    cameras.set_fps(500, 0)
+    frames = []
+    for _ in range(10):
+        before = time.perf_counter()
+        frame = cameras.capture_frame(0)
+        frames.append(frame)
+        assert before <= frame.host_time <= time.perf_counter()
+        assert frame.timestamp_ns <= frame.host_time * 1e9  # exposed before received
+        assert _band(frame.image) == [(frame.frame_id * 4 + i) % 64 for i in range(4)]
+        assert (frame.exposure, frame.incomplete) == (100, False)
+    frame_ids = np.array([frame.frame_id for frame in frames])
+    timestamps = np.array([frame.timestamp_ns for frame in frames])
+    assert (np.diff(frame_ids) > 0).all()
+    np.testing.assert_allclose(np.diff(timestamps), np.diff(frame_ids) * 2e6, atol=1e3)
+
+
+def test_ring_metadata_matches_the_pushed_frames(make_cameras):
+    cameras, _ = _acquiring(make_cameras)
+    cameras.set_fps(500, 0)
+    ring = cameras.start_streaming(0, ring_size=64)
+    cursor = ring.cursor(start=0)
+    sunk = []
+    cameras.add_stream_sink(lambda frame, *metadata: sunk.append((frame.copy(), metadata)), 0)
+    deadline = time.perf_counter() + 2.
+    while ring.write_count < 30 and time.perf_counter() < deadline:
+        time.sleep(0.01)
+    cameras.stop_streaming(0)
+    assert ring.write_count == len(sunk) >= 30
+
+    for seq, (image, (timestamp_ns, frame_id, host_time)) in enumerate(sunk):
+        assert ring.metadata(seq) == (timestamp_ns, frame_id, host_time)
+        np.testing.assert_array_equal(ring.get(seq), image)
+        assert _band(image) == [(frame_id * 4 + i) % 64 for i in range(4)]
+        assert timestamp_ns <= host_time * 1e9
+        read_seq, frame = cursor.next()
+        assert read_seq == seq
+        np.testing.assert_array_equal(frame, image)
+    frame_ids = [metadata[1] for _, metadata in sunk]
+    assert frame_ids == sorted(frame_ids)
+    assert ring.latest()[0] == len(sunk) - 1
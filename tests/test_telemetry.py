@@ -0,0 +1,102 @@
+import gc
+import json
+import threading
+import weakref
+
+import pytest
+
+from interface import IDSinterface
+from simulated_camera import SimulatedBackend
+from telemetry import LatencyHistogram, TelemetryExporter, to_prometheus
+
+
+@pytest.mark.parametrize("seconds", [3e-9, 17e-9, 1e-6, 123.4e-6, 0.5, 60.])
+def test_bucket_within_a_sixteenth(seconds):
+    histogram = LatencyHistogram()
+    histogram.record(seconds)
+    index = LatencyHistogram._index(int(seconds * 1e9))
+    assert histogram.counts[index] == 1
+    assert abs(LatencyHistogram._value(index) - seconds) <= seconds / 16
+    assert histogram.percentile(50) == seconds  # clamped to the exact min and max
+
+
+def test_buckets_are_monotonic():
+    indices = [LatencyHistogram._index(ns) for ns in range(0, 5000)]
+    assert indices == sorted(indices) and indices[15] == 15  # exact below 16 ns
+    assert LatencyHistogram._index(2 ** 50) == len(LatencyHistogram().counts) - 1
+
+
+def test_percentiles_and_summary():
+    histogram = LatencyHistogram()
+    for us in range(1, 101):
+        histogram.record(us * 1e-6)
+    summary = histogram.summary()
+    assert summary["count"] == 100 and summary["min"] == 1e-6 and summary["max"] == 100 * 1e-6
+    assert summary["mean"] == pytest.approx(50.5e-6)
+    assert summary["p50"] == pytest.approx(50e-6, rel=1 / 16)
+    assert summary["p99"] == pytest.approx(99e-6, rel=1 / 16)
+    assert LatencyHistogram().percentile(50) is None
+
+
+def _stats():
+    histogram = LatencyHistogram()
+    histogram.record(0.001)
+    return {0: {"fps": 50., "stages": {"wait": histogram.summary()},
+                "frames": {"received": 10, "lost": 1, "incomplete": 0},
+                "buffers": {"queued": 3, "await_delivery": None, "underruns": 0,
+                            "lost": 0}}}
+
+
+def test_to_prometheus():
+    lines = to_prometheus(_stats()).splitlines()
+    assert lines[0] == "# TYPE ids_stage_latency_seconds summary"
+    assert 'ids_stage_latency_seconds{device="0",stage="wait",quantile="0.5"} 0.001' in lines
+    assert 'ids_stage_latency_seconds_count{device="0",stage="wait"} 1' in lines
+    assert 'ids_fps{device="0"} 50' in lines
+    assert 'ids_frames_lost_total{device="0"} 1' in lines
+    assert "# TYPE ids_buffers_await_delivery gauge" in lines
+    assert not any(line.startswith("ids_buffers_await_delivery{") for line in lines)
+
+
+@pytest.mark.parametrize("export_format", ["jsonl", "prometheus"])
+def test_exporter(tmp_path, export_format):
+    path = str(tmp_path / "stats")
+    exporter = TelemetryExporter(path, _stats, interval=0.01, export_format=export_format)
+    exporter.close()
+    with open(path) as export_file:
+        text = export_file.read()
+    if export_format == "jsonl":
+        lines = text.splitlines()
+        assert lines and json.loads(lines[-1])["devices"]["0"]["fps"] == 50.
+    else:
+        assert text == to_prometheus(_stats())
+    with pytest.raises(ValueError):
+        TelemetryExporter(path, _stats, export_format="csv")
+
+
+def _exporters():
+    return [t for t in threading.enumerate() if t.name == "IDStelemetry"]
+
+
+def test_exporter_does_not_keep_the_interface_alive(tmp_path):
+    cameras = IDSinterface(backend=SimulatedBackend())
+    cameras.set_pixel_format(8, colorness="Mono")
+    cameras.select_device(0)
+    cameras.enable_telemetry(0, export_path=str(tmp_path / "stats.jsonl"), interval=0.01)
+    assert len(_exporters()) == 1
+    alive = weakref.ref(cameras)
+    del cameras
+    gc.collect()
+    assert alive() is None
+    for thread in _exporters():
+        thread.join(1.)
+    assert not _exporters()
+
+
+def test_release_device_stops_the_exporter(make_cameras, tmp_path):
+    cameras = make_cameras()
+    cameras.enable_telemetry(0, export_path=str(tmp_path / "stats.prom"),
+                             export_format="prometheus", interval=0.01)
+    cameras.release_device(0)
+    assert not _exporters()
+    assert (tmp_path / "stats.prom").read_text().startswith("# TYPE")
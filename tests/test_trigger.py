@@ -0,0 +1,77 @@
+import threading
+
+import numpy as np
+import pytest
+
+from simulated_camera import SimulatedBackend
+
+
+def _acquiring(make_cameras):
+    backend = SimulatedBackend(max_fps=1000., width=64, height=48)
+    cameras = make_cameras(8, "Mono", backend=backend)
+    cameras.set_exposure_time(1000, 0)
+    cameras.start_acquisition(0)
+    return cameras, backend.cameras[0]
+
+
+def test_software_triggered_burst(make_cameras):
+    cameras, camera = _acquiring(make_cameras)
+    with pytest.raises(RuntimeError):
+        cameras.send_trigger(0)  # free running
+    cameras.set_trigger("software", idx=0)
+    assert cameras.get_trigger(0) == "software"
+    assert (camera.trigger_mode, camera.trigger_source) == ("On", "Software")
+
+    frames = cameras.capture_burst(5, idx=0)
+    assert frames.shape == (5, 48, 64) and frames.dtype == np.uint8
+    stats = cameras.get_trigger_stats(0)
+    assert (stats["triggers"], stats["bursts"], stats["frames"], stats["timeouts"]) == \
+        (5, 1, 5, 0)
+    assert stats["latency"]["count"] == 5
+    assert stats["latency"]["min"] >= 1e-3  # the exposure at least
+    assert stats["interval"]["count"] == 4 and stats["interval"]["min"] >= 1e-3
+    assert stats["jitter"] is not None
+
+    cameras.reset_trigger_stats(0)
+    assert cameras.get_trigger_stats(0)["frames"] == 0
+
+
+def test_line_trigger(make_cameras):
+    cameras, camera = _acquiring(make_cameras)
+    cameras.set_trigger("line", line=0, activation="FallingEdge", idx=0)
+    assert (camera.trigger_source, camera.trigger_activation) == ("Line0", "FallingEdge")
+    with pytest.raises(RuntimeError):  # no edge on the line
+        cameras.capture_burst(1, idx=0, timeout=0.1)
+    assert cameras.get_trigger_stats(0)["timeouts"] == 1
+
+    timer = threading.Timer(0.05, camera.fire, args=("Line0",))
+    timer.start()
+    out = np.empty((1, 48, 64), np.uint8)
+    assert cameras.capture_burst(1, idx=0, out=out, timeout=1.) is out
+    timer.join()
+    assert cameras.get_trigger_stats(0)["latency"]["count"] == 0  # not sent by us
+
+
+def test_trigger_off_runs_free_again(make_cameras):
+    cameras, camera = _acquiring(make_cameras)
+    with pytest.raises(ValueError):
+        cameras.set_trigger("hardware", idx=0)
+    cameras.set_trigger("software", idx=0)
+    cameras.set_trigger("off", idx=0)
+    assert camera.trigger_mode == "Off"
+    assert cameras.capture_burst(3, idx=0).shape == (3, 48, 64)
+    assert cameras.get_trigger_stats(0)["triggers"] == 0
+
+
+def test_trigger_change_while_streaming(make_cameras):
+    cameras, _ = _acquiring(make_cameras)
+    cameras.start_streaming(0, ring_size=4)
+    cameras.set_trigger("software", idx=0)
+    assert cameras.is_streaming(0)
+    while cameras.get_next_frame(0) is not None:  # frames from before
+        pass
+    cameras.send_trigger(0)
+    assert cameras.get_next_frame(0, timeout=1.) is not None
+    cameras.set_trigger("off", idx=0)
+    assert cameras.is_streaming(0)
+    cameras.stop_streaming(0)